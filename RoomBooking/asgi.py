@@ -9,8 +9,15 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "RoomBooking.settings")
 
 application = get_asgi_application()
+
+if settings.BOT_WEBHOOK_URL:
+    # Telegram delivers bot updates to this application instead of the bot polling for them
+    from bot.webhook import TelegramWebhookApplication
+
+    application = TelegramWebhookApplication(application)
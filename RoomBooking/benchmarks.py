@@ -0,0 +1,148 @@
+import asyncio
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+import httpx
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def summarize(latencies: list, seconds: float, queries: int = None, errors: int = 0) -> dict:
+    """Latency percentiles in milliseconds, calls a second and queries per call of a measured operation"""
+    latencies = sorted(latencies)
+    count = len(latencies)
+
+    def percentile(p: int) -> float:
+        return round(latencies[min(count * p // 100, count - 1)] * 1000, 3) if count else 0.0
+
+    summary = {
+        'count': count,
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99),
+        'max_ms': round(latencies[-1] * 1000, 3) if count else 0.0,
+        'throughput_per_second': round(count / seconds, 1) if seconds else 0.0,
+    }
+    if queries is not None:
+        summary['queries_per_call'] = round(queries / count, 2) if count else 0.0
+    if errors:
+        summary['errors'] = errors
+    return summary
+
+
+def measure(function, repeat: int, warmup: int = 3) -> dict:
+    """Calls `function` `repeat` times one after another, counting queries it runs on the default database"""
+    for _ in range(warmup):
+        function()
+    latencies = []
+    with CaptureQueriesContext(connection) as context:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            call_started = time.perf_counter()
+            function()
+            latencies.append(time.perf_counter() - call_started)
+        seconds = time.perf_counter() - started
+    return summarize(latencies, seconds, queries=len(context.captured_queries))
+
+
+def get_revision() -> str:
+    # Commit the code being measured comes from, so results of different commits can be told apart
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=Path(__file__).resolve().parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    # Headers and body are written separately, with Nagle's algorithm the body waits 40 ms for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadedWSGIServer):
+    # Default backlog of 5 drops connections of a burst of clients, which then retry a second later
+    request_queue_size = 128
+
+
+class LocalServer:
+    """
+    The project served over HTTP from a thread of this process, like LiveServerTestCase does, counting queries
+    run by every request. Each request is handled in a thread of its own, which connects to the database anew,
+    the way runserver works.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self._server.server_port}'
+
+    def start(self) -> None:
+        self._server = _Server(('127.0.0.1', 0), _QuietRequestHandler)
+        self._server.set_app(self._count_queries(WSGIHandler()))
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count_queries(self, application):
+        def counting_application(environ, start_response):
+            def count(execute, sql, params, many, context):
+                with self._lock:
+                    self.queries += 1
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(count):
+                # Streamed responses run their queries while being read, so they are read here
+                response = application(environ, start_response)
+                try:
+                    return [b''.join(response)]
+                finally:
+                    response.close()
+
+        return counting_application
+
+
+async def run_http_load(base_url: str, requests: list, concurrency: int, headers: dict = None) -> tuple:
+    """
+    Sends `requests`, a list of (method, path, json body or None), from `concurrency` clients at once.
+    Returns latencies in seconds, seconds it all took and the number of error responses.
+    """
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for request in requests:
+        queue.put_nowait(request)
+
+    async def client(session: httpx.AsyncClient):
+        nonlocal errors
+        while not queue.empty():
+            method, path, body = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                response = await session.request(method, path, json=body)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=30) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+        seconds = time.perf_counter() - started
+    return latencies, seconds, errors
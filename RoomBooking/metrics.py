@@ -0,0 +1,304 @@
+import contextvars
+import ipaddress
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
+
+from RoomBooking.query_capture import QueryCapture, query_reports
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERIES_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+# Name, help and buckets of every histogram kept for a path
+HISTOGRAMS = (
+    ('seconds', "Wall time of API requests and bot updates", SECONDS_BUCKETS),
+    ('db_queries', "Database queries of sampled API requests and bot updates", QUERIES_BUCKETS),
+    ('db_seconds', "Time spent in database queries by sampled API requests and bot updates", SECONDS_BUCKETS),
+    ('serializer_seconds', "Time spent in serializers by sampled API requests", SECONDS_BUCKETS),
+)
+METRIC_PREFIX = 'roombooking_request_'
+
+_current_sample = contextvars.ContextVar('metrics_sample', default=None)
+
+
+class Histogram:
+    """Counts of observations in cumulative buckets, the way Prometheus histograms are exposed"""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self) -> list:
+        counts, total = [], 0
+        for count in self.counts:
+            total += count
+            counts.append(total)
+        return counts
+
+    def quantile(self, q: float) -> float:
+        """Estimated like histogram_quantile() of Prometheus, linearly within the bucket holding the quantile"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        lower, seen = 0.0, 0
+        for upper, count in zip(self.buckets, self.counts):
+            if count and seen + count >= rank:
+                return lower + (upper - lower) * (rank - seen) / count
+            lower, seen = upper, seen + count
+        # Past the last bucket nothing better than its bound is known
+        return self.buckets[-1]
+
+
+class Sample:
+    """What a single sampled request or update spent, gathered while it runs, with its statements if captured"""
+    __slots__ = ('queries', 'db_seconds', 'serializer_seconds', 'serializer_depth', 'capture')
+
+    def __init__(self, capture: QueryCapture = None):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.serializer_depth = 0
+        self.capture = capture
+
+
+class MetricsRegistry:
+    """
+    In-process histograms of API requests (by DRF action) and bot updates (by conversation state).
+
+    Wall time is recorded for everything. Queries, database time and serializer time only for a share of
+    METRICS_SAMPLE_RATE, so measuring them costs next to nothing on average. Statements of a share of
+    QUERY_CAPTURE_SAMPLE_RATE are also fingerprinted to find N+1 and slow queries, see QueryCapture.
+    """
+
+    def __init__(self):
+        self._paths = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def record(self, kind: str, path: str):
+        sample = self.new_sample()
+        token = _current_sample.set(sample)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            _current_sample.reset(token)
+            self.finish(kind, path, started, sample)
+
+    def new_sample(self):
+        """Sample to gather what a request or update spends in, None when this one is not sampled"""
+        capture = QueryCapture() if random.random() < getattr(settings, 'QUERY_CAPTURE_SAMPLE_RATE', 0.01) else None
+        if capture is None and random.random() >= getattr(settings, 'METRICS_SAMPLE_RATE', 0.1):
+            return None
+        # Connections opened before this module was imported were missed by connection_created
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(None, connection)
+        return Sample(capture)
+
+    def finish(self, kind: str, path, started: float, sample: Sample = None) -> None:
+        """Records a request or update started at `started` (perf_counter), `path` may be a callable giving it"""
+        seconds = time.perf_counter() - started
+        if callable(path):
+            path = path()
+        self.observe(kind, path, seconds, sample)
+        if sample is not None and sample.capture is not None:
+            sample.capture.finish(kind, path)
+
+    def measure_stream(self, kind: str, path, started: float, sample: Sample, chunks):
+        """
+        Chunks of a streamed response, recorded once the last of them is sent or the client goes away. Queries
+        run to produce them count towards the sample
+        """
+        iterator = iter(chunks)
+        try:
+            while True:
+                token = _current_sample.set(sample)
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    _current_sample.reset(token)
+                yield chunk
+        finally:
+            self.finish(kind, path, started, sample)
+
+    def observe(self, kind: str, path: str, seconds: float, sample: Sample = None) -> None:
+        with self._lock:
+            histograms = self._paths.get((kind, path))
+            if histograms is None:
+                histograms = self._paths[kind, path] = {name: Histogram(buckets) for name, _, buckets in HISTOGRAMS}
+            histograms['seconds'].observe(seconds)
+            if sample is not None:
+                histograms['db_queries'].observe(sample.queries)
+                histograms['db_seconds'].observe(sample.db_seconds)
+                histograms['serializer_seconds'].observe(sample.serializer_seconds)
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for name, help_text, buckets in HISTOGRAMS:
+                metric = METRIC_PREFIX + name
+                lines.append(f'# HELP {metric} {help_text}')
+                lines.append(f'# TYPE {metric} histogram')
+                for (kind, path), histograms in sorted(self._paths.items()):
+                    histogram = histograms[name]
+                    labels = f'kind="{kind}",path="{_escape(path)}"'
+                    for bound, count in zip(buckets + ('+Inf',), histogram.cumulative_counts()):
+                        lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{metric}_sum{{{labels}}} {histogram.sum!r}')
+                    lines.append(f'{metric}_count{{{labels}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> list:
+        """Latency percentiles and sampled averages of every path, in milliseconds"""
+        rows = []
+        with self._lock:
+            for (kind, path), histograms in self._paths.items():
+                seconds, sampled = histograms['seconds'], histograms['db_queries'].count
+                rows.append({
+                    'kind': kind,
+                    'path': path,
+                    'count': seconds.count,
+                    'total_ms': seconds.sum * 1000,
+                    'mean_ms': seconds.sum / seconds.count * 1000,
+                    'p50_ms': seconds.quantile(0.5) * 1000,
+                    'p95_ms': seconds.quantile(0.95) * 1000,
+                    'p99_ms': seconds.quantile(0.99) * 1000,
+                    'sampled': sampled,
+                    'db_queries_mean': histograms['db_queries'].sum / sampled if sampled else None,
+                    'db_ms_mean': histograms['db_seconds'].sum / sampled * 1000 if sampled else None,
+                    'serializer_ms_mean': histograms['serializer_seconds'].sum / sampled * 1000 if sampled else None,
+                })
+        return rows
+
+    def clear(self) -> None:
+        with self._lock:
+            self._paths.clear()
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+metrics = MetricsRegistry()
+
+
+def _record_query(execute, sql, params, many, context):
+    sample = _current_sample.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        seconds = time.perf_counter() - started
+        sample.queries += 1
+        sample.db_seconds += seconds
+        if sample.capture is not None:
+            sample.capture.add(sql, seconds)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    # Every thread has connections of its own, queries of the sync pool and the async ORM thread count too,
+    # since the sample travels with the context into them
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+connection_created.connect(install_query_recorder)
+
+
+class TimedSerializerMixin:
+    """Adds time spent turning objects into data to the sample of the current request, nested serializers once"""
+
+    def to_representation(self, instance):
+        sample = _current_sample.get()
+        if sample is None:
+            return super().to_representation(instance)
+        sample.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            sample.serializer_depth -= 1
+            if not sample.serializer_depth:
+                sample.serializer_seconds += time.perf_counter() - started
+
+
+def get_view_path(request) -> str:
+    """DRF action of a request like `RoomModelViewSet.list`, URL name for other views"""
+    match = request.resolver_match
+    if match is None:
+        return 'unmatched'
+    view_class = getattr(match.func, 'cls', None)
+    if view_class is not None:
+        method = request.method.lower()
+        actions = getattr(match.func, 'actions', None) or {}
+        return f'{view_class.__name__}.{actions.get(method, method)}'
+    return match.view_name
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path == '/metrics':
+            return self.get_response(request)
+
+        def path():
+            return get_view_path(request)
+
+        sample = metrics.new_sample()
+        token = _current_sample.set(sample)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            _current_sample.reset(token)
+            metrics.finish('api', path, started, sample)
+            raise
+        _current_sample.reset(token)
+
+        # Streamed responses are produced while they are sent, e.g. exports reading rows as they go, so they are
+        # timed until the last chunk. Async streams only get the time until the response started
+        if response.streaming and not getattr(response, 'is_async', False):
+            response.streaming_content = metrics.measure_stream('api', path, started, sample,
+                                                                response.streaming_content)
+        else:
+            metrics.finish('api', path, started, sample)
+        return response
+
+
+def metrics_view(request):
+    """
+    Histograms in Prometheus text format, `?format=json` gives percentiles of every path and the N+1 and slow
+    queries found instead
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        if request.headers.get('Authorization') != f'Bearer {token}':
+            return HttpResponseForbidden()
+    # Behind a reverse proxy on the same host every client comes from localhost, so it has to be asked for
+    elif not (getattr(settings, 'METRICS_ALLOW_LOCALHOST', False)
+              and ipaddress.ip_address(request.META.get('REMOTE_ADDR', '0.0.0.0')).is_loopback):
+        return HttpResponseForbidden()
+
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'paths': metrics.summary(), 'queries': query_reports.summary()})
+    return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
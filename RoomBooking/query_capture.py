@@ -0,0 +1,120 @@
+import logging
+import re
+import threading
+import traceback
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Fingerprints reported since start are remembered up to this many, later ones are only counted
+MAX_REPORTED_FINGERPRINTS = 1000
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDERS = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SPACES = re.compile(r'\s+')
+_THIS_DIRECTORY = Path(__file__).resolve().parent
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql: str) -> str:
+    """SQL with literals and parameters replaced by `?` and `IN` lists of any length folded, so repeats match"""
+    sql = _STRING.sub('?', sql.replace('%s', '?'))
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDERS.sub('(...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+def get_call_stack() -> str:
+    """Frames of project code that led to the query, without Django, libraries and the capture itself"""
+    base_dir = str(settings.BASE_DIR)
+    frames = [frame for frame in traceback.extract_stack()[:-1]
+              if frame.filename.startswith(base_dir) and Path(frame.filename).parent != _THIS_DIRECTORY
+              and '/site-packages/' not in frame.filename]
+    return ''.join(traceback.format_list(frames))
+
+
+class QueryCapture:
+    """
+    Statements of a single request or bot update, counted by fingerprint. A fingerprint run
+    QUERY_CAPTURE_REPEATED_THRESHOLD times is an N+1, a statement slower than QUERY_CAPTURE_SLOW_MS is slow. Either
+    is logged with the call stack once per fingerprint for the lifetime of the process, see QueryReports.
+
+    Only QUERY_CAPTURE_MAX_FINGERPRINTS distinct fingerprints are counted, so a request running thousands of
+    different statements keeps memory bounded.
+    """
+    __slots__ = ('counts', 'repeated', 'slow', 'skipped')
+
+    def __init__(self):
+        self.counts = {}
+        self.repeated = {}
+        self.slow = {}
+        self.skipped = 0
+
+    def add(self, sql: str, seconds: float) -> None:
+        key = fingerprint(sql)
+        count = self.counts.get(key)
+        if count is None:
+            if len(self.counts) >= getattr(settings, 'QUERY_CAPTURE_MAX_FINGERPRINTS', 100):
+                self.skipped += 1
+                return
+            count = 0
+        self.counts[key] = count = count + 1
+
+        # Stacks are taken while the query runs, only the first time a report needs them
+        if (count == getattr(settings, 'QUERY_CAPTURE_REPEATED_THRESHOLD', 5)
+                and not query_reports.is_reported('repeated', key)):
+            self.repeated[key] = get_call_stack()
+        milliseconds = seconds * 1000
+        if (milliseconds >= getattr(settings, 'QUERY_CAPTURE_SLOW_MS', 200) and key not in self.slow
+                and not query_reports.is_reported('slow', key)):
+            self.slow[key] = (milliseconds, get_call_stack())
+
+    def finish(self, kind: str, path: str) -> None:
+        for key, stack in self.repeated.items():
+            query_reports.report('repeated', key, kind, path, self.counts[key], stack)
+        for key, (milliseconds, stack) in self.slow.items():
+            query_reports.report('slow', key, kind, path, self.counts[key], stack, milliseconds)
+
+
+class QueryReports:
+    """N+1 and slow statements found since the process started, each logged once"""
+
+    def __init__(self):
+        self._reports = {}
+        self._lock = threading.Lock()
+
+    def is_reported(self, problem: str, key: str) -> bool:
+        return (problem, key) in self._reports
+
+    def report(self, problem: str, key: str, kind: str, path: str, count: int, stack: str,
+               milliseconds: float = None) -> None:
+        with self._lock:
+            if (problem, key) in self._reports or len(self._reports) >= MAX_REPORTED_FINGERPRINTS:
+                return
+            self._reports[problem, key] = {
+                'problem': problem,
+                'kind': kind,
+                'path': path,
+                'fingerprint': key,
+                'count': count,
+                'ms': milliseconds,
+            }
+        if problem == 'repeated':
+            logger.warning("Query repeated %s times by %s %s, likely N+1: %s\n%s", count, kind, path, key, stack)
+        else:
+            logger.warning("Slow query took %.1f ms in %s %s: %s\n%s", milliseconds, kind, path, key, stack)
+
+    def summary(self) -> list:
+        with self._lock:
+            return list(self._reports.values())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reports.clear()
+
+
+query_reports = QueryReports()
@@ -69,6 +69,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so it measures everything below it
+    "RoomBooking.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -112,6 +114,18 @@ DATABASES = {
     }
 }
 
+# Caches
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+# Availability calendars, room type inventories, rate tables, the room catalog and telegram logins are kept in memory
+# of every process and are invalidated across processes only through versions kept in these caches. The local memory
+# default isn't shared, so with it other workers serve stale data until their copies expire. Running more than one
+# process (e.g. uvicorn --workers, or the bot next to the server) takes a shared backend: CACHE_URL=redis://host:6379/0,
+# pymemcache://host:11211 or dbcache://cache_table after `python manage.py createcachetable`.
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -155,6 +169,82 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = 'users.User'
 
+# Availability calendar
+
+# Seconds after which the in-process availability calendar is rebuilt from the bookings table.
+# Changes made by other processes are picked up earlier when they share a cache backend.
+AVAILABILITY_CALENDAR_TTL = 60
+
+# Room catalog
+
+# Cache alias holding the room catalog, point it to a shared backend to share one copy between processes
+ROOM_CATALOG_CACHE = 'default'
+
+# Room rates
+
+# Days from today covered by cached rate tables of room types, prices of stays past it are calculated on every call
+PRICING_HORIZON_DAYS = 730
+
+# Room search results
+
+# Seconds a search result is reused for, results are also dropped when a booking on overlapping dates changes.
+# Results are kept by every process, bookings made through other processes show up in them after these seconds
+SEARCH_CACHE_TTL = 30
+SEARCH_CACHE_MAX_ENTRIES = 1000
+
+# Telegram logins
+
+# Cache alias sharing telegram id -> user lookups and their invalidations between processes
+TELEGRAM_USER_CACHE = 'default'
+# Seconds a lookup is reused for, logins, logouts and user changes drop it right away
+TELEGRAM_USER_CACHE_TTL = 300
+
+# Telegram bot
+
+# Found rooms shown on a single page of bot search results
+BOT_ROOMS_PAGE_SIZE = 5
+
+# Threads running blocking service calls of bot handlers, each of them keeps its own database connection
+SYNC_POOL_THREADS = env.int('SYNC_POOL_THREADS', default=8)
+
+# Telegram flood limits: requests a second in total, to a single chat and how many a chat can get at once.
+# Requests Telegram still answers with 429 are retried after the wait it asks for, this many times
+BOT_SEND_RATE = 30
+BOT_CHAT_SEND_RATE = 1
+BOT_CHAT_SEND_BURST = 3
+BOT_SEND_MAX_RETRIES = 3
+
+# Updates handled at the same time by a single bot process
+BOT_CONCURRENT_UPDATES = env.int('BOT_CONCURRENT_UPDATES', default=32)
+
+# Seconds between writes of conversation state, a chat answered by another worker sees the state as of the last write
+BOT_PERSISTENCE_INTERVAL = 1
+# Class keeping conversation state, see bot.persistence.DatabaseStore
+BOT_PERSISTENCE_STORE = 'bot.persistence.DatabaseStore'
+
+# Public URL Telegram delivers updates to. When set, the ASGI application serves the bot on BOT_WEBHOOK_PATH,
+# register the URL with `python manage.py bot --webhook`. Telegram sends BOT_WEBHOOK_SECRET with every update
+BOT_WEBHOOK_URL = env('BOT_WEBHOOK_URL', default='')
+BOT_WEBHOOK_PATH = 'telegram/webhook/'
+BOT_WEBHOOK_SECRET = env('BOT_WEBHOOK_SECRET', default='')
+
+# Metrics
+
+# Share of API requests and bot updates whose queries, database and serializer time are measured,
+# wall time is measured for all of them
+METRICS_SAMPLE_RATE = 0.1
+# Scrapers of /metrics send it as "Authorization: Bearer <token>". Without a token nobody gets metrics, unless
+# requests from localhost are allowed, never do that behind a reverse proxy on the same host
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+METRICS_ALLOW_LOCALHOST = env.bool('METRICS_ALLOW_LOCALHOST', default=False)
+# Share of them whose statements are fingerprinted, statements repeated QUERY_CAPTURE_REPEATED_THRESHOLD times
+# (N+1) or slower than QUERY_CAPTURE_SLOW_MS are logged with their call stack, once per statement
+QUERY_CAPTURE_SAMPLE_RATE = 0.01
+QUERY_CAPTURE_REPEATED_THRESHOLD = 5
+QUERY_CAPTURE_SLOW_MS = 200
+# Distinct statements counted for a single request or update
+QUERY_CAPTURE_MAX_FINGERPRINTS = 100
+
 # REST
 
 REST_FRAMEWORK = {
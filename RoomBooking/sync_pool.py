@@ -0,0 +1,38 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_sync_pool() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'SYNC_POOL_THREADS', 8),
+                                           thread_name_prefix='sync-pool')
+        return _executor
+
+
+def _call(func, *args, **kwargs):
+    # Every thread of the pool has its own connection, treat each call like a request and drop broken or old ones
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_in_sync_pool(func, *args, **kwargs):
+    """
+    Runs blocking code (transactions, row locks, password hashing, in-process caches) in a pool of
+    SYNC_POOL_THREADS threads.
+
+    The async ORM of Django runs every query in a single shared thread, so a slow call made through it
+    holds up queries of every other chat; calls made here only hold up a thread of their own.
+    """
+    return await sync_to_async(_call, thread_sensitive=False, executor=get_sync_pool())(func, *args, **kwargs)
@@ -0,0 +1,42 @@
+import httpx
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+SORT_KEYS = ('p50_ms', 'p95_ms', 'p99_ms', 'mean_ms', 'total_ms', 'count')
+
+
+class Command(BaseCommand):
+    help = "Shows the slowest API actions and bot conversation states measured by a running server, " \
+           "read from its /metrics endpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000/metrics')
+        parser.add_argument('--top', type=int, default=10)
+        parser.add_argument('--by', choices=SORT_KEYS, default='p95_ms')
+        parser.add_argument('--kind', choices=('api', 'bot'), help="Only API requests or only bot updates")
+
+    def handle(self, *args, **options):
+        token = getattr(settings, 'METRICS_TOKEN', '')
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        try:
+            response = httpx.get(options['url'], params={'format': 'json'}, headers=headers, timeout=10)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            raise CommandError(f"Couldn't read metrics from {options['url']}: {e}")
+
+        paths = [path for path in response.json()['paths'] if options['kind'] in (None, path['kind'])]
+        paths.sort(key=lambda path: path[options['by']], reverse=True)
+
+        self.stdout.write(f"{'path':<50} {'count':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+                          f"{'queries':>8} {'db ms':>8} {'ser. ms':>8}")
+        for path in paths[:options['top']]:
+            self.stdout.write(
+                f"{path['kind'] + ' ' + path['path']:<50} {path['count']:>8} {path['p50_ms']:>9.1f} "
+                f"{path['p95_ms']:>9.1f} {path['p99_ms']:>9.1f} {_format(path['db_queries_mean'])} "
+                f"{_format(path['db_ms_mean'])} {_format(path['serializer_ms_mean'])}"
+            )
+
+
+def _format(value) -> str:
+    # Paths without sampled requests have nothing but wall time
+    return f"{value:>8.1f}" if value is not None else f"{'-':>8}"
@@ -0,0 +1,76 @@
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+class RoomCursorPagination(CursorPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = 'number'
+
+    # Keeps `sort_by` of RoomFilter working, room number breaks ties between equal prices or capacities
+    SORT_ORDERINGS = {
+        'price_asc': ('current_price', 'number'),
+        'price_desc': ('-current_price', '-number'),
+        'capacity_asc': ('capacity', 'number'),
+        'capacity_desc': ('-capacity', '-number'),
+    }
+
+    def get_ordering(self, request, queryset, view):
+        ordering = self.SORT_ORDERINGS.get(request.query_params.get('sort_by'), self.ordering)
+        return (ordering,) if isinstance(ordering, str) else ordering
+
+
+class BookingCursorPagination(CursorPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('booking_date', 'id')
+
+
+class BookingHistoryPagination(BookingCursorPagination):
+    """
+    Forward only cursor pagination over several booking querysets at once, e.g. bookings and their archive.
+
+    Each queryset returns at most one page past the cursor and the pages are merged, so a page costs one query
+    per queryset no matter how deep into the history it is.
+    """
+
+    def paginate_querysets(self, querysets: list, request, view=None) -> list:
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+
+        rows = []
+        for queryset in querysets:
+            if cursor is not None:
+                booking_date, booking_id = self._parse_position(cursor.position)
+                queryset = queryset.filter(
+                    Q(booking_date__gt=booking_date) | Q(booking_date=booking_date, id__gt=booking_id)
+                )
+            rows.extend(queryset.order_by(*self.ordering)[:self.page_size + 1])
+        rows.sort(key=lambda row: (row.booking_date, row.id))
+
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def _parse_position(self, position) -> tuple:
+        try:
+            booking_date, booking_id = position.split('|')
+            return datetime.fromisoformat(booking_date), int(booking_id)
+        except (AttributeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        position = f'{last.booking_date.isoformat()}|{last.id}'
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        return None
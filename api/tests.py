@@ -0,0 +1,524 @@
+import csv
+import gzip
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from api.views import RoomFilter
+from bookings.archive import archive_closed_bookings
+from bookings.calendar import availability_calendar
+from bookings.inventory import room_type_inventory
+from bookings.models import Booking
+from RoomBooking.benchmarks import LocalServer
+from RoomBooking.metrics import metrics
+from RoomBooking.query_capture import QueryCapture, fingerprint, query_reports
+from RoomBooking.testing import QueryBudgetMixin
+from rooms.models import Room, RoomType
+from users.models import User
+
+
+class RoomFilterAvailabilityTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(first_name='Test', last_name='User', username='test', email='test@test.com')
+        self.room_type = RoomType.objects.create(name='Single')
+        self.checkin_date = date.today() + timedelta(days=10)
+        self.checkout_date = self.checkin_date + timedelta(days=3)
+        availability_calendar.load()
+
+    def _create_rooms(self, count: int, start_number: int = 100) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            self._create_booked_rooms(count, start_number)
+
+    def _create_booked_rooms(self, count: int, start_number: int) -> None:
+        for number in range(start_number, start_number + count):
+            room = Room.objects.create(number=number, type=self.room_type, current_price=Decimal('1000.00'),
+                                       capacity=2)
+            # Every other room is booked on an overlapping stay
+            if number % 2 == 0:
+                Booking.objects.create(user=self.user, room=room, checkin_date=self.checkin_date + timedelta(days=1),
+                                       checkout_date=self.checkout_date + timedelta(days=1), price=Decimal('1.00'))
+
+    def _filter(self) -> list:
+        request = Request(APIRequestFactory().get('/api/rooms/', {
+            'checkin': self.checkin_date.isoformat(),
+            'checkout': self.checkout_date.isoformat(),
+        }))
+        return list(RoomFilter().filter_queryset(request, Room.objects.all(), None))
+
+    def test_filter_excludes_overlapping_bookings(self):
+        self._create_rooms(4)
+        self.assertEqual(sorted(room.number for room in self._filter()), [101, 103])
+
+    def test_filter_ignores_canceled_and_adjacent_bookings(self):
+        self._create_rooms(1, start_number=201)
+        room = Room.objects.get(number=201)
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(user=self.user, room=room, checkin_date=self.checkin_date - timedelta(days=2),
+                                   checkout_date=self.checkin_date, price=Decimal('1.00'))
+            Booking.objects.create(user=self.user, room=room, checkin_date=self.checkin_date,
+                                   checkout_date=self.checkout_date, price=Decimal('1.00'), status=Booking.CANCELED)
+        self.assertEqual([room.number for room in self._filter()], [201])
+
+    def test_filter_query_count_does_not_grow_with_rooms(self):
+        # One query finds the matching rooms, one loads them
+        self._create_rooms(2)
+        with self.assertNumQueries(2):
+            self._filter()
+
+        self._create_rooms(40, start_number=300)
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self._filter()), 21)
+
+    def test_repeated_search_is_cached_until_overlapping_booking(self):
+        self._create_rooms(4)
+        self._filter()
+        with self.assertNumQueries(1):
+            self.assertEqual(sorted(room.number for room in self._filter()), [101, 103])
+
+        # Booking on other dates keeps the result, an overlapping one drops it
+        room = Room.objects.get(number=101)
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(user=self.user, room=room, checkin_date=self.checkout_date,
+                                   checkout_date=self.checkout_date + timedelta(days=1), price=Decimal('1.00'))
+        with self.assertNumQueries(1):
+            self._filter()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(user=self.user, room=room, checkin_date=self.checkin_date,
+                                   checkout_date=self.checkin_date + timedelta(days=1), price=Decimal('1.00'))
+        with self.assertNumQueries(2):
+            self.assertEqual([room.number for room in self._filter()], [103])
+
+
+class AvailabilityMatrixTestCase(APITestCase):
+    def test_availability_matrix(self):
+        user = User.objects.create(first_name='Test', last_name='User', username='test', email='test@test.com')
+        room_type = RoomType.objects.create(name='Single')
+        free_room = Room.objects.create(number=100, type=room_type, current_price=Decimal('1000.00'), capacity=1)
+        booked_room = Room.objects.create(number=101, type=room_type, current_price=Decimal('1000.00'), capacity=1)
+        start_date = date.today() + timedelta(days=1)
+        Booking.objects.create(user=user, room=booked_room, checkin_date=start_date + timedelta(days=2),
+                               checkout_date=start_date + timedelta(days=3), price=Decimal('1.00'))
+
+        response = self.client.get('/api/rooms/availability-matrix/', {
+            'start': start_date.isoformat(), 'days': 4, 'max_nights': 3,
+        })
+
+        self.assertEqual(response.status_code, 200)
+        availability = response.data['availability']
+        self.assertEqual(len(availability), 4)
+        self.assertEqual(availability[start_date.isoformat()][2], [free_room.number, booked_room.number])
+        self.assertEqual(availability[start_date.isoformat()][3], [free_room.number])
+        self.assertEqual(availability[(start_date + timedelta(days=3)).isoformat()][1],
+                         [free_room.number, booked_room.number])
+
+    def test_availability_matrix_rejects_too_many_days(self):
+        response = self.client.get('/api/rooms/availability-matrix/', {'days': 1000})
+        self.assertEqual(response.status_code, 400)
+
+
+class ListingTestCase(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(first_name='Test', last_name='User', username='test', email='test@test.com',
+                                        is_staff=True)
+        room_type = RoomType.objects.create(name='Single')
+        checkin_date = date.today() + timedelta(days=1)
+        for i in range(5):
+            room = Room.objects.create(number=100 + i, type=room_type, current_price=Decimal(1000 - i * 100),
+                                       capacity=1)
+            Booking.objects.create(user=self.user, room=room, checkin_date=checkin_date,
+                                   checkout_date=checkin_date + timedelta(days=1), price=Decimal('1.00'))
+
+    def _list_all(self, url: str, params: dict) -> list:
+        results = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), params['page_size'])
+            results.extend(response.data['results'])
+            if not response.data['next']:
+                return results
+            response = self.client.get(response.data['next'])
+
+    def test_rooms_are_listed_page_by_page(self):
+        rooms = self._list_all('/api/rooms/', {'page_size': 2})
+        self.assertEqual([room['number'] for room in rooms], [100, 101, 102, 103, 104])
+
+        rooms = self._list_all('/api/rooms/', {'page_size': 2, 'sort_by': 'price_asc'})
+        self.assertEqual([room['number'] for room in rooms], [104, 103, 102, 101, 100])
+
+    def test_bookings_are_listed_page_by_page(self):
+        self.client.force_authenticate(self.user)
+        bookings = self._list_all('/api/bookings/', {'page_size': 3})
+        self.assertEqual([booking['room']['number'] for booking in bookings], [100, 101, 102, 103, 104])
+
+    def test_bookings_are_streamed(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/bookings/', {'stream': 'true'})
+
+        self.assertEqual(response.status_code, 200)
+        bookings = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([booking['room']['number'] for booking in bookings], [100, 101, 102, 103, 104])
+
+    def test_history_includes_archived_bookings(self):
+        self.client.force_authenticate(self.user)
+        Booking.objects.filter(room__number__in=(101, 103)).update(status=Booking.CANCELED)
+        archive_closed_bookings(older_than_days=0, today=date.today() + timedelta(days=10))
+
+        bookings = self._list_all('/api/bookings/', {'page_size': 3})
+        self.assertEqual([booking['room']['number'] for booking in bookings], [100, 102, 104])
+        bookings = self._list_all('/api/bookings/history/', {'page_size': 2})
+        self.assertEqual([booking['room']['number'] for booking in bookings], [100, 101, 102, 103, 104])
+        self.assertEqual([booking['status'] for booking in bookings],
+                         ['Booked', 'Canceled', 'Booked', 'Canceled', 'Booked'])
+
+    def test_listings_stay_within_query_budget(self):
+        self.client.force_authenticate(self.user)
+        with self.assertMaxQueries(1):
+            self.assertEqual(self.client.get('/api/rooms/', {'page_size': 5}).status_code, 200)
+        with self.assertMaxQueries(1):
+            self.assertEqual(self.client.get('/api/bookings/', {'page_size': 5}).status_code, 200)
+        with self.assertMaxQueries(1):
+            b''.join(self.client.get('/api/bookings/', {'stream': 'true'}).streaming_content)
+        # One query for bookings and one for the archive
+        with self.assertMaxQueries(2):
+            self.assertEqual(self.client.get('/api/bookings/history/', {'page_size': 5}).status_code, 200)
+
+
+class BulkBookingTestCase(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(first_name='Test', last_name='User', username='test', email='test@test.com')
+        single = RoomType.objects.create(name='Single')
+        double = RoomType.objects.create(name='Double')
+        for number in range(100, 110):
+            Room.objects.create(number=number, type=single, current_price=Decimal('1000.00'), capacity=1)
+        for number in range(200, 203):
+            Room.objects.create(number=number, type=double, current_price=Decimal('2000.00'), capacity=2)
+        self.checkin_date = date.today() + timedelta(days=5)
+        Booking.objects.create(user=self.user, room=Room.objects.get(number=101), checkin_date=self.checkin_date,
+                               checkout_date=self.checkin_date + timedelta(days=1), price=Decimal('1.00'))
+        availability_calendar.load()
+        self.client.force_authenticate(self.user)
+
+    def _book(self, **data):
+        data = {
+            'checkin_date': self.checkin_date.strftime('%d-%m-%Y'),
+            'checkout_date': (self.checkin_date + timedelta(days=2)).strftime('%d-%m-%Y'),
+            **data,
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/bookings/bulk/', data, format='json')
+
+    def test_nothing_is_booked_unless_everything_can_be(self):
+        response = self._book(rooms=[100, 101], room_types=[{'type': 'Double', 'quantity': 2}])
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual([result['status'] for result in response.data['results']],
+                         ['skipped', 'unavailable', 'skipped'])
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_partial_booking_reports_every_item(self):
+        response = self._book(rooms=[100, 101, 999], room_types=[{'type': 'Double', 'quantity': 5}], partial=True)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([result['status'] for result in response.data['results']],
+                         ['booked', 'unavailable', 'not_found', 'partial'])
+        self.assertEqual(response.data['results'][3]['room_numbers'], [200, 201, 202])
+        self.assertEqual(sorted(booking['room']['number'] for booking in response.data['bookings']),
+                         [100, 200, 201, 202])
+        self.assertEqual(Booking.objects.get(room__number=200).price, Decimal('4000.00'))
+        # Calendar follows bulk inserts like single bookings
+        room = Room.objects.get(number=100)
+        checkout_date = self.checkin_date + timedelta(days=1)
+        self.assertFalse(availability_calendar.is_available(room.id, self.checkin_date, checkout_date))
+        self.assertEqual(availability_calendar.verify(), [])
+
+    def test_rooms_requested_at_once_are_limited(self):
+        room_types = [{'type': f'Type {i}', 'quantity': 50} for i in range(4)]
+        self.assertEqual(self._book(room_types=room_types, rooms=[100]).status_code, 400)
+        self.assertEqual(self._book(room_types=room_types[:3], rooms=[100], partial=True).status_code, 201)
+        self.assertEqual(Booking.objects.count(), 2)
+
+    def test_unknown_room_types_are_not_found(self):
+        RoomType.objects.create(name='Suite')
+        response = self._book(room_types=[{'type': 'Suite', 'quantity': 1}, {'type': 'Penthouse', 'quantity': 1},
+                                          {'type': 'Double', 'quantity': 1}], partial=True)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([result['status'] for result in response.data['results']],
+                         ['unavailable', 'not_found', 'booked'])
+
+    def test_query_count_does_not_grow_with_rooms(self):
+        # Lock, availability check, insert of bookings and of their nights, each of the two transactions adds
+        # a savepoint pair. Rate plans are read once for every room type until they change
+        with self.assertMaxQueries(9):
+            self.assertEqual(self._book(rooms=[102]).status_code, 201)
+        with self.assertMaxQueries(9):
+            response = self._book(rooms=list(range(103, 110)), room_types=[{'type': 'Double', 'quantity': 3}])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['bookings']), 10)
+
+
+class BookingExportTestCase(APITestCase):
+    def setUp(self):
+        self.staff = User.objects.create(first_name='Staff', last_name='User', username='staff', email='s@test.com',
+                                         is_staff=True)
+        self.user = User.objects.create(first_name='Test', last_name='User', username='test', email='test@test.com')
+        room_type = RoomType.objects.create(name='Single')
+        room = Room.objects.create(number=100, type=room_type, current_price=Decimal('1000.00'), capacity=1)
+        self.checkin_date = date.today() + timedelta(days=1)
+        for days in range(0, 6, 2):
+            Booking.objects.create(user=self.user, room=room, checkin_date=self.checkin_date + timedelta(days=days),
+                                   checkout_date=self.checkin_date + timedelta(days=days + 1))
+        self.canceled = Booking.objects.order_by('id').last()
+        self.canceled.status = Booking.CANCELED
+        self.canceled.save(update_fields=['status'])
+        self.client.force_authenticate(self.staff)
+
+    def _export(self, **params):
+        response = self.client.get('/api/bookings/export/', params)
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content)
+        return response, gzip.decompress(content) if params.get('gzip') else content
+
+    def test_bookings_are_streamed_as_csv(self):
+        response, content = self._export()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(content.decode().splitlines()))
+        self.assertEqual(rows[0][:5], ['id', 'user_id', 'username', 'room_number', 'room_type'])
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[-1][2:5] + rows[-1][8:], ['test', '100', 'Single', 'Canceled', '1000.00'])
+
+    def test_filters_and_gzipped_ndjson(self):
+        response, content = self._export(output='ndjson', gzip='true', status='booked,canceled',
+                                         **{'from': (self.checkin_date + timedelta(days=1)).isoformat()})
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="bookings.ndjson.gz"')
+        records = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual([(record['checkin_date'], record['status']) for record in records], [
+            ((self.checkin_date + timedelta(days=2)).isoformat(), 'Booked'),
+            ((self.checkin_date + timedelta(days=4)).isoformat(), 'Canceled'),
+        ])
+
+        _, content = self._export(status='canceled', to=self.checkin_date.isoformat())
+        self.assertEqual(len(content.decode().splitlines()), 1)
+
+    def test_export_is_for_staff_with_valid_params(self):
+        self.assertEqual(self.client.get('/api/bookings/export/', {'output': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/bookings/export/', {'status': 'paid'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/bookings/export/', {'from': '01-01-2024'}).status_code, 400)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/bookings/export/').status_code, 403)
+
+
+class RoomTypeAvailabilityTestCase(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(first_name='Test', last_name='User', username='test', email='test@test.com')
+        suite = RoomType.objects.create(name='Suite')
+        double = RoomType.objects.create(name='Double')
+        for number in range(100, 103):
+            Room.objects.create(number=number, type=suite, current_price=Decimal('3000.00'), capacity=4)
+        for number in range(200, 202):
+            Room.objects.create(number=number, type=double, current_price=Decimal('1000.00'), capacity=2)
+        room_type_inventory.load()
+        self.checkin_date = date.today() + timedelta(days=5)
+        self.checkout_date = self.checkin_date + timedelta(days=2)
+        self.params = {'checkin': self.checkin_date.isoformat(), 'checkout': self.checkout_date.isoformat()}
+
+    def _get(self, **params):
+        return self.client.get('/api/room-types/availability/', {**self.params, **params})
+
+    def test_free_rooms_are_counted_by_type(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(user=self.user, room=Room.objects.get(number=100), checkin_date=self.checkin_date,
+                                   checkout_date=self.checkin_date + timedelta(days=1))
+
+        response = self._get(quantity=2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['room_types'], [
+            {'type': 'Double', 'capacity': 2, 'free': 2, 'available': True},
+            {'type': 'Suite', 'capacity': 4, 'free': 2, 'available': True},
+        ])
+        self.assertEqual([room_type['available'] for room_type in self._get(quantity=3).data['room_types']],
+                         [False, False])
+        self.assertEqual(self._get(type='Suite', capacity=3).data['room_types'],
+                         [{'type': 'Suite', 'capacity': 4, 'free': 2, 'available': True}])
+        self.assertEqual(self._get(capacity=5).data['room_types'], [])
+        # Small rooms of a type don't count for larger parties
+        with self.captureOnCommitCallbacks(execute=True):
+            Room.objects.create(number=400, type=RoomType.objects.get(name='Suite'), current_price=Decimal('1000.00'),
+                                capacity=2)
+        self.assertEqual(self._get(capacity=3).data['room_types'],
+                         [{'type': 'Suite', 'capacity': 2, 'free': 2, 'available': True}])
+        self.assertEqual(self._get(type='Suite').data['room_types'][0]['free'], 3)
+
+        # Counts are kept in memory, a repeated search doesn't read rooms or bookings
+        with self.assertMaxQueries(0):
+            self.assertEqual(self._get().status_code, 200)
+
+    def test_booking_by_type_follows_availability(self):
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/bookings/bulk/', {
+                'checkin_date': self.checkin_date.strftime('%d-%m-%Y'),
+                'checkout_date': self.checkout_date.strftime('%d-%m-%Y'),
+                'room_types': [{'type': 'Suite', 'quantity': 2}],
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(self._get(type='Suite').data['room_types'][0]['free'], 1)
+
+    def test_invalid_searches_are_rejected(self):
+        self.assertEqual(self.client.get('/api/room-types/availability/').status_code, 400)
+        self.assertEqual(self._get(type='Penthouse').status_code, 400)
+        self.assertEqual(self._get(quantity=0).status_code, 400)
+        self.assertEqual(self._get(checkout=self.checkin_date.isoformat()).status_code, 400)
+
+
+@override_settings(METRICS_SAMPLE_RATE=1, METRICS_ALLOW_LOCALHOST=True)
+class MetricsTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(first_name='Test', last_name='User', username='test', email='test@test.com')
+        room_type = RoomType.objects.create(name='Single')
+        for number in range(100, 103):
+            room = Room.objects.create(number=number, type=room_type, current_price=Decimal('1000.00'), capacity=1)
+            Booking.objects.create(user=self.user, room=room, checkin_date=date.today() + timedelta(days=1),
+                                   checkout_date=date.today() + timedelta(days=2), price=Decimal('1.00'))
+        metrics.clear()
+
+    def _get_paths(self) -> dict:
+        response = self.client.get('/metrics', {'format': 'json'})
+        self.assertEqual(response.status_code, 200)
+        return {(path['kind'], path['path']): path for path in response.json()['paths']}
+
+    def test_actions_are_measured(self):
+        self.client.force_authenticate(self.user)
+        for _ in range(3):
+            self.client.get('/api/rooms/')
+        booking = Booking.objects.first()
+        self.client.patch(f'/api/bookings/{booking.id}/cancel/')
+
+        paths = self._get_paths()
+        self.assertEqual(set(paths), {('api', 'RoomModelViewSet.list'), ('api', 'BookingModelViewSet.cancel')})
+        rooms = paths['api', 'RoomModelViewSet.list']
+        self.assertEqual(rooms['count'], 3)
+        self.assertEqual(rooms['sampled'], 3)
+        self.assertGreaterEqual(rooms['db_queries_mean'], 1)
+        self.assertGreater(rooms['serializer_ms_mean'], 0)
+        self.assertLessEqual(rooms['p50_ms'], rooms['p99_ms'])
+
+        text = self.client.get('/metrics').content.decode()
+        self.assertIn('# TYPE roombooking_request_seconds histogram', text)
+        self.assertIn('roombooking_request_seconds_count{kind="api",path="RoomModelViewSet.list"} 3', text)
+        self.assertIn('roombooking_request_db_queries_bucket{kind="api",path="RoomModelViewSet.list",le="+Inf"} 3',
+                      text)
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_unsampled_requests_only_record_wall_time(self):
+        self.client.get('/api/rooms/')
+
+        rooms = self._get_paths()['api', 'RoomModelViewSet.list']
+        self.assertEqual((rooms['count'], rooms['sampled'], rooms['db_queries_mean']), (1, 0, None))
+
+    def test_streamed_responses_are_measured_until_sent(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/bookings/export/')
+        self.assertNotIn(('api', 'BookingModelViewSet.export'), self._get_paths())
+
+        b''.join(response.streaming_content)
+        export = self._get_paths()['api', 'BookingModelViewSet.export']
+        self.assertEqual(export['count'], 1)
+        # Bookings and archived bookings are read while streaming
+        self.assertGreaterEqual(export['db_queries_mean'], 2)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_need_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    @override_settings(METRICS_ALLOW_LOCALHOST=False)
+    def test_metrics_are_closed_by_default(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    def test_command_shows_slowest_paths(self):
+        metrics.observe('api', 'RoomModelViewSet.list', 0.004)
+        metrics.observe('bot', 'book_room.room_number_handler', 0.3)
+        server = LocalServer()
+        server.start()
+        out = StringIO()
+
+        try:
+            call_command('metrics_top', url=f'{server.url}/metrics', top=1, stdout=out)
+        finally:
+            server.stop()
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith('bot book_room.room_number_handler'))
+
+
+@override_settings(QUERY_CAPTURE_SAMPLE_RATE=1, METRICS_ALLOW_LOCALHOST=True)
+class QueryCaptureTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(first_name='Test', last_name='User', username='test', email='test@test.com')
+        room_type = RoomType.objects.create(name='Single')
+        for number in range(100, 106):
+            room = Room.objects.create(number=number, type=room_type, current_price=Decimal('1000.00'), capacity=1)
+            Booking.objects.create(user=self.user, room=room, checkin_date=date.today() + timedelta(days=1),
+                                   checkout_date=date.today() + timedelta(days=2), price=Decimal('1.00'))
+        query_reports.clear()
+
+    def _load_rooms_one_by_one(self):
+        with metrics.record('api', 'test'):
+            for booking in Booking.objects.all():
+                Room.objects.get(id=booking.room_id)
+
+    def test_fingerprint_ignores_literals_and_list_lengths(self):
+        self.assertEqual(fingerprint('SELECT * FROM room WHERE id IN (%s, %s, %s) AND number = 101'),
+                         fingerprint("SELECT *  FROM room\nWHERE id IN (%s) AND number = 7"))
+        self.assertEqual(fingerprint("SELECT * FROM room WHERE type = 'Double'"), 'SELECT * FROM room WHERE type = ?')
+
+    def test_repeated_query_is_logged_once_with_stack(self):
+        with self.assertLogs('RoomBooking.query_capture', 'WARNING') as logs:
+            self._load_rooms_one_by_one()
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('repeated 6 times by api test', logs.output[0])
+        self.assertIn('_load_rooms_one_by_one', logs.output[0])
+
+        self._load_rooms_one_by_one()
+        reports = query_reports.summary()
+        self.assertEqual([(report['problem'], report['path'], report['count']) for report in reports],
+                         [('repeated', 'test', 6)])
+        self.assertIn('"rooms_room"."id" = ?', reports[0]['fingerprint'])
+
+    @override_settings(QUERY_CAPTURE_SLOW_MS=0)
+    def test_slow_query_is_logged(self):
+        with self.assertLogs('RoomBooking.query_capture', 'WARNING') as logs:
+            self.client.get('/api/rooms/')
+        self.assertTrue(all('Slow query' in line and 'RoomModelViewSet.list' in line for line in logs.output))
+
+    @override_settings(QUERY_CAPTURE_MAX_FINGERPRINTS=1)
+    def test_capture_is_size_capped(self):
+        capture = QueryCapture()
+        for sql in ('SELECT 1 FROM room', 'SELECT 1 FROM room', 'SELECT 1 FROM booking'):
+            capture.add(sql, 0.001)
+        self.assertEqual((capture.counts, capture.skipped), ({'SELECT ? FROM room': 2}, 1))
+
+    def test_listings_have_no_repeated_queries(self):
+        self.client.force_authenticate(self.user)
+        checkin_date = date.today().strftime('%Y-%m-%d')
+        checkout_date = (date.today() + timedelta(days=3)).strftime('%Y-%m-%d')
+        self.client.get('/api/rooms/', {'checkin': checkin_date, 'checkout': checkout_date, 'min_price': 10})
+        self.client.get('/api/bookings/')
+        self.client.get('/api/bookings/', {'stream': 'true'}).getvalue()
+
+        self.assertEqual(query_reports.summary(), [])
+        response = self.client.get('/metrics', {'format': 'json'})
+        self.assertEqual(response.json()['queries'], [])
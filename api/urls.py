@@ -1,13 +1,14 @@
 from django.urls import include, path, re_path
 from rest_framework import routers
 
-from api.views import BookingModelViewSet, RoomModelViewSet
+from api.views import BookingModelViewSet, RoomModelViewSet, RoomTypeViewSet
 
 app_name = 'api'
 
 router = routers.DefaultRouter()
 router.register(r'rooms', RoomModelViewSet)
 router.register(r'bookings', BookingModelViewSet)
+router.register(r'room-types', RoomTypeViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -1,28 +1,67 @@
-from datetime import datetime
+import json
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 
 from django.core.exceptions import ValidationError
-from rest_framework import filters, status, mixins
+from django.db.models import Case, DecimalField, F, Value, When
+from django.db.models.functions import Round
+from django.http import StreamingHttpResponse
+from rest_framework import filters, mixins, status
 from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError as RestValidationError
-from rest_framework.permissions import IsAdminUser, IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.permissions import (IsAdminUser, IsAuthenticated,
+                                        IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
-from rest_framework.viewsets import ModelViewSet, GenericViewSet
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.viewsets import GenericViewSet, ModelViewSet
 
-from bookings.models import Booking
-from rooms.models import Room
-from rooms.serializers import BookingSerializer, RoomSerializer
+from api.pagination import (BookingCursorPagination, BookingHistoryPagination,
+                            RoomCursorPagination)
+from bookings.bulk import book_rooms_in_bulk
+from bookings.calendar import filter_available_rooms
+from bookings.export import FORMATS, STATUS_NAMES, export_bookings
+from bookings.inventory import get_free_rooms_by_type, room_type_inventory
+from bookings.models import Booking, BookingArchive
+from bookings.occupancy import OccupancyMatrix
+from rooms.catalog import room_catalog
+from rooms.models import Room, RoomType
+from rooms.pricing import rate_tables
+from rooms.search_cache import search_cache
+from rooms.serializers import (BookingSerializer, BulkBookingSerializer,
+                               RoomSerializer)
 
 
 def filter_by_price(request, rooms_queryset):
+    # Prices of a night, or of the whole stay with rates of its nights when dates are given
     min_price = request.query_params.get('min_price')
     max_price = request.query_params.get('max_price')
+    if not min_price and not max_price:
+        return rooms_queryset
+    price_field = 'current_price'
+    checkin_date, checkout_date = get_stay_dates(request)
+    if checkin_date and checkout_date and checkin_date < checkout_date:
+        rooms_queryset = annotate_stay_price(rooms_queryset, checkin_date, checkout_date)
+        price_field = 'stay_price'
     if min_price:
-        rooms_queryset = rooms_queryset.filter(current_price__gte=min_price)
+        rooms_queryset = rooms_queryset.filter(**{f'{price_field}__gte': min_price})
     if max_price:
-        rooms_queryset = rooms_queryset.filter(current_price__lte=max_price)
+        rooms_queryset = rooms_queryset.filter(**{f'{price_field}__lte': max_price})
     return rooms_queryset
 
 
+def annotate_stay_price(rooms_queryset, checkin_date: date, checkout_date: date):
+    # Stay factors of room types are read from the rate tables, the database only multiplies
+    room_type_ids = {room.type_id for room in room_catalog.rooms()}
+    factors = rate_tables.stay_factors(room_type_ids, checkin_date, checkout_date)
+    stay_price = Case(
+        *(When(type_id=room_type_id, then=F('current_price') * Value(factor)) for room_type_id, factor in
+          factors.items()),
+        default=F('current_price') * Value(Decimal((checkout_date - checkin_date).days)),
+        output_field=DecimalField(decimal_places=2, max_digits=12),
+    )
+    return rooms_queryset.annotate(stay_price=Round(stay_price, 2))
+
+
 def filter_by_capacity(request, rooms_queryset):
     capacity = request.query_params.get('capacity')
     if capacity:
@@ -30,7 +69,7 @@ def filter_by_capacity(request, rooms_queryset):
     return rooms_queryset
 
 
-def filter_by_availability(request, rooms_queryset):
+def get_stay_dates(request) -> tuple:
     checkin_date_str = request.query_params.get('checkin')
     checkout_date_str = request.query_params.get('checkout')
     if checkin_date_str and checkout_date_str:
@@ -39,13 +78,37 @@ def filter_by_availability(request, rooms_queryset):
             checkout_date = datetime.strptime(checkout_date_str, '%Y-%m-%d').date()
         except ValueError:
             raise RestValidationError({'detail': "Invalid date format"})
+        return checkin_date, checkout_date
+    return None, None
 
-        room_ids = [room.id for room in rooms_queryset if room.is_room_available_for(checkin_date, checkout_date)]
 
-        rooms_queryset = rooms_queryset.filter(id__in=room_ids)
+def filter_by_availability(request, rooms_queryset):
+    checkin_date, checkout_date = get_stay_dates(request)
+    if checkin_date and checkout_date:
+        rooms_queryset = filter_available_rooms(rooms_queryset, checkin_date, checkout_date)
     return rooms_queryset
 
 
+def get_date_param(request, name: str):
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise RestValidationError({name: "Invalid date format"})
+
+
+def get_int_param(request, name: str, default: int, min_value: int, max_value: int) -> int:
+    try:
+        value = int(request.query_params.get(name, default))
+    except ValueError:
+        raise RestValidationError({name: "Must be an integer"})
+    if not min_value <= value <= max_value:
+        raise RestValidationError({name: f"Must be between {min_value} and {max_value}"})
+    return value
+
+
 def sort_queryset(request, rooms_queryset):
     sort_by = request.query_params.get('sort_by')
     if sort_by:
@@ -62,34 +125,108 @@ def sort_queryset(request, rooms_queryset):
 
 class RoomFilter(filters.BaseFilterBackend):
     def filter_queryset(self, request, rooms_queryset, view):
+        checkin_date, checkout_date = get_stay_dates(request)
+        if checkin_date and checkout_date:
+            # Searches with dates are repeated a lot, remember which rooms matched for a short while
+            params = request.query_params
+            key = search_cache.make_key('api', checkin_date, checkout_date, params.get('min_price'),
+                                        params.get('max_price'), params.get('capacity'), params.get('sort_by'))
+            filtered_queryset = self._filter(request, rooms_queryset)
+            room_ids = search_cache.get_or_compute(key, lambda: list(filtered_queryset.values_list('id', flat=True)))
+            rooms_queryset = rooms_queryset.filter(id__in=room_ids)
+        else:
+            rooms_queryset = self._filter(request, rooms_queryset)
+        return sort_queryset(request, rooms_queryset)
+
+    @staticmethod
+    def _filter(request, rooms_queryset):
         rooms_queryset = filter_by_price(request, rooms_queryset)
         rooms_queryset = filter_by_capacity(request, rooms_queryset)
         rooms_queryset = filter_by_availability(request, rooms_queryset)
-        rooms_queryset = sort_queryset(request, rooms_queryset)
         return rooms_queryset
 
 
-class RoomModelViewSet(ModelViewSet):
+class StreamingListMixin:
+    """
+    Lets `list` stream the whole result as a JSON array with `?stream=true` instead of returning pages,
+    reading rows from the database in chunks so memory stays bounded for exports of any size
+    """
+    stream_chunk_size = 1000
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('stream') != 'true':
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        queryset = queryset.order_by(*self.paginator.get_ordering(request, queryset, self))
+        return StreamingHttpResponse(self._stream_json(queryset), content_type='application/json')
+
+    def _stream_json(self, queryset):
+        yield '['
+        for i, obj in enumerate(queryset.iterator(chunk_size=self.stream_chunk_size)):
+            data = json.dumps(self.get_serializer(obj).data, cls=JSONEncoder, ensure_ascii=False)
+            yield data if i == 0 else ',' + data
+        yield ']'
+
+
+class RoomModelViewSet(StreamingListMixin, ModelViewSet):
     queryset = Room.objects.all()
     serializer_class = RoomSerializer
     filter_backends = [RoomFilter]
+    pagination_class = RoomCursorPagination
 
     def get_permissions(self):
         if self.action in ('create', 'update', 'destroy', 'partial_update'):
             self.permission_classes = (IsAdminUser,)
         return super(RoomModelViewSet, self).get_permissions()
 
+    def get_queryset(self):
+        return self.get_serializer_class().setup_eager_loading(super(RoomModelViewSet, self).get_queryset())
+
+    @action(detail=False, methods=['get'], url_path='catalog-stats', permission_classes=(IsAdminUser,))
+    def catalog_stats(self, request):
+        """Hit and miss counters of the room catalog cache in this process"""
+        return Response(room_catalog.stats())
 
-class BookingModelViewSet(ModelViewSet):
+    @action(detail=False, methods=['get'], url_path='availability-matrix')
+    def availability_matrix(self, request):
+        """Free rooms for every check-in date in `days` days from `start` and every stay of 1 to `max_nights`"""
+        start_date_str = request.query_params.get('start')
+        try:
+            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date() if start_date_str else date.today()
+        except ValueError:
+            raise RestValidationError({'detail': "Invalid date format"})
+        if start_date < date.today():
+            raise RestValidationError({'start': "Can't search rooms for the past"})
+        days = get_int_param(request, 'days', default=90, min_value=1, max_value=365)
+        max_nights = get_int_param(request, 'max_nights', default=14, min_value=1, max_value=30)
+
+        rooms_queryset = filter_by_capacity(request, filter_by_price(request, self.get_queryset()))
+        matrix = OccupancyMatrix(rooms_queryset, start_date, checkin_days=days, max_nights=max_nights)
+        availability = matrix.availability()
+        only_counts = request.query_params.get('counts') == 'true'
+
+        result = {}
+        for day in range(days):
+            stays = {}
+            for nights in range(1, max_nights + 1):
+                free = availability[:, day, nights - 1]
+                stays[nights] = int(free.sum()) if only_counts else matrix.room_numbers[free].tolist()
+            result[(start_date + timedelta(days=day)).isoformat()] = stays
+        return Response({'start': start_date, 'days': days, 'max_nights': max_nights, 'availability': result})
+
+
+class BookingModelViewSet(StreamingListMixin, ModelViewSet):
     queryset = Booking.objects.all()
     serializer_class = BookingSerializer
     permission_classes = (IsAuthenticated,)
+    pagination_class = BookingCursorPagination
 
     def get_queryset(self):
+        queryset = self.get_serializer_class().setup_eager_loading(super(BookingModelViewSet, self).get_queryset())
         if self.request.user.is_staff:
-            return super(BookingModelViewSet, self).get_queryset()
+            return queryset
         else:
-            queryset = super(BookingModelViewSet, self).get_queryset()
             return queryset.filter(user=self.request.user)
 
     def get_permissions(self):
@@ -109,10 +246,10 @@ class BookingModelViewSet(ModelViewSet):
                                 status=status.HTTP_400_BAD_REQUEST)
 
             room = Room.objects.get(number=room_number)
-            difference = checkout_date - checkin_date
 
+            # Price is calculated by Booking.save
             booking = Booking.objects.create(user=self.request.user, room=room, checkin_date=checkin_date,
-                                             checkout_date=checkout_date, price=room.current_price * difference.days)
+                                             checkout_date=checkout_date)
 
             serializer = self.get_serializer(booking)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -128,3 +265,104 @@ class BookingModelViewSet(ModelViewSet):
         booking.save(update_fields=['status'])
         serializer = self.get_serializer(booking)
         return Response(serializer.data)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Books many rooms for the same dates at once, e.g. for groups. Takes room numbers (`rooms`),
+        numbers of rooms of a type (`room_types`) or both. Nothing is booked unless everything can be,
+        with `partial` set whatever is available gets booked. Reports the outcome of every requested item.
+        """
+        serializer = BulkBookingSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            bookings, results = book_rooms_in_bulk(self.request.user, data['checkin_date'], data['checkout_date'],
+                                                   room_numbers=data['rooms'], room_type_quantities=data['room_types'],
+                                                   partial=data['partial'])
+        except ValidationError as e:
+            return Response({'dates': e.message}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'bookings': self.get_serializer(bookings, many=True).data, 'results': results},
+                        status=status.HTTP_201_CREATED if bookings else status.HTTP_409_CONFLICT)
+
+    @action(detail=False, methods=['get'], permission_classes=(IsAdminUser,))
+    def export(self, request):
+        """
+        Every booking, archived ones included, streamed as CSV or newline delimited JSON (`output=ndjson`) without
+        loading them into memory. Narrowed down by check-in date with `from` and `to` and by comma separated
+        `status` names, `gzip=true` compresses the file.
+        """
+        output_format = request.query_params.get('output', 'csv')
+        if output_format not in FORMATS:
+            raise RestValidationError({'output': f"Must be one of: {', '.join(FORMATS)}"})
+        status_names = [name for name in request.query_params.get('status', '').lower().split(',') if name]
+        if any(name not in STATUS_NAMES for name in status_names):
+            raise RestValidationError({'status': f"Must be one of: {', '.join(STATUS_NAMES)}"})
+        compress = request.query_params.get('gzip') == 'true'
+
+        chunks = export_bookings(output_format, compress, checkin_from=get_date_param(request, 'from'),
+                                 checkin_to=get_date_param(request, 'to'),
+                                 statuses=[STATUS_NAMES[name] for name in status_names])
+        content_type = 'text/csv' if output_format == 'csv' else 'application/x-ndjson'
+        filename = f'bookings.{output_format}'
+        if compress:
+            content_type, filename = 'application/gzip', filename + '.gz'
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @action(detail=False, methods=['get'], permission_classes=(IsAdminUser,),
+            pagination_class=BookingHistoryPagination)
+    def history(self, request):
+        """Bookings of all users including archived ones, oldest first. Can be narrowed down with `user` id"""
+        querysets = [
+            self.get_serializer_class().setup_eager_loading(model.objects.all())
+            for model in (Booking, BookingArchive)
+        ]
+        if request.query_params.get('user'):
+            user_id = get_int_param(request, 'user', 0, 1, 2 ** 63 - 1)
+            querysets = [queryset.filter(user_id=user_id) for queryset in querysets]
+
+        page = self.paginator.paginate_querysets(querysets, request, self)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+class RoomTypeViewSet(GenericViewSet):
+    queryset = RoomType.objects.all()
+
+    @action(detail=False, methods=['get'])
+    def availability(self, request):
+        """
+        Rooms of every room type free from `checkin` to `checkout`, answered from free room counts of room types
+        without looking at single rooms. `type` narrows it down to a room type, `capacity` to rooms holding a party
+        of that size, `quantity` tells if enough rooms are free. Rooms are picked when booking by room type.
+        """
+        checkin_date, checkout_date = get_stay_dates(request)
+        if not checkin_date or not checkout_date:
+            raise RestValidationError({'detail': "Check-in and checkout dates are required"})
+        if checkout_date <= checkin_date:
+            raise RestValidationError({'checkout': "Checkout date can't be earlier than 1 day after check-in"})
+        if checkin_date < date.today():
+            raise RestValidationError({'checkin': "Can't search rooms for the past"})
+        quantity = get_int_param(request, 'quantity', default=1, min_value=1, max_value=200)
+        capacity = get_int_param(request, 'capacity', default=1, min_value=1, max_value=100)
+
+        # Room type names are taken from the room catalog, room types without rooms have nothing to offer
+        type_names = {room.type_id: room.type for room in room_catalog.rooms()}
+        type_name = request.query_params.get('type')
+        if type_name and type_name not in type_names.values():
+            raise RestValidationError({'type': "There is no room of this type"})
+
+        # Only rooms holding the party are counted, room types without any are left out
+        free_rooms = get_free_rooms_by_type(checkin_date, checkout_date, capacity)
+        capacities = room_type_inventory.capacities()
+        room_types = [
+            {'type': name, 'capacity': capacities.get(room_type_id), 'free': free_rooms.get(room_type_id, 0),
+             'available': free_rooms.get(room_type_id, 0) >= quantity}
+            for room_type_id, name in sorted(type_names.items(), key=lambda item: item[1])
+            if (not type_name or name == type_name) and room_type_id in free_rooms
+        ]
+        return Response({'checkin': checkin_date, 'checkout': checkout_date, 'quantity': quantity,
+                         'room_types': room_types})
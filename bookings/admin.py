@@ -1,6 +1,6 @@
 from django.contrib import admin, messages
 
-from bookings.models import Booking
+from bookings.models import Booking, BookingArchive
 
 
 @admin.register(Booking)
@@ -19,3 +19,14 @@ class BookingAdmin(admin.ModelAdmin):
         except ValueError as e:
             messages.set_level(request, messages.ERROR)
             messages.error(request, str(e))
+
+
+@admin.register(BookingArchive)
+class BookingArchiveAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'room', 'checkin_date', 'checkout_date', 'status')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,52 @@
+import time
+from datetime import date, timedelta
+
+from django.db import connection, transaction
+
+from bookings.models import Booking, BookingArchive, RoomNight
+
+ARCHIVED_FIELDS = ('id', 'user_id', 'room_id', 'checkin_date', 'checkout_date', 'booking_date', 'status', 'price')
+
+
+def archive_closed_bookings(older_than_days: int = 30, batch_size: int = 5000, today: date = None) -> dict:
+    """
+    Moves canceled and expired bookings that checked out more than `older_than_days` ago to BookingArchive.
+
+    Bookings are moved in batches of consecutive ids, each batch copied and deleted in its own transaction,
+    so the bookings table that availability checks read only keeps recent history.
+    """
+    today = today or date.today()
+    closed_bookings = Booking.objects.filter(status__in=(Booking.CANCELED, Booking.EXPIRED),
+                                             checkout_date__lt=today - timedelta(days=older_than_days))
+
+    started = time.perf_counter()
+    archived = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            # Locked, so a booking can't be changed between copying and deleting it
+            rows = list(closed_bookings.filter(id__gt=last_id).order_by('id').select_for_update()
+                        .values(*ARCHIVED_FIELDS)[:batch_size])
+            if not rows:
+                break
+            BookingArchive.objects.bulk_create([BookingArchive(**row) for row in rows])
+            _delete_bookings([row['id'] for row in rows])
+        archived += len(rows)
+        last_id = rows[-1]['id']
+
+    seconds = time.perf_counter() - started
+    return {
+        'archived': archived,
+        'seconds': seconds,
+        'rows_per_second': archived / seconds if seconds else 0.0,
+    }
+
+
+def _delete_bookings(ids: list) -> None:
+    # Deleting through the ORM would load every row once more only to send post_delete signals,
+    # which have nothing to do for bookings that are no longer active
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        # Closed bookings have no nights unless they were closed with a queryset update
+        cursor.execute(f"DELETE FROM {RoomNight._meta.db_table} WHERE booking_id IN ({placeholders})", ids)
+        cursor.execute(f"DELETE FROM {Booking._meta.db_table} WHERE id IN ({placeholders})", ids)
@@ -0,0 +1,117 @@
+from datetime import date
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.db.models.signals import post_save
+
+from bookings.models import Booking, RoomNight, is_overlap_error
+from rooms.models import Room, RoomType
+from rooms.pricing import rate_tables
+from users.models import User
+
+# Outcomes of requested rooms and room types
+BOOKED = 'booked'
+PARTIAL = 'partial'
+UNAVAILABLE = 'unavailable'
+NOT_FOUND = 'not_found'
+# Could be booked, but wasn't because other items of an all-or-nothing request couldn't
+SKIPPED = 'skipped'
+
+
+def book_rooms_in_bulk(user: User, checkin_date: date, checkout_date: date, room_numbers=(),
+                       room_type_quantities: dict = None, partial: bool = False) -> tuple:
+    """
+    Books many rooms for the same stay at once, by room number and by number of rooms of a type.
+
+    Every requested room is locked in id order, so bulk and single bookings running at the same time can't deadlock,
+    then availability of all of them is checked with one query and bookings are inserted with one bulk insert.
+    With `partial` whatever is available gets booked, otherwise nothing is booked unless everything can be.
+
+    Returns created bookings and a result for every requested room number and room type.
+    """
+    nights = (checkout_date - checkin_date).days
+    if nights < 1:
+        raise ValidationError("Checkout date can't be earlier than 1 day after check-in.")
+    if checkin_date < date.today():
+        raise ValidationError("Can't book rooms for the past")
+    room_numbers = list(dict.fromkeys(room_numbers))
+    room_type_quantities = room_type_quantities or {}
+
+    with transaction.atomic():
+        rooms = list(
+            Room.objects.select_for_update(of=('self',)).select_related('type')
+            .filter(Q(number__in=room_numbers) | Q(type__name__in=room_type_quantities)).order_by('id')
+        )
+        available_ids = set(Room.objects.filter(id__in=[room.id for room in rooms])
+                            .available_for(checkin_date, checkout_date).values_list('id', flat=True))
+
+        chosen_rooms = []
+        results = []
+        rooms_by_number = {room.number: room for room in rooms}
+        for number in room_numbers:
+            room = rooms_by_number.get(number)
+            if room is None:
+                result = NOT_FOUND
+            elif room.id in available_ids:
+                result = BOOKED
+                available_ids.discard(room.id)
+                chosen_rooms.append(room)
+            else:
+                result = UNAVAILABLE
+            results.append({'room_number': number, 'status': result})
+
+        # Only names without any room are looked up, to tell types without rooms from names that aren't types
+        type_names = {room.type.name for room in rooms}
+        missing_names = [type_name for type_name in room_type_quantities if type_name not in type_names]
+        if missing_names:
+            type_names.update(RoomType.objects.filter(name__in=missing_names).values_list('name', flat=True))
+
+        rooms.sort(key=lambda room: room.number)
+        for type_name, quantity in room_type_quantities.items():
+            if type_name not in type_names:
+                results.append({'room_type': type_name, 'quantity': quantity, 'available': 0, 'room_numbers': [],
+                                'status': NOT_FOUND})
+                continue
+            free_rooms = [room for room in rooms if room.type.name == type_name and room.id in available_ids]
+            free_rooms = free_rooms[:quantity]
+            available_ids.difference_update(room.id for room in free_rooms)
+            chosen_rooms.extend(free_rooms)
+            if len(free_rooms) == quantity:
+                result = BOOKED
+            else:
+                result = PARTIAL if free_rooms else UNAVAILABLE
+            results.append({'room_type': type_name, 'quantity': quantity, 'available': len(free_rooms),
+                            'room_numbers': [room.number for room in free_rooms], 'status': result})
+
+        if not partial and any(result['status'] != BOOKED for result in results):
+            for result in results:
+                if result['status'] == BOOKED:
+                    result['status'] = SKIPPED
+                elif result['status'] == PARTIAL:
+                    result['status'] = UNAVAILABLE
+                result.get('room_numbers', []).clear()
+            return [], results
+
+        bookings = [
+            Booking(user=user, room=room, checkin_date=checkin_date, checkout_date=checkout_date,
+                    price=rate_tables.stay_price(room.type_id, room.current_price, checkin_date, checkout_date))
+            for room in chosen_rooms
+        ]
+        try:
+            with transaction.atomic():
+                Booking.objects.bulk_create(bookings)
+                RoomNight.objects.bulk_create([night for booking in bookings for night in
+                                               RoomNight.for_stay(booking.id, booking.room_id, checkin_date,
+                                                                  checkout_date)])
+        except IntegrityError as e:
+            if is_overlap_error(e):
+                raise ValidationError("Room unavailable for these dates.")
+            raise
+
+        # bulk_create doesn't send post_save, send it here so the availability calendar and search cache follow
+        for booking in bookings:
+            booking._room_nights_saved = True
+            post_save.send(sender=Booking, instance=booking, created=True, update_fields=None, raw=False,
+                           using=Booking.objects.db)
+        return bookings, results
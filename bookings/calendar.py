@@ -0,0 +1,154 @@
+import threading
+import time
+from datetime import date, timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from bookings.models import Booking, RoomNight
+
+WINDOW_DAYS = 730
+VERSION_CACHE_KEY = 'bookings:availability_calendar:version'
+
+
+class AvailabilityCalendar:
+    """
+    Occupancy of every room for a rolling window of nights starting today.
+
+    Each room is a bitset (python int) where bit i is set when night `start + i` is taken by an active booking,
+    so checking a stay is a single AND against a mask of its nights. Rooms without active bookings have no entry.
+    """
+
+    def __init__(self, window_days: int = WINDOW_DAYS):
+        self.window_days = window_days
+        self.start = None
+        self._bitmaps = {}
+        self._version = None
+        self._loaded_at = 0.0
+        self._lock = threading.RLock()
+
+    def _is_stale(self) -> bool:
+        ttl = getattr(settings, 'AVAILABILITY_CALENDAR_TTL', 60)
+        return (self.start != date.today() or self._version != cache.get(VERSION_CACHE_KEY)
+                or time.monotonic() - self._loaded_at > ttl)
+
+    def _ensure_loaded(self) -> None:
+        if self._is_stale():
+            self.load()
+
+    def load(self) -> None:
+        # Rebuilds the whole window from active bookings in a single query
+        with self._lock:
+            start = date.today()
+            end = start + timedelta(days=self.window_days)
+            bookings = Booking.objects.filter(
+                status=Booking.BOOKED, checkout_date__gt=start, checkin_date__lt=end
+            ).values_list('room_id', 'checkin_date', 'checkout_date')
+
+            self.start = start
+            self._version = cache.get(VERSION_CACHE_KEY)
+            self._bitmaps = {}
+            for room_id, checkin_date, checkout_date in bookings:
+                self._set(room_id, checkin_date, checkout_date, occupied=True)
+            self._loaded_at = time.monotonic()
+
+    def _mask(self, checkin_date: date, checkout_date: date) -> Optional[int]:
+        # Bit mask of the nights of a stay, clipped to the window. None if the stay is not fully inside the window
+        first = (checkin_date - self.start).days
+        last = (checkout_date - self.start).days
+        if first < 0 or last > self.window_days:
+            return None
+        return ((1 << (last - first)) - 1) << first
+
+    def _clipped_mask(self, checkin_date: date, checkout_date: date) -> int:
+        first = max((checkin_date - self.start).days, 0)
+        last = min((checkout_date - self.start).days, self.window_days)
+        if last <= first:
+            return 0
+        return ((1 << (last - first)) - 1) << first
+
+    def _set(self, room_id: int, checkin_date: date, checkout_date: date, occupied: bool) -> None:
+        mask = self._clipped_mask(checkin_date, checkout_date)
+        bitmap = self._bitmaps.get(room_id, 0)
+        bitmap = bitmap | mask if occupied else bitmap & ~mask
+        if bitmap:
+            self._bitmaps[room_id] = bitmap
+        else:
+            self._bitmaps.pop(room_id, None)
+
+    def occupy(self, room_id: int, checkin_date: date, checkout_date: date) -> None:
+        with self._lock:
+            if self.start is not None:
+                self._set(room_id, checkin_date, checkout_date, occupied=True)
+
+    def release(self, room_id: int, checkin_date: date, checkout_date: date) -> None:
+        # Active bookings of a room never overlap, so clearing the nights of one can't free nights of another
+        with self._lock:
+            if self.start is not None:
+                self._set(room_id, checkin_date, checkout_date, occupied=False)
+
+    def is_available(self, room_id: int, checkin_date: date, checkout_date: date) -> Optional[bool]:
+        # None means that the stay is outside the window and has to be checked against the database
+        with self._lock:
+            self._ensure_loaded()
+            mask = self._mask(checkin_date, checkout_date)
+            if mask is None:
+                return None
+            return not self._bitmaps.get(room_id, 0) & mask
+
+    def occupied_room_ids(self, checkin_date: date, checkout_date: date) -> Optional[set]:
+        with self._lock:
+            self._ensure_loaded()
+            mask = self._mask(checkin_date, checkout_date)
+            if mask is None:
+                return None
+            return {room_id for room_id, bitmap in self._bitmaps.items() if bitmap & mask}
+
+    def verify(self) -> list:
+        """Compares the calendar with the bookings table and returns ids of rooms that don't match"""
+        with self._lock:
+            self._ensure_loaded()
+            expected = {}
+            bookings = Booking.objects.filter(status=Booking.BOOKED, checkout_date__gt=self.start).values_list(
+                'room_id', 'checkin_date', 'checkout_date'
+            )
+            for room_id, checkin_date, checkout_date in bookings:
+                # Walk night by night, so a mistake in the mask arithmetic can't hide itself
+                night = max(checkin_date, self.start)
+                while night < checkout_date and (night - self.start).days < self.window_days:
+                    expected[room_id] = expected.get(room_id, 0) | 1 << (night - self.start).days
+                    night += timedelta(days=1)
+
+            room_ids = set(expected) | set(self._bitmaps)
+            return sorted(room_id for room_id in room_ids if expected.get(room_id, 0) != self._bitmaps.get(room_id, 0))
+
+    def bump_version(self) -> None:
+        # Makes calendars of other processes reload, as long as they share a cache backend with this one
+        try:
+            version = cache.incr(VERSION_CACHE_KEY)
+        except ValueError:
+            cache.add(VERSION_CACHE_KEY, 0, timeout=None)
+            version = cache.incr(VERSION_CACHE_KEY)
+        with self._lock:
+            # Local changes are already applied, only changes made by other processes in between need a reload
+            if self._version == version - 1 or (self._version is None and version == 1):
+                self._version = version
+
+
+availability_calendar = AvailabilityCalendar()
+
+
+def get_occupied_room_ids(checkin_date: date, checkout_date: date) -> set:
+    occupied_room_ids = availability_calendar.occupied_room_ids(checkin_date, checkout_date)
+    if occupied_room_ids is None:
+        taken_nights = RoomNight.objects.filter(night__gte=checkin_date, night__lt=checkout_date)
+        occupied_room_ids = set(taken_nights.values_list('room_id', flat=True).distinct())
+    return occupied_room_ids
+
+
+def filter_available_rooms(rooms_queryset, checkin_date: date, checkout_date: date):
+    occupied_room_ids = availability_calendar.occupied_room_ids(checkin_date, checkout_date)
+    if occupied_room_ids is None:
+        return rooms_queryset.available_for(checkin_date, checkout_date)
+    return rooms_queryset.exclude(id__in=occupied_room_ids)
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Backends whose entries only the process storing them sees
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def check_shared_caches(app_configs, **kwargs):
+    """
+    Warns when caches carrying invalidations of in-process copies (availability calendar, room type inventory,
+    rate tables, room catalog, telegram logins) aren't shared, since other processes never see them then.
+    Not raised with DEBUG, where a single development server is the usual setup.
+    """
+    if settings.DEBUG:
+        return []
+    aliases = {'default', getattr(settings, 'ROOM_CATALOG_CACHE', 'default'),
+               getattr(settings, 'TELEGRAM_USER_CACHE', 'default')}
+    return [
+        Warning(
+            f"Cache '{alias}' is local to every process, bookings and changes made by one process reach "
+            f"availability, prices and logins of the others only when their copies expire.",
+            hint="Point CACHE_URL to a backend shared by all processes, e.g. redis:// or dbcache://, "
+                 "or run a single process.",
+            obj=alias,
+            id='bookings.W001',
+        )
+        for alias in sorted(aliases)
+        if settings.CACHES.get(alias, {}).get('BACKEND') in PROCESS_LOCAL_BACKENDS
+    ]
@@ -0,0 +1,52 @@
+import logging
+import time
+from datetime import date
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Max, Min
+
+from bookings.models import Booking, RoomNight
+
+logger = logging.getLogger(__name__)
+
+
+def expire_finished_bookings(batch_size: int = 5000, lock_timeout_ms: int = 2000, today: date = None) -> dict:
+    """
+    Moves active bookings whose checkout date has come to EXPIRED.
+
+    Rows are updated by consecutive id ranges, each range in its own short transaction, so the job never holds
+    many row locks at once. A range that can't get its locks within `lock_timeout_ms` is skipped and picked up
+    by the next run.
+    """
+    today = today or date.today()
+    finished_bookings = Booking.objects.filter(status=Booking.BOOKED, checkout_date__lte=today)
+    id_range = finished_bookings.aggregate(first=Min('id'), last=Max('id'))
+
+    started = time.perf_counter()
+    expired = 0
+    skipped_batches = 0
+    if id_range['first'] is not None:
+        for batch_start in range(id_range['first'], id_range['last'] + 1, batch_size):
+            try:
+                with transaction.atomic():
+                    if connection.vendor == 'postgresql':
+                        with connection.cursor() as cursor:
+                            cursor.execute("SET LOCAL lock_timeout = %s", [f'{lock_timeout_ms}ms'])
+                    ids = list(finished_bookings.filter(id__gte=batch_start, id__lt=batch_start + batch_size)
+                               .select_for_update().values_list('id', flat=True))
+                    if ids:
+                        expired += Booking.objects.filter(id__in=ids).update(status=Booking.EXPIRED)
+                        # update() sends no signals, nights of expired bookings are let go of here
+                        RoomNight.objects.filter(booking_id__in=ids).delete()
+            except DatabaseError:
+                logger.warning("Bookings with ids from %s to %s were not expired, they are locked", batch_start,
+                               batch_start + batch_size - 1)
+                skipped_batches += 1
+
+    seconds = time.perf_counter() - started
+    return {
+        'expired': expired,
+        'skipped_batches': skipped_batches,
+        'seconds': seconds,
+        'rows_per_second': expired / seconds if seconds else 0.0,
+    }
@@ -0,0 +1,94 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date
+
+from bookings.models import Booking, BookingArchive
+
+# Columns of exported rows, as read from a booking and its relations
+EXPORT_FIELDS = ('id', 'user_id', 'user__username', 'room__number', 'room__type__name', 'checkin_date',
+                 'checkout_date', 'booking_date', 'status', 'price')
+EXPORT_COLUMNS = ('id', 'user_id', 'username', 'room_number', 'room_type', 'checkin_date', 'checkout_date',
+                  'booking_date', 'status', 'price')
+STATUS_INDEX = EXPORT_FIELDS.index('status')
+FORMATS = ('csv', 'ndjson')
+STATUS_NAMES = {name.lower(): value for value, name in Booking.STATUSES}
+# Rows encoded together before a chunk is handed on, one write a row is what makes exports slow
+ROWS_PER_CHUNK = 500
+
+
+def get_export_querysets(checkin_from: date = None, checkin_to: date = None, statuses=None) -> list:
+    """
+    Bookings with check-in between `checkin_from` and `checkin_to` (both included) and one of `statuses`,
+    archived ones included, ordered by id within each table
+    """
+    querysets = []
+    for model in (Booking, BookingArchive):
+        queryset = model.objects.all()
+        if checkin_from:
+            queryset = queryset.filter(checkin_date__gte=checkin_from)
+        if checkin_to:
+            queryset = queryset.filter(checkin_date__lte=checkin_to)
+        if statuses:
+            queryset = queryset.filter(status__in=statuses)
+        querysets.append(queryset.order_by('id').values_list(*EXPORT_FIELDS))
+    return querysets
+
+
+def iter_rows(querysets: list, chunk_size: int = 2000):
+    """
+    Rows of the querysets one after another. They are read `chunk_size` at a time through a server-side cursor on
+    PostgreSQL, so memory stays the same whatever the number of rows
+    """
+    statuses = dict(Booking.STATUSES)
+    for queryset in querysets:
+        for row in queryset.iterator(chunk_size=chunk_size):
+            yield row[:STATUS_INDEX] + (statuses[row[STATUS_INDEX]],) + row[STATUS_INDEX + 1:]
+
+
+def iter_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for i, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if i % ROWS_PER_CHUNK == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_ndjson(rows):
+    lines = []
+    for row in rows:
+        record = dict(zip(EXPORT_COLUMNS, row))
+        for column in ('checkin_date', 'checkout_date', 'booking_date'):
+            record[column] = record[column].isoformat()
+        record['price'] = str(record['price'])
+        lines.append(json.dumps(record, ensure_ascii=False))
+        if len(lines) == ROWS_PER_CHUNK:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def iter_gzip(chunks):
+    """Compresses text chunks into a gzip stream as they come"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_bookings(output_format: str = 'csv', compress: bool = False, chunk_size: int = 2000, **filters):
+    """Exported bookings as a stream of bytes chunks, see get_export_querysets for filters"""
+    rows = iter_rows(get_export_querysets(**filters), chunk_size=chunk_size)
+    chunks = iter_csv(rows) if output_format == 'csv' else iter_ndjson(rows)
+    if compress:
+        return iter_gzip(chunks)
+    return (chunk.encode() for chunk in chunks)
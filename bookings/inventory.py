@@ -0,0 +1,288 @@
+import threading
+import time
+from bisect import bisect_left
+from datetime import date, timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from bookings.calendar import WINDOW_DAYS
+from bookings.models import RoomNight
+from rooms.models import Room
+
+VERSION_CACHE_KEY = 'bookings:room_type_inventory:version'
+
+
+class MinSegmentTree:
+    """
+    Minimum of any range of values in O(log n), with a value added to a whole range in O(log n) as well.
+
+    Bottom-up tree over a power of two leaves, an inner node holds the minimum of its children plus whatever was
+    added to its whole range, so ranges are updated without pushing additions down to the leaves.
+    """
+
+    def __init__(self, values: list):
+        self.size = 1
+        while self.size < len(values):
+            self.size *= 2
+        # Padding leaves are never queried, they only must not be the minimum of a real range
+        self._min = [0] * self.size + list(values) + [float('inf')] * (self.size - len(values))
+        self._added = [0] * self.size
+        for node in range(self.size - 1, 0, -1):
+            self._min[node] = min(self._min[2 * node], self._min[2 * node + 1])
+
+    def _apply(self, node: int, value: int) -> None:
+        self._min[node] += value
+        if node < self.size:
+            self._added[node] += value
+
+    def _rebuild(self, node: int) -> None:
+        # Recomputes ancestors of a node after nodes below them changed
+        while node > 1:
+            node //= 2
+            self._min[node] = min(self._min[2 * node], self._min[2 * node + 1]) + self._added[node]
+
+    def add(self, start: int, end: int, value: int) -> None:
+        """Adds value to positions from `start` to `end` (not included)"""
+        left, right = start + self.size, end + self.size
+        first, last = left, right - 1
+        while left < right:
+            if left & 1:
+                self._apply(left, value)
+                left += 1
+            if right & 1:
+                right -= 1
+                self._apply(right, value)
+            left //= 2
+            right //= 2
+        self._rebuild(first)
+        self._rebuild(last)
+
+    def _push(self, leaf: int) -> None:
+        # Moves additions of the ancestors of a leaf down to their children, root first
+        for shift in range(self.size.bit_length() - 1, 0, -1):
+            node = leaf >> shift
+            if self._added[node]:
+                self._apply(2 * node, self._added[node])
+                self._apply(2 * node + 1, self._added[node])
+                self._added[node] = 0
+
+    def min(self, start: int, end: int) -> int:
+        """Minimum of positions from `start` to `end` (not included)"""
+        left, right = start + self.size, end + self.size
+        self._push(left)
+        self._push(right - 1)
+        result = float('inf')
+        while left < right:
+            if left & 1:
+                result = min(result, self._min[left])
+                left += 1
+            if right & 1:
+                right -= 1
+                result = min(result, self._min[right])
+            left //= 2
+            right //= 2
+        return result
+
+
+class RoomTypeInventory:
+    """
+    Number of free rooms of every room type for every night of a rolling window starting today.
+
+    Each room type has a MinSegmentTree over the nights of the window, so the rooms of a type free for a whole stay,
+    the fewest free on any of its nights, take O(log n) whatever the length of the stay. Bookings change counts of
+    their nights as they are made and canceled, like they change the availability calendar. Which rooms exactly
+    are taken is left to booking, e.g. bulk booking by room type.
+
+    Rooms of a type may hold different numbers of guests, so there is a tree for every capacity found among rooms
+    of the type, counting its rooms holding at least that many. A booking changes the trees of every capacity up
+    to the one of its room, a party is answered from the tree of the smallest capacity holding it.
+    """
+
+    def __init__(self, window_days: int = WINDOW_DAYS):
+        self.window_days = window_days
+        self.start = None
+        # (room type id, capacity) -> tree of rooms of the type holding at least that many guests
+        self._trees = {}
+        # Room id -> (room type id, capacity)
+        self._rooms = {}
+        # Room type id -> capacities of its rooms, ascending
+        self._capacities = {}
+        self._version = None
+        self._loaded_at = 0.0
+        self._lock = threading.RLock()
+
+    def _is_stale(self) -> bool:
+        ttl = getattr(settings, 'AVAILABILITY_CALENDAR_TTL', 60)
+        return (self.start != date.today() or self._version != cache.get(VERSION_CACHE_KEY)
+                or time.monotonic() - self._loaded_at > ttl)
+
+    def _ensure_loaded(self) -> None:
+        if self._is_stale():
+            self.load()
+
+    def load(self) -> None:
+        # Rebuilds counts of the whole window from rooms and their taken nights in two queries
+        with self._lock:
+            start = date.today()
+            end = start + timedelta(days=self.window_days)
+            rooms = Room.objects.values_list('id', 'type_id', 'capacity')
+            taken_nights = (RoomNight.objects.filter(night__gte=start, night__lt=end)
+                            .values('room__type_id', 'room__capacity', 'night').annotate(taken=Count('id'))
+                            .values_list('room__type_id', 'room__capacity', 'night', 'taken'))
+
+            self.start = start
+            self._version = cache.get(VERSION_CACHE_KEY)
+            self._rooms = {}
+            rooms_count = {}
+            for room_id, room_type_id, capacity in rooms:
+                self._rooms[room_id] = (room_type_id, capacity)
+                rooms_count[room_type_id, capacity] = rooms_count.get((room_type_id, capacity), 0) + 1
+            self._capacities = {}
+            for room_type_id, capacity in sorted(rooms_count):
+                self._capacities.setdefault(room_type_id, []).append(capacity)
+
+            free = {}
+            for (room_type_id, capacity), count in rooms_count.items():
+                for key in self._keys(room_type_id, capacity):
+                    free[key] = free.get(key, 0) + count
+            free = {key: [count] * self.window_days for key, count in free.items()}
+            for room_type_id, capacity, night, taken in taken_nights:
+                for key in self._keys(room_type_id, capacity):
+                    free[key][(night - start).days] -= taken
+            self._trees = {key: MinSegmentTree(counts) for key, counts in free.items()}
+            self._loaded_at = time.monotonic()
+
+    def _keys(self, room_type_id: int, capacity: int) -> list:
+        # Trees counting a room of the type holding that many guests
+        return [(room_type_id, threshold) for threshold in self._capacities[room_type_id] if threshold <= capacity]
+
+    def _nights(self, checkin_date: date, checkout_date: date, clip: bool) -> Optional[tuple]:
+        # Positions of the nights of a stay in the window. Stays not fully inside it are clipped to it with `clip`,
+        # otherwise there are none
+        first = (checkin_date - self.start).days
+        last = (checkout_date - self.start).days
+        if clip:
+            first, last = max(first, 0), min(last, self.window_days)
+        elif first < 0 or last > self.window_days:
+            return None
+        return (first, last) if first < last else None
+
+    def _change(self, room_id: int, checkin_date: date, checkout_date: date, free: int) -> None:
+        with self._lock:
+            if self.start is None:
+                return
+            room = self._rooms.get(room_id)
+            if room is None:
+                # A room added after loading, counts of its type are read again
+                self.start = None
+                return
+            nights = self._nights(checkin_date, checkout_date, clip=True)
+            if nights is not None:
+                for key in self._keys(*room):
+                    self._trees[key].add(*nights, free)
+
+    def occupy(self, room_id: int, checkin_date: date, checkout_date: date) -> None:
+        self._change(room_id, checkin_date, checkout_date, -1)
+
+    def release(self, room_id: int, checkin_date: date, checkout_date: date) -> None:
+        self._change(room_id, checkin_date, checkout_date, 1)
+
+    def free_rooms(self, checkin_date: date, checkout_date: date, capacity: int = 1) -> Optional[dict]:
+        """
+        Rooms holding `capacity` guests free for the whole stay, by id of room types having such rooms at all.
+        None means that the stay is outside the window and has to be checked against the database
+        """
+        with self._lock:
+            self._ensure_loaded()
+            nights = self._nights(checkin_date, checkout_date, clip=False)
+            if nights is None:
+                return None
+            free_rooms = {}
+            for room_type_id, capacities in self._capacities.items():
+                i = bisect_left(capacities, capacity)
+                if i < len(capacities):
+                    free_rooms[room_type_id] = self._trees[room_type_id, capacities[i]].min(*nights)
+            return free_rooms
+
+    def capacities(self) -> dict:
+        """Guests the smallest room of every room type holds, by room type id"""
+        with self._lock:
+            self._ensure_loaded()
+            return {room_type_id: capacities[0] for room_type_id, capacities in self._capacities.items()}
+
+    def verify(self) -> list:
+        """Compares counts with rooms and the nights table and returns ids of room types that don't match"""
+        with self._lock:
+            self._ensure_loaded()
+            rooms = list(Room.objects.values_list('type_id', 'capacity'))
+            capacities = {}
+            for room_type_id, capacity in rooms:
+                capacities.setdefault(room_type_id, set()).add(capacity)
+
+            def get_keys(room_type_id, capacity):
+                return [(room_type_id, threshold) for threshold in capacities[room_type_id] if threshold <= capacity]
+
+            rooms_count = {}
+            for room in rooms:
+                for key in get_keys(*room):
+                    rooms_count[key] = rooms_count.get(key, 0) + 1
+            expected = {key: [count] * self.window_days for key, count in rooms_count.items()}
+            # Walk taken nights one by one, so a mistake in counting them by type can't hide itself
+            end = self.start + timedelta(days=self.window_days)
+            taken_nights = RoomNight.objects.filter(night__gte=self.start, night__lt=end)
+            for room_type_id, capacity, night in taken_nights.values_list('room__type_id', 'room__capacity', 'night'):
+                for key in get_keys(room_type_id, capacity):
+                    expected[key][(night - self.start).days] -= 1
+
+            keys = set(expected) | set(self._trees)
+            return sorted({key[0] for key in keys
+                           if key not in expected or key not in self._trees
+                           or any(self._trees[key].min(i, i + 1) != count for i, count in enumerate(expected[key]))})
+
+    @staticmethod
+    def _incr_version() -> int:
+        try:
+            return cache.incr(VERSION_CACHE_KEY)
+        except ValueError:
+            cache.add(VERSION_CACHE_KEY, 0, timeout=None)
+            return cache.incr(VERSION_CACHE_KEY)
+
+    def bump_version(self) -> None:
+        # Makes inventories of other processes reload, as long as they share a cache backend with this one
+        version = self._incr_version()
+        with self._lock:
+            # Local changes are already applied, only changes made by other processes in between need a reload
+            if self._version == version - 1 or (self._version is None and version == 1):
+                self._version = version
+
+    def reload_everywhere(self) -> None:
+        # Rooms were added, removed or changed type, every process reads counts again
+        with self._lock:
+            self.start = None
+        self._incr_version()
+
+
+room_type_inventory = RoomTypeInventory()
+
+
+def get_free_rooms_by_type(checkin_date: date, checkout_date: date, capacity: int = 1) -> dict:
+    """
+    Rooms holding `capacity` guests free for a whole stay by room type, from the inventory or the nights table past
+    its window. Room types without rooms that large are left out
+    """
+    free_rooms = room_type_inventory.free_rooms(checkin_date, checkout_date, capacity)
+    if free_rooms is None:
+        rooms_count = dict(Room.objects.filter(capacity__gte=capacity).values('type_id').annotate(count=Count('id'))
+                           .values_list('type_id', 'count'))
+        taken_nights = (RoomNight.objects.filter(night__gte=checkin_date, night__lt=checkout_date,
+                                                 room__capacity__gte=capacity)
+                        .values('room__type_id', 'night').annotate(taken=Count('id')))
+        most_taken = {}
+        for row in taken_nights:
+            most_taken[row['room__type_id']] = max(row['taken'], most_taken.get(row['room__type_id'], 0))
+        free_rooms = {room_type_id: count - most_taken.get(room_type_id, 0) for room_type_id, count in
+                      rooms_count.items()}
+    return free_rooms
@@ -0,0 +1,150 @@
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db.models import Max
+from rest_framework.authtoken.models import Token
+
+from bookings.models import Booking, RoomNight
+from rooms.models import Room, RoomType
+from users.models import User
+
+# Room types of fixtures/data.json as (name, share of rooms, price, capacity), most hotels are mostly small rooms
+HOTEL_ROOM_TYPES = (
+    ('Single', 30, Decimal('1000.00'), 1),
+    ('Double', 30, Decimal('2500.00'), 2),
+    ('Twin', 15, Decimal('3000.00'), 2),
+    ('Family', 12, Decimal('5000.00'), 4),
+    ('Suite', 10, Decimal('7000.00'), 2),
+    ('Presidential Suite', 3, Decimal('15000.00'), 4),
+)
+# Weights of stays of 1 to 7 nights
+STAY_NIGHTS_WEIGHTS = (30, 25, 18, 10, 7, 4, 6)
+# Rows made by seed_hotel are told apart by these, so they can be removed again
+GENERATED_USERNAME_PREFIX = 'generated-'
+GENERATED_ROOM_DESCRIPTION = 'Generated for benchmarks'
+
+
+def get_benchmark_user() -> User:
+    user, _ = User.objects.get_or_create(username='benchmark', defaults={
+        'first_name': 'Benchmark', 'last_name': 'Benchmark', 'email': 'benchmark@example.com',
+    })
+    return user
+
+
+def seed_rooms(count: int) -> list:
+    room_type, _ = RoomType.objects.get_or_create(name='Benchmark')
+    first_number = (Room.objects.aggregate(number=Max('number'))['number'] or 0) + 1
+    return Room.objects.bulk_create([
+        Room(number=first_number + i, type=room_type, current_price=Decimal('1000.00'), capacity=2)
+        for i in range(count)
+    ])
+
+
+def seed_bookings(rooms: list, per_room: int, first_checkin_date: date, get_status, batch_size: int = 10_000) -> int:
+    """
+    Gives every room a back-to-back run of `per_room` stays starting at `first_checkin_date`,
+    `get_status(checkin_date)` decides the status of each stay
+    """
+    user = get_benchmark_user()
+    batch = []
+    for room in rooms:
+        checkin_date = first_checkin_date
+        for _ in range(per_room):
+            nights = random.randint(1, 7)
+            checkout_date = checkin_date + timedelta(days=nights)
+            batch.append(Booking(user=user, room=room, checkin_date=checkin_date, checkout_date=checkout_date,
+                                 status=get_status(checkin_date), price=room.current_price * nights))
+            checkin_date = checkout_date + timedelta(days=random.randint(0, 1))
+            if len(batch) >= batch_size:
+                _create_bookings(batch)
+                batch = []
+    _create_bookings(batch)
+    return per_room * len(rooms)
+
+
+def _create_bookings(bookings: list) -> None:
+    # bulk_create sends no signals, nights of active bookings are added here
+    Booking.objects.bulk_create(bookings)
+    RoomNight.objects.bulk_create([night for booking in bookings if booking.status == Booking.BOOKED
+                                   for night in RoomNight.for_stay(booking.id, booking.room_id, booking.checkin_date,
+                                                                   booking.checkout_date)], batch_size=10_000)
+
+
+def closed_status(checkin_date: date) -> int:
+    return random.choice((Booking.CANCELED, Booking.EXPIRED))
+
+
+def seed_hotel(rooms_count: int, bookings_count: int, users_count: int, today: date, history_days: int = 365,
+               horizon_days: int = 180, batch_size: int = 10_000) -> dict:
+    """
+    Adds a hotel of `rooms_count` rooms of the fixture room types, `users_count` users with API tokens and
+    about `bookings_count` bookings spread over `history_days` before and `horizon_days` after today.
+
+    Dates follow a usual booking pattern: most stays are short, more of them start on Fridays, cheap rooms are
+    booked more often and upcoming stays are mostly booked a few weeks ahead. Past stays are expired or canceled,
+    a stay that finds no free room is kept as canceled.
+    """
+    first_number = (Room.objects.aggregate(number=Max('number'))['number'] or 0) + 1
+    room_types = [(RoomType.objects.get_or_create(name=name)[0], share, price, capacity)
+                  for name, share, price, capacity in HOTEL_ROOM_TYPES]
+    room_type_choices = random.choices(room_types, weights=[share for _, share, _, _ in room_types], k=rooms_count)
+    rooms = Room.objects.bulk_create([
+        Room(number=first_number + i, type=room_type, capacity=capacity, description=GENERATED_ROOM_DESCRIPTION,
+             current_price=price * Decimal(random.choice(('0.9', '1.0', '1.0', '1.2'))))
+        for i, (room_type, _, price, capacity) in enumerate(room_type_choices)
+    ], batch_size=batch_size)
+
+    first_user = User.objects.filter(username__startswith=GENERATED_USERNAME_PREFIX).count()
+    users = User.objects.bulk_create([
+        User(username=f'{GENERATED_USERNAME_PREFIX}{first_user + i}', first_name='Generated', last_name='User',
+             email=f'{GENERATED_USERNAME_PREFIX}{first_user + i}@example.com')
+        for i in range(users_count)
+    ], batch_size=batch_size)
+    # Token.save() makes the key, bulk_create doesn't call it
+    Token.objects.bulk_create([Token(user=user, key=Token.generate_key()) for user in users], batch_size=batch_size)
+
+    room_weights = [1 / float(room.current_price) for room in rooms]
+    # Nights taken in each room as a bitset of days since the start of the history
+    taken = {}
+    start = today - timedelta(days=history_days)
+    batch = []
+    for _ in range(bookings_count):
+        checkin_date = _get_checkin_date(today, history_days, horizon_days)
+        nights = random.choices(range(1, len(STAY_NIGHTS_WEIGHTS) + 1), weights=STAY_NIGHTS_WEIGHTS)[0]
+        checkout_date = checkin_date + timedelta(days=nights)
+        mask = ((1 << nights) - 1) << (checkin_date - start).days
+        # Guests look at a few rooms before giving up on a fully booked hotel
+        for room in random.choices(rooms, weights=room_weights, k=5):
+            if not taken.get(room.id, 0) & mask:
+                break
+
+        if taken.get(room.id, 0) & mask or random.random() < 0.12:
+            status = Booking.CANCELED
+        else:
+            taken[room.id] = taken.get(room.id, 0) | mask
+            status = Booking.BOOKED if checkout_date > today else Booking.EXPIRED
+        batch.append(Booking(user=random.choice(users), room=room, checkin_date=checkin_date,
+                             checkout_date=checkout_date, status=status, price=room.current_price * nights))
+        if len(batch) >= batch_size:
+            _create_bookings(batch)
+            batch = []
+    _create_bookings(batch)
+    return {'rooms': rooms, 'users': users}
+
+
+def _get_checkin_date(today: date, history_days: int, horizon_days: int) -> date:
+    if random.random() < history_days / (history_days + horizon_days):
+        checkin_date = today - timedelta(days=random.randint(1, history_days - 7))
+    else:
+        # Lead times fall off exponentially, three weeks on average
+        checkin_date = today + timedelta(days=min(int(random.expovariate(1 / 21)), horizon_days))
+    if random.random() < 0.3:
+        # Moved to the closest Friday
+        checkin_date += timedelta(days=(4 - checkin_date.weekday()) % 7)
+    return checkin_date
+
+
+def delete_generated_hotel() -> None:
+    User.objects.filter(username__startswith=GENERATED_USERNAME_PREFIX).delete()
+    Room.objects.filter(description=GENERATED_ROOM_DESCRIPTION).delete()
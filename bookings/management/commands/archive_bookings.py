@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from bookings.archive import archive_closed_bookings
+
+
+class Command(BaseCommand):
+    help = "Moves old canceled and expired bookings to the archive table, meant to be run by a scheduler"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=30,
+                            help="Archive bookings that checked out more than this many days ago")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Number of bookings moved at once")
+
+    def handle(self, *args, **options):
+        result = archive_closed_bookings(older_than_days=options['older_than'], batch_size=options['batch_size'])
+        self.stdout.write(f"Archived {result['archived']} bookings in {result['seconds']:.2f}s "
+                          f"({result['rows_per_second']:.0f} rows/s)")
@@ -0,0 +1,76 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from bookings.archive import archive_closed_bookings
+from bookings.management.commands._seeding import (closed_status,
+                                                   seed_bookings, seed_rooms)
+from bookings.models import Booking
+from rooms.models import Room
+
+
+class Command(BaseCommand):
+    help = "Times availability checks while booking history grows tenfold and after it is archived. " \
+           "All seeded rows are rolled back."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--history', type=int, default=100_000,
+                            help="Number of closed bookings to start with, grows to ten times as many")
+        parser.add_argument('--rooms', type=int, default=400)
+        parser.add_argument('--repeat', type=int, default=50, help="How many availability queries to time")
+
+    def handle(self, *args, **options):
+        rooms_count, repeat = options['rooms'], options['repeat']
+        per_room = options['history'] // rooms_count
+        today = date.today()
+
+        with transaction.atomic():
+            rooms = seed_rooms(rooms_count)
+            # Upcoming stays every availability check has to look at
+            seed_bookings(rooms, 20, today, lambda checkin_date: Booking.BOOKED)
+
+            # Each stay takes at most 8 days, so histories seeded this far back never reach today
+            seed_bookings(rooms, per_room, today - timedelta(days=per_room * 8 + 60), closed_status)
+            self._report("History", rooms, repeat)
+
+            seed_bookings(rooms, per_room * 9, today - timedelta(days=per_room * 80 + 60), closed_status)
+            self._report("10x history", rooms, repeat)
+
+            result = archive_closed_bookings()
+            self.stdout.write(f"Archived {result['archived']} bookings in {result['seconds']:.1f}s "
+                              f"({result['rows_per_second']:.0f} rows/s)")
+            self._report("10x history archived", rooms, repeat)
+
+            transaction.set_rollback(True)
+
+    def _report(self, label: str, rooms: list, repeat: int):
+        table = Booking._meta.db_table
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(f"ANALYZE {table}")
+                cursor.execute("SELECT pg_size_pretty(pg_total_relation_size(%s))", [table])
+                size = cursor.fetchone()[0]
+            else:
+                size = 'n/a'
+
+        checkin_date = date.today() + timedelta(days=30)
+        checkout_date = checkin_date + timedelta(days=4)
+        room = rooms[len(rooms) // 2]
+        room_check = Booking.objects.overlapping(checkin_date, checkout_date).filter(room=room)
+        search = Room.objects.filter(type_id=room.type_id).available_for(checkin_date, checkout_date)
+
+        self.stdout.write(f"\n{label}: {Booking.objects.count()} rows in bookings table ({size})")
+        self._time("  Single room availability check", lambda: room_check.exists(), repeat)
+        self._time("  Whole hotel availability search", lambda: len(search.values_list('id', flat=True)), repeat)
+
+    def _time(self, label: str, query, repeat: int):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            query()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        self.stdout.write(f"{label}: median {timings[len(timings) // 2]:.2f} ms, max {timings[-1]:.2f} ms "
+                          f"over {repeat} runs")
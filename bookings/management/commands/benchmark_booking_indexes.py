@@ -0,0 +1,78 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from bookings.management.commands._seeding import (closed_status,
+                                                   seed_bookings, seed_rooms)
+from bookings.models import Booking
+from rooms.models import Room
+
+
+class Command(BaseCommand):
+    help = "Seeds a large bookings table and shows how the availability query is planned and how long it takes. " \
+           "All seeded rows are rolled back unless --keep is given."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bookings', type=int, default=1_000_000, help="Number of bookings to seed")
+        parser.add_argument('--rooms', type=int, default=400, help="Number of rooms to spread bookings over")
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--repeat', type=int, default=50, help="How many availability queries to time")
+        parser.add_argument('--keep', action='store_true', help="Keep seeded rows instead of rolling them back")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rooms = self._seed(options['bookings'], options['rooms'], options['batch_size'])
+            self._analyze()
+            self._benchmark(rooms, options['repeat'])
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+    def _seed(self, bookings_count: int, rooms_count: int, batch_size: int) -> list:
+        rooms = seed_rooms(rooms_count)
+
+        # Every room gets a back-to-back history of stays ending around today, most of them no longer active
+        per_room = bookings_count // rooms_count
+        started = time.perf_counter()
+        seeded = seed_bookings(rooms, per_room, date.today() - timedelta(days=per_room * 4), self._get_status,
+                               batch_size)
+        self.stdout.write(f"Seeded {seeded} bookings over {rooms_count} rooms "
+                          f"in {time.perf_counter() - started:.1f}s")
+        return rooms
+
+    @staticmethod
+    def _get_status(checkin_date: date) -> int:
+        return Booking.BOOKED if checkin_date >= date.today() - timedelta(days=30) else closed_status(checkin_date)
+
+    def _analyze(self):
+        # Refresh planner statistics, otherwise a freshly seeded table is planned as if it was empty
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {Booking._meta.db_table}")
+
+    def _benchmark(self, rooms: list, repeat: int):
+        checkin_date = date.today() + timedelta(days=3)
+        checkout_date = checkin_date + timedelta(days=4)
+        room = rooms[len(rooms) // 2]
+
+        room_check = Booking.objects.overlapping(checkin_date, checkout_date).filter(room=room)
+        search = Room.objects.filter(type_id=room.type_id).available_for(checkin_date, checkout_date)
+        explain_options = {'analyze': True, 'buffers': True} if connection.vendor == 'postgresql' else {}
+
+        self.stdout.write("\nSingle room availability check plan:")
+        self.stdout.write(room_check.explain(**explain_options))
+        self.stdout.write("\nWhole hotel availability search plan:")
+        self.stdout.write(search.explain(**explain_options))
+
+        self._time("Single room availability check", lambda: room_check.exists(), repeat)
+        self._time("Whole hotel availability search", lambda: len(search.values_list('id', flat=True)), repeat)
+
+    def _time(self, label: str, query, repeat: int):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            query()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        self.stdout.write(f"{label}: median {timings[len(timings) // 2]:.2f} ms, max {timings[-1]:.2f} ms "
+                          f"over {repeat} runs")
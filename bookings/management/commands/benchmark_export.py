@@ -0,0 +1,56 @@
+import os
+import resource
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from bookings.export import export_bookings
+from bookings.management.commands._seeding import (closed_status,
+                                                   seed_bookings, seed_rooms)
+from bookings.models import Booking, BookingArchive
+
+
+class Command(BaseCommand):
+    help = "Times exporting bookings as CSV, NDJSON and gzipped CSV, and how much memory of the process grows " \
+           "while doing it. All seeded rows are rolled back."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bookings', type=int, default=5_000_000, help="Number of bookings to seed")
+        parser.add_argument('--rooms', type=int, default=5000, help="Number of rooms to spread bookings over")
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Bookings read from the database at once")
+
+    def handle(self, *args, **options):
+        per_room = options['bookings'] // options['rooms']
+
+        with transaction.atomic():
+            started = time.perf_counter()
+            rooms = seed_rooms(options['rooms'])
+            seed_bookings(rooms, per_room, date.today() - timedelta(days=per_room * 5), closed_status)
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(f"ANALYZE {Booking._meta.db_table}")
+            rows = Booking.objects.count() + BookingArchive.objects.count()
+            self.stdout.write(f"Seeded in {time.perf_counter() - started:.1f}s, exporting {rows} bookings")
+
+            # Peak resident memory only grows, what it grows by while exporting is what exporting needs
+            baseline = self._max_rss_mb()
+            for label, output_format, compress in (('CSV', 'csv', False), ('NDJSON', 'ndjson', False),
+                                                   ('gzipped CSV', 'csv', True)):
+                started = time.perf_counter()
+                written = 0
+                with open(os.devnull, 'wb') as file:
+                    for chunk in export_bookings(output_format, compress, chunk_size=options['chunk_size']):
+                        file.write(chunk)
+                        written += len(chunk)
+                seconds = time.perf_counter() - started
+                self.stdout.write(f"{label:>12}: {seconds:.1f}s, {rows / seconds:.0f} rows/s, "
+                                  f"{written / 2 ** 20:.0f} MB, peak memory +{self._max_rss_mb() - baseline:.0f} MB")
+
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def _max_rss_mb() -> float:
+        # Kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
@@ -0,0 +1,56 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from bookings.occupancy import OccupancyMatrix
+from rooms.models import Room
+from rooms.views import SortType, get_available_rooms
+
+
+class Command(BaseCommand):
+    help = "Compares batched availability of the occupancy matrix with searching every stay one by one"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90, help="Number of check-in dates starting tomorrow")
+        parser.add_argument('--max-nights', type=int, default=14, help="Longest stay to check")
+        parser.add_argument('--skip-room-loop', action='store_true',
+                            help="Don't run Room.is_room_available_for for every room and stay, it is very slow")
+
+    def handle(self, *args, **options):
+        days, max_nights = options['days'], options['max_nights']
+        start_date = date.today() + timedelta(days=1)
+        stays = [(start_date + timedelta(days=day), nights)
+                 for day in range(days) for nights in range(1, max_nights + 1)]
+        self.stdout.write(f"{Room.objects.count()} rooms, {len(stays)} stays")
+
+        started = time.perf_counter()
+        matrix = OccupancyMatrix(start_date=start_date, checkin_days=days, max_nights=max_nights)
+        availability = matrix.availability()
+        matrix_seconds = time.perf_counter() - started
+        self.stdout.write(f"Occupancy matrix: {matrix_seconds * 1000:.1f} ms")
+
+        started = time.perf_counter()
+        search_results = [
+            get_available_rooms(checkin_date, checkin_date + timedelta(days=nights), None, None, None,
+                                SortType.NONE.value)
+            for checkin_date, nights in stays
+        ]
+        search_seconds = time.perf_counter() - started
+        self.stdout.write(f"get_available_rooms per stay: {search_seconds * 1000:.1f} ms "
+                          f"({search_seconds / matrix_seconds:.0f}x slower)")
+
+        # Both have to agree, otherwise the numbers above mean nothing
+        for (checkin_date, nights), rooms in zip(stays, search_results):
+            free = matrix.room_numbers[availability[:, (checkin_date - start_date).days, nights - 1]]
+            if sorted(room.number for room in rooms) != free.tolist():
+                self.stderr.write(f"Results differ for {nights} nights from {checkin_date}")
+
+        if not options['skip_room_loop']:
+            rooms = list(Room.objects.all())
+            started = time.perf_counter()
+            for checkin_date, nights in stays:
+                [room for room in rooms if room.is_room_available_for(checkin_date, checkin_date + timedelta(nights))]
+            loop_seconds = time.perf_counter() - started
+            self.stdout.write(f"Room.is_room_available_for per room and stay: {loop_seconds * 1000:.1f} ms "
+                              f"({loop_seconds / matrix_seconds:.0f}x slower)")
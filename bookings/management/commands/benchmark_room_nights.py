@@ -0,0 +1,82 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+
+from bookings.management.commands._seeding import (closed_status,
+                                                   seed_bookings, seed_rooms)
+from bookings.models import Booking, RoomNight
+from bookings.room_nights import rebuild_room_nights
+from rooms.models import Room
+
+
+class Command(BaseCommand):
+    help = "Compares availability checks reading overlapping bookings with ones reading taken room nights, " \
+           "and times rebuilding the nights. All seeded rows are rolled back."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bookings', type=int, default=200_000, help="Number of bookings to seed")
+        parser.add_argument('--rooms', type=int, default=400, help="Number of rooms to spread bookings over")
+        parser.add_argument('--repeat', type=int, default=50, help="How many availability queries to time")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Number of bookings rebuilt at once")
+
+    def handle(self, *args, **options):
+        rooms_count, repeat = options['rooms'], options['repeat']
+        per_room = options['bookings'] // rooms_count
+        today = date.today()
+
+        with transaction.atomic():
+            rooms = seed_rooms(rooms_count)
+            # Half of every history is behind today, the other half is upcoming and active
+            seed_bookings(rooms, per_room, today - timedelta(days=per_room * 2), self._get_status)
+            self._analyze()
+            self.stdout.write(f"{Booking.objects.count()} bookings, {RoomNight.objects.count()} taken nights")
+            self._benchmark(rooms, repeat)
+
+            result = rebuild_room_nights(batch_size=options['batch_size'])
+            self.stdout.write(f"\nRebuilt {result['nights']} nights of {result['bookings']} bookings "
+                              f"in {result['seconds']:.2f}s ({result['rows_per_second']:.0f} rows/s)")
+
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def _get_status(checkin_date: date) -> int:
+        return Booking.BOOKED if checkin_date >= date.today() else closed_status(checkin_date)
+
+    def _analyze(self):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f"ANALYZE {Booking._meta.db_table}")
+                cursor.execute(f"ANALYZE {RoomNight._meta.db_table}")
+
+    def _benchmark(self, rooms: list, repeat: int):
+        checkin_date = date.today() + timedelta(days=30)
+        checkout_date = checkin_date + timedelta(days=4)
+        room = rooms[len(rooms) // 2]
+        type_rooms = Room.objects.filter(type_id=room.type_id)
+
+        overlapping_bookings = Booking.objects.overlapping(checkin_date, checkout_date)
+        room_check = overlapping_bookings.filter(room=room)
+        search = type_rooms.filter(~Exists(overlapping_bookings.filter(room=OuterRef('pk'))))
+
+        self.stdout.write("\nOverlapping bookings:")
+        self._time("  Single room availability check", lambda: room_check.exists(), repeat)
+        self._time("  Whole hotel availability search", lambda: len(search.values_list('id', flat=True)), repeat)
+
+        self.stdout.write("\nTaken room nights:")
+        self._time("  Single room availability check",
+                   lambda: room.is_room_available_for(checkin_date, checkout_date), repeat)
+        search = type_rooms.available_for(checkin_date, checkout_date)
+        self._time("  Whole hotel availability search", lambda: len(search.values_list('id', flat=True)), repeat)
+
+    def _time(self, label: str, query, repeat: int):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            query()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        self.stdout.write(f"{label}: median {timings[len(timings) // 2]:.2f} ms, max {timings[-1]:.2f} ms "
+                          f"over {repeat} runs")
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import random
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from rest_framework.authtoken.models import Token
+
+from bookings.inventory import get_free_rooms_by_type
+from bookings.management.commands._seeding import (GENERATED_ROOM_DESCRIPTION,
+                                                   GENERATED_USERNAME_PREFIX)
+from bookings.models import Booking
+from RoomBooking.benchmarks import (LocalServer, get_revision, measure,
+                                    run_http_load, summarize)
+from rooms.models import Room
+from rooms.search_cache import search_cache
+from rooms.serializers import BookingSerializer, RoomSerializer
+from rooms.views import SortType, get_available_rooms
+from users.models import User
+
+# Generated stays don't reach this many days ahead, bookings made by the benchmarks go there
+FREE_AFTER_DAYS = 700
+
+
+class Command(BaseCommand):
+    help = "Measures room search, availability checks, booking and serializers in process and the rooms and " \
+           "bookings API over HTTP, on data made by generate_benchmark_data. Prints p50/p95/p99 latencies, " \
+           "throughput and queries per call as JSON, to be compared between commits."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=200, help="Calls of every in process benchmark")
+        parser.add_argument('--requests', type=int, default=1000, help="Requests of every HTTP scenario")
+        parser.add_argument('--concurrency', type=int, default=16, help="HTTP clients at once")
+        parser.add_argument('--url', help="Load a server running elsewhere instead of one started here, queries "
+                                          "are not counted then. The server started here shares the interpreter "
+                                          "with the clients, so its latencies are only good for comparing commits")
+        parser.add_argument('--skip-http', action='store_true')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help="Write results to this file instead of printing them")
+        parser.add_argument('--compare', help="Results of an earlier run to show changes against")
+
+    def handle(self, *args, **options):
+        rooms = list(Room.objects.filter(description=GENERATED_ROOM_DESCRIPTION).select_related('type'))
+        tokens = list(Token.objects.filter(user__username__startswith=GENERATED_USERNAME_PREFIX)[:100])
+        if not rooms or not tokens:
+            raise CommandError("No generated data, run generate_benchmark_data first")
+        random.seed(options['seed'])
+
+        results = {
+            'revision': get_revision(),
+            'database': connection.vendor,
+            'data': {'rooms': Room.objects.count(), 'bookings': Booking.objects.count(),
+                     'users': User.objects.count()},
+            'benchmarks': self._run_in_process(rooms, tokens[0].user, options['repeat']),
+        }
+        if not options['skip_http']:
+            results['http'] = self._run_http(rooms, tokens, options['requests'], options['concurrency'],
+                                             options['url'])
+
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+        if options['compare']:
+            with open(options['compare']) as file:
+                self._compare(json.load(file), results)
+
+    @staticmethod
+    def _get_stays(count: int) -> list:
+        # Upcoming stays the way they are searched, mostly soon and short
+        stays = []
+        for _ in range(count):
+            checkin_date = date.today() + timedelta(days=random.randint(1, 60))
+            stays.append((checkin_date, checkin_date + timedelta(days=random.randint(1, 7))))
+        return stays
+
+    def _run_in_process(self, rooms: list, user: User, repeat: int) -> dict:
+        stays = self._get_stays(20)
+
+        def search(clear_cache: bool):
+            def run():
+                if clear_cache:
+                    search_cache.clear()
+                get_available_rooms(*random.choice(stays), None, None, None, SortType.COST_ASCENDING.value)
+            return run
+
+        def check_room():
+            random.choice(rooms).is_room_available_for(*random.choice(stays))
+
+        def save_booking():
+            # Dates no generated booking reaches, rolled back so every call books the same way
+            checkin_date = date.today() + timedelta(days=FREE_AFTER_DAYS + random.randint(0, 300))
+            with transaction.atomic():
+                Booking(user=user, room=random.choice(rooms), checkin_date=checkin_date,
+                        checkout_date=checkin_date + timedelta(days=3)).save()
+                transaction.set_rollback(True)
+
+        room_page = RoomSerializer.setup_eager_loading(Room.objects.order_by('number'))
+        booking_page = BookingSerializer.setup_eager_loading(Booking.objects.order_by('-id'))
+
+        return {
+            'get_available_rooms': measure(search(clear_cache=True), repeat),
+            'get_available_rooms_cached': measure(search(clear_cache=False), repeat),
+            'is_room_available_for': measure(check_room, repeat),
+            'free_rooms_by_type': measure(lambda: get_free_rooms_by_type(*random.choice(stays)), repeat),
+            'booking_save': measure(save_booking, repeat),
+            'room_serializer_100': measure(lambda: RoomSerializer(room_page[:100], many=True).data, repeat),
+            'booking_serializer_100': measure(lambda: BookingSerializer(booking_page[:100], many=True).data, repeat),
+        }
+
+    def _run_http(self, rooms: list, tokens: list, requests: int, concurrency: int, url: str) -> dict:
+        server = None
+        if url is None:
+            server = LocalServer()
+            server.start()
+            url = server.url
+
+        searches = [
+            ('GET', f'/api/rooms/?checkin={checkin_date}&checkout={checkout_date}&sort_by=price_asc', None)
+            for checkin_date, checkout_date in self._get_stays(50)
+        ]
+        first_checkin_date = date.today() + timedelta(days=FREE_AFTER_DAYS + 400)
+        scenarios = {
+            'rooms_list': [('GET', '/api/rooms/', None)] * requests,
+            'rooms_search': [random.choice(searches) for _ in range(requests)],
+            'bookings_list': [('GET', '/api/bookings/', None)] * requests,
+            # A night of its own for every request, so all of them get booked
+            'bookings_create': [
+                ('POST', '/api/bookings/', {
+                    'room_number': rooms[i % len(rooms)].number,
+                    'checkin_date': (first_checkin_date + timedelta(days=i // len(rooms))).strftime('%d-%m-%Y'),
+                    'checkout_date': (first_checkin_date + timedelta(days=i // len(rooms) + 1)).strftime('%d-%m-%Y'),
+                })
+                for i in range(requests)
+            ],
+        }
+
+        results = {}
+        try:
+            for name, scenario in scenarios.items():
+                # Bookings are listed and made by a single user
+                headers = {'Authorization': f'Token {random.choice(tokens).key}'}
+                queries_before = server.queries if server is not None else 0
+                latencies, seconds, errors = asyncio.run(run_http_load(url, scenario, concurrency, headers))
+                queries = server.queries - queries_before if server is not None else None
+                results[name] = summarize(latencies, seconds, queries=queries, errors=errors)
+        finally:
+            if server is not None:
+                server.stop()
+            Booking.objects.filter(room__in=rooms, checkin_date__gte=first_checkin_date).delete()
+        return results
+
+    def _compare(self, previous: dict, current: dict):
+        self.stderr.write(f"\nChanges since {previous.get('revision')} (p50, p95):")
+        for group in ('benchmarks', 'http'):
+            for name, summary in current.get(group, {}).items():
+                before = previous.get(group, {}).get(name)
+                if not before:
+                    continue
+                changes = ', '.join(
+                    f"{before[key]:.2f} -> {summary[key]:.2f} ms ({(summary[key] / before[key] - 1) * 100:+.0f}%)"
+                    if before[key] else f"{summary[key]:.2f} ms" for key in ('p50_ms', 'p95_ms')
+                )
+                self.stderr.write(f"  {name}: {changes}")
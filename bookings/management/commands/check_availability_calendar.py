@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bookings.calendar import availability_calendar
+
+
+class Command(BaseCommand):
+    help = "Verifies the availability calendar against the bookings table"
+
+    def handle(self, *args, **options):
+        availability_calendar.load()
+        mismatched_room_ids = availability_calendar.verify()
+        if mismatched_room_ids:
+            raise CommandError(f"Availability calendar doesn't match bookings of rooms with ids: "
+                               f"{', '.join(map(str, mismatched_room_ids))}")
+        self.stdout.write(f"Availability calendar matches bookings table for {availability_calendar.window_days} "
+                          f"nights starting {availability_calendar.start}")
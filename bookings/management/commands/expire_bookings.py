@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from bookings.expiry import expire_finished_bookings
+
+
+class Command(BaseCommand):
+    help = "Moves finished bookings to EXPIRED in batches, meant to be run by a scheduler (e.g. daily from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help="Size of id ranges updated at once")
+        parser.add_argument('--lock-timeout', type=int, default=2000,
+                            help="Milliseconds to wait for row locks before skipping a batch (PostgreSQL)")
+
+    def handle(self, *args, **options):
+        result = expire_finished_bookings(batch_size=options['batch_size'], lock_timeout_ms=options['lock_timeout'])
+        self.stdout.write(f"Expired {result['expired']} bookings in {result['seconds']:.2f}s "
+                          f"({result['rows_per_second']:.0f} rows/s)")
+        if result['skipped_batches']:
+            self.stderr.write(f"{result['skipped_batches']} batches were skipped because of locks, "
+                              f"they will be expired by the next run")
@@ -0,0 +1,46 @@
+import sys
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from bookings.export import FORMATS, STATUS_NAMES, export_bookings
+
+
+def parse_date(value: str):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class Command(BaseCommand):
+    help = "Writes every booking, archived ones included, as CSV or newline delimited JSON, reading them from " \
+           "the database in chunks so memory stays the same whatever the number of bookings"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help="File to write to, standard output by default")
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--from', type=parse_date, dest='checkin_from', help="First check-in date, YYYY-MM-DD")
+        parser.add_argument('--to', type=parse_date, dest='checkin_to', help="Last check-in date, YYYY-MM-DD")
+        parser.add_argument('--status', action='append', choices=list(STATUS_NAMES), default=[],
+                            help="Only bookings with this status, can be repeated")
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Bookings read from the database at once")
+
+    def handle(self, *args, **options):
+        chunks = export_bookings(options['format'], options['gzip'], chunk_size=options['chunk_size'],
+                                 checkin_from=options['checkin_from'], checkin_to=options['checkin_to'],
+                                 statuses=[STATUS_NAMES[name] for name in options['status']])
+        started = time.perf_counter()
+        written = 0
+        if options['output']:
+            with open(options['output'], 'wb') as file:
+                for chunk in chunks:
+                    file.write(chunk)
+                    written += len(chunk)
+            self.stderr.write(f"Wrote {written / 2 ** 20:.1f} MB to {options['output']} "
+                              f"in {time.perf_counter() - started:.2f}s")
+        elif options['gzip']:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk.decode(), ending='')
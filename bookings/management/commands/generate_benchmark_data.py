@@ -0,0 +1,35 @@
+import random
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from bookings.management.commands._seeding import (delete_generated_hotel,
+                                                   seed_hotel)
+from bookings.models import Booking
+
+
+class Command(BaseCommand):
+    help = "Adds generated rooms of the fixture room types, users with API tokens and bookings over a year of " \
+           "history and half a year ahead, for benchmark_suite. Rows are kept until --clear."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=500)
+        parser.add_argument('--bookings', type=int, default=50_000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=1, help="Same seed, same data")
+        parser.add_argument('--clear', action='store_true', help="Remove previously generated rows first")
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        started = time.perf_counter()
+        with transaction.atomic():
+            if options['clear']:
+                delete_generated_hotel()
+            seed_hotel(options['rooms'], options['bookings'], options['users'], date.today())
+
+        counts = {status: Booking.objects.filter(status=value).count() for value, status in Booking.STATUSES}
+        self.stdout.write(f"Generated {options['rooms']} rooms, {options['users']} users and "
+                          f"{options['bookings']} bookings in {time.perf_counter() - started:.1f}s")
+        self.stdout.write(', '.join(f"{count} {status.lower()}" for status, count in counts.items()))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from bookings.room_nights import rebuild_room_nights
+
+
+class Command(BaseCommand):
+    help = "Rebuilds nights taken by active bookings, needed after bookings are changed with queryset update()"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help="Number of bookings rebuilt at once")
+
+    def handle(self, *args, **options):
+        result = rebuild_room_nights(batch_size=options['batch_size'])
+        self.stdout.write(f"Rebuilt {result['nights']} nights of {result['bookings']} bookings "
+                          f"in {result['seconds']:.2f}s ({result['rows_per_second']:.0f} rows/s)")
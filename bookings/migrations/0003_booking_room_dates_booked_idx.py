@@ -0,0 +1,67 @@
+# Generated by Django 4.2.11 on 2026-10-18 19:00
+
+from django.conf import settings
+from django.contrib.postgres.operations import BtreeGistExtension
+from django.db import migrations, models
+
+from bookings.overlaps import cancel_overlapping_bookings
+
+EXCLUSION_CONSTRAINT_NAME = "booking_room_dates_no_overlap"
+
+
+def resolve_double_bookings(apps, schema_editor):
+    # Rooms booked twice before the constraint existed would make adding it fail,
+    # the later of two overlapping bookings is canceled and logged
+    cancel_overlapping_bookings(apps.get_model("bookings", "Booking"))
+
+
+def add_overlap_exclusion_constraint(apps, schema_editor):
+    # Exclusion constraints are PostgreSQL only, other backends rely on the check in Booking.save
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        f"ALTER TABLE bookings_booking ADD CONSTRAINT {EXCLUSION_CONSTRAINT_NAME} "
+        f"EXCLUDE USING gist (room_id WITH =, daterange(checkin_date, checkout_date) WITH &&) "
+        f"WHERE (status = 0)"
+    )
+
+
+def remove_overlap_exclusion_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        f"ALTER TABLE bookings_booking DROP CONSTRAINT IF EXISTS {EXCLUSION_CONSTRAINT_NAME}"
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("bookings", "0002_alter_booking_status_delete_status"),
+        ("rooms", "0002_alter_room_description"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="booking",
+            name="status",
+            field=models.SmallIntegerField(
+                choices=[(0, "Booked"), (1, "Canceled"), (2, "Expired")], default=0
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="booking",
+            index=models.Index(
+                condition=models.Q(("status", 0)),
+                fields=["room", "checkin_date", "checkout_date"],
+                name="booking_room_dates_booked_idx",
+            ),
+        ),
+        migrations.RunPython(resolve_double_bookings, migrations.RunPython.noop),
+        # Creating the extension takes a superuser (or a trusted extension on PostgreSQL 13+) and is skipped
+        # when it exists already, e.g. created beforehand with `CREATE EXTENSION btree_gist;`
+        BtreeGistExtension(),
+        migrations.RunPython(
+            add_overlap_exclusion_constraint, remove_overlap_exclusion_constraint
+        ),
+    ]
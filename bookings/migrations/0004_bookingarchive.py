@@ -0,0 +1,31 @@
+# Generated by Django 4.2.11 on 2026-10-18 19:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('rooms', '0002_alter_room_description'),
+        ('bookings', '0003_booking_room_dates_booked_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('checkin_date', models.DateField()),
+                ('checkout_date', models.DateField()),
+                ('booking_date', models.DateTimeField()),
+                ('status', models.SmallIntegerField(choices=[(0, 'Booked'), (1, 'Canceled'), (2, 'Expired')])),
+                ('price', models.DecimalField(decimal_places=2, max_digits=9)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='rooms.room')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
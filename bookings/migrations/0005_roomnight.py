@@ -0,0 +1,52 @@
+# Generated by Django 4.2.11 on 2026-10-18 19:49
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from bookings.overlaps import cancel_overlapping_bookings
+
+
+def fill_room_nights(apps, schema_editor):
+    # Nights of bookings active at the time of the migration, later ones are kept in step by bookings.signals
+    Booking = apps.get_model("bookings", "Booking")
+    RoomNight = apps.get_model("bookings", "RoomNight")
+    # A night can only be taken once. Overlapping bookings are left by databases without the exclusion constraint
+    # of 0003, the later one is canceled and logged before any night is inserted
+    cancel_overlapping_bookings(Booking)
+    stays = Booking.objects.filter(status=0).order_by("id").values_list("id", "room_id", "checkin_date",
+                                                                         "checkout_date")
+    nights = []
+    for booking_id, room_id, checkin_date, checkout_date in stays.iterator(chunk_size=2000):
+        nights.extend(RoomNight(booking_id=booking_id, room_id=room_id, night=checkin_date + timedelta(days=i))
+                      for i in range((checkout_date - checkin_date).days))
+        if len(nights) >= 10000:
+            RoomNight.objects.bulk_create(nights)
+            nights = []
+    RoomNight.objects.bulk_create(nights)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0002_alter_room_description'),
+        ('bookings', '0004_bookingarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomNight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('night', models.DateField()),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='nights', to='bookings.booking')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='rooms.room')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='roomnight',
+            constraint=models.UniqueConstraint(fields=('room', 'night'), name='room_night_unique'),
+        ),
+        migrations.RunPython(fill_room_nights, migrations.RunPython.noop),
+    ]
@@ -1,15 +1,26 @@
-from datetime import date
+from datetime import date, timedelta
 from decimal import Decimal
+from typing import Optional
 
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import IntegrityError, models, transaction
 
 from rooms.models import Room, TelegramRoom
+from rooms.pricing import rate_tables
 from users.models import TelegramUser, User
 
 
+class BookingQuerySet(models.QuerySet):
+    def overlapping(self, checkin_date: date, checkout_date: date) -> 'BookingQuerySet':
+        # Active bookings sharing at least one night with the given stay
+        return self.filter(status=Booking.BOOKED, checkin_date__lt=checkout_date, checkout_date__gt=checkin_date)
+
+
 class Booking(models.Model):
+    # PostgreSQL exclusion constraint created in migration 0003, rejects overlapping active bookings of a room
+    OVERLAP_CONSTRAINT_NAME = 'booking_room_dates_no_overlap'
+
     BOOKED = 0
     CANCELED = 1
     EXPIRED = 2
@@ -29,6 +40,15 @@ class Booking(models.Model):
     price = models.DecimalField(decimal_places=2, max_digits=9, validators=[MinValueValidator(Decimal('0.01'))],
                                 null=False, blank=False)
 
+    objects = BookingQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Covers availability checks, which only ever look at active bookings of a room
+            models.Index(fields=('room', 'checkin_date', 'checkout_date'), condition=models.Q(status=0),
+                         name='booking_room_dates_booked_idx'),
+        ]
+
     def __str__(self):
         return f"Booking on room №{self.room.number} on dates: {self.checkin_date} - {self.checkout_date}"
 
@@ -37,30 +57,121 @@ class Booking(models.Model):
         if 'update_fields' in kwargs:
             if 'status' in kwargs['update_fields'] and len(kwargs['update_fields']) == 1:
                 # Only updating the status, no need to perform room availability check
-                super().save(*args, **kwargs)
+                self._save_rejecting_overlaps(*args, **kwargs)
         else:
             # Other fields are being updated or it's a new booking, perform the usual checks
-            # Validate room existence
-            if not Room.objects.filter(number=self.room.number).exists():
-                raise ValidationError("Room with given room number doesn't exist.")
-
             # Validate dates
             difference = self.checkout_date - self.checkin_date
             if difference.days < 1:
                 raise ValidationError("Checkout date can't be earlier than 1 day after check-in.")
 
-            # Check room availability
-            if not self.room.is_room_available_for(self.checkin_date, self.checkout_date):
+            # Price the stay before the room is locked, so building rate tables doesn't hold up other bookings
+            # of the room
+            price = self._get_stay_price()
+
+            with transaction.atomic():
+                # Lock the room row, so bookings of the same room are checked and saved one at a time
+                # while bookings of other rooms go on in parallel
+                room = Room.objects.select_for_update().filter(pk=self.room_id).first()
+                if room is None:
+                    raise ValidationError("Room with given room number doesn't exist.")
+
+                # Check room availability, an edited booking can't overlap with itself
+                taken_nights = RoomNight.objects.filter(room=room, night__gte=self.checkin_date,
+                                                        night__lt=self.checkout_date)
+                if taken_nights.exclude(booking_id=self.pk).exists():
+                    raise ValidationError("Room unavailable for these dates.")
+
+                if price is not None:
+                    self.price = price
+
+                # Save the object
+                self._save_rejecting_overlaps(*args, **kwargs)
+
+    def _get_stay_price(self) -> Optional[Decimal]:
+        # With rates of the room type for the nights of the stay. Edits keep the price agreed on, unless they change
+        # the room or dates, then there is no new price
+        if not self._state.adding:
+            stored_stay = (Booking.objects.filter(pk=self.pk)
+                           .values_list('room_id', 'checkin_date', 'checkout_date').first())
+            if stored_stay == (self.room_id, self.checkin_date, self.checkout_date):
+                return None
+        try:
+            room = self.room
+        except Room.DoesNotExist:
+            raise ValidationError("Room with given room number doesn't exist.")
+        return rate_tables.stay_price(room.type_id, room.current_price, self.checkin_date, self.checkout_date)
+
+    def _save_rejecting_overlaps(self, *args, **kwargs):
+        # The database has the final word on overlaps, so a booking racing the check above still gets rejected
+        try:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+        except IntegrityError as e:
+            if is_overlap_error(e):
                 raise ValidationError("Room unavailable for these dates.")
+            raise
+
+
+class RoomNight(models.Model):
+    """
+    Night of a room taken by an active booking. Kept in step with bookings by bookings.signals in the same
+    transaction as the booking, so a room is free for a stay when it has no nights in it, and the unique
+    constraint rejects a second booking of a night on any database.
+    """
+    UNIQUE_CONSTRAINT_NAME = 'room_night_unique'
+
+    room = models.ForeignKey(to=Room, on_delete=models.CASCADE, null=False, blank=False)
+    night = models.DateField(null=False, blank=False)
+    booking = models.ForeignKey(to=Booking, on_delete=models.CASCADE, null=False, blank=False, related_name='nights')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('room', 'night'), name='room_night_unique'),
+        ]
+
+    def __str__(self):
+        return f"Room №{self.room.number} taken on {self.night}"
+
+    @classmethod
+    def for_stay(cls, booking_id: int, room_id: int, checkin_date: date, checkout_date: date) -> list:
+        return [cls(room_id=room_id, night=checkin_date + timedelta(days=i), booking_id=booking_id)
+                for i in range((checkout_date - checkin_date).days)]
+
+
+def is_overlap_error(error: IntegrityError) -> bool:
+    """Tells if saving bookings failed because a room would be booked twice for the same night"""
+    message = str(error)
+    # SQLite names the columns instead of the constraint
+    return (Booking.OVERLAP_CONSTRAINT_NAME in message or RoomNight.UNIQUE_CONSTRAINT_NAME in message
+            or f'{RoomNight._meta.db_table}.night' in message)
 
-            # Calculate price
-            self.price = self.room.current_price * difference.days
 
-            # Save the object
-            super().save(*args, **kwargs)
+class BookingArchive(models.Model):
+    """Closed booking moved out of the bookings table, so availability checks don't scan years of history"""
+    # Keeps id of the original booking
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(to=User, on_delete=models.CASCADE, null=False, blank=False)
+    room = models.ForeignKey(to=Room, on_delete=models.CASCADE, null=False, blank=False)
+    checkin_date = models.DateField(null=False, blank=False)
+    checkout_date = models.DateField(null=False, blank=False)
+    booking_date = models.DateTimeField(null=False, blank=False)
+    status = models.SmallIntegerField(choices=Booking.STATUSES)
+    price = models.DecimalField(decimal_places=2, max_digits=9, null=False, blank=False)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived booking on room №{self.room.number} on dates: {self.checkin_date} - {self.checkout_date}"
 
 
 class TelegramBooking:
+    # Fields read from a booking and its relations, for only() projections of querysets that build TelegramBooking
+    FIELDS = (
+        ('checkin_date', 'checkout_date', 'booking_date', 'status', 'price')
+        + tuple(f'user__{field}' for field in TelegramUser.FIELDS)
+        + tuple(f'room__{field}' for field in TelegramRoom.FIELDS)
+    )
+
     def __init__(self, booking: Booking):
         self.id = booking.id
         self.user = TelegramUser(booking.user)
@@ -0,0 +1,68 @@
+from datetime import date, timedelta
+
+import numpy as np
+
+from bookings.models import Booking
+from rooms.models import Room
+
+
+class OccupancyMatrix:
+    """
+    Rooms × nights boolean matrix of active bookings, loaded with a single query.
+
+    Answers "which rooms are free for each check-in date and stay length" for whole hotel at once:
+    a stay is free when the sum of its occupied nights is zero, and all those sums come from one cumulative sum.
+    """
+
+    def __init__(self, rooms_queryset=None, start_date: date = None, checkin_days: int = 90, max_nights: int = 14):
+        if rooms_queryset is None:
+            rooms_queryset = Room.objects.all()
+        self.start_date = start_date or date.today()
+        self.checkin_days = checkin_days
+        self.max_nights = max_nights
+        # Last check-in date plus the longest stay
+        self.nights = checkin_days + max_nights - 1
+
+        rooms = list(rooms_queryset.order_by('number').values_list('id', 'number'))
+        self.room_ids = np.array([room_id for room_id, _ in rooms], dtype=np.int64)
+        self.room_numbers = np.array([number for _, number in rooms], dtype=np.int64)
+        self.occupied = self._load_occupied()
+
+    def _load_occupied(self) -> np.ndarray:
+        end_date = self.start_date + timedelta(days=self.nights)
+        bookings = np.array(Booking.objects.filter(
+            status=Booking.BOOKED, room_id__in=self.room_ids.tolist(), checkout_date__gt=self.start_date,
+            checkin_date__lt=end_date,
+        ).values_list('room_id', 'checkin_date', 'checkout_date'), dtype=object).reshape(-1, 3)
+
+        # +1 column, so stays running past the window have somewhere to end
+        changes = np.zeros((len(self.room_ids), self.nights + 1), dtype=np.int32)
+        if len(bookings):
+            order = np.argsort(self.room_ids)
+            rows = order[np.searchsorted(self.room_ids, bookings[:, 0].astype(np.int64), sorter=order)]
+            first = np.array([(d - self.start_date).days for d in bookings[:, 1]]).clip(0, self.nights)
+            last = np.array([(d - self.start_date).days for d in bookings[:, 2]]).clip(0, self.nights)
+            np.add.at(changes, (rows, first), 1)
+            np.add.at(changes, (rows, last), -1)
+        return np.cumsum(changes, axis=1)[:, :self.nights] > 0
+
+    def availability(self) -> np.ndarray:
+        """
+        Boolean array of shape (rooms, checkin_days, max_nights),
+        where [room, day, nights - 1] tells if the room is free for `nights` nights from `start_date + day`
+        """
+        booked_before = np.zeros((len(self.room_ids), self.nights + 1), dtype=np.int32)
+        np.cumsum(self.occupied, axis=1, out=booked_before[:, 1:])
+
+        checkin = np.arange(self.checkin_days)[:, None]
+        checkout = checkin + np.arange(1, self.max_nights + 1)[None, :]
+        # Occupied nights of every stay by the sliding window sum
+        booked_nights = booked_before[:, checkout] - booked_before[:, checkin]
+        return booked_nights == 0
+
+    def available_rooms(self, checkin_date: date, nights: int) -> list:
+        day = (checkin_date - self.start_date).days
+        if not 0 <= day < self.checkin_days or not 1 <= nights <= self.max_nights:
+            raise ValueError("Stay is outside the loaded window")
+        free = ~self.occupied[:, day:day + nights].any(axis=1)
+        return self.room_numbers[free].tolist()
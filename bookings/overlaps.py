@@ -0,0 +1,40 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Status values as stored, so migrations can pass their historical Booking model
+BOOKED = 0
+CANCELED = 1
+
+
+def cancel_overlapping_bookings(booking_model, batch_size: int = 1000) -> list:
+    """
+    Cancels active bookings sharing a night with an active booking of the same room made before them, so the guest
+    who booked first keeps the room. Every canceled booking is logged with the booking it overlapped.
+
+    Needed before anything that relies on rooms never being booked twice, e.g. the exclusion constraint and nights
+    table, can be added to a database that already has double bookings. Returns ids of canceled bookings.
+    """
+    stays = (booking_model.objects.filter(status=BOOKED).order_by('room_id', 'booking_date', 'id')
+             .values_list('id', 'room_id', 'checkin_date', 'checkout_date'))
+    canceled = []
+    room_id = None
+    kept = []
+    for booking_id, stay_room_id, checkin_date, checkout_date in stays.iterator(chunk_size=2000):
+        if stay_room_id != room_id:
+            room_id = stay_room_id
+            kept = []
+        overlapped = next((kept_id for kept_id, kept_checkin, kept_checkout in kept
+                           if kept_checkin < checkout_date and checkin_date < kept_checkout), None)
+        if overlapped is None:
+            kept.append((booking_id, checkin_date, checkout_date))
+            continue
+        logger.warning("Booking %s of room %s (%s - %s) overlaps booking %s made before it and is canceled",
+                       booking_id, room_id, checkin_date, checkout_date, overlapped)
+        canceled.append(booking_id)
+
+    for i in range(0, len(canceled), batch_size):
+        booking_model.objects.filter(id__in=canceled[i:i + batch_size]).update(status=CANCELED)
+    if canceled:
+        logger.warning("Canceled %s overlapping bookings", len(canceled))
+    return canceled
@@ -0,0 +1,60 @@
+import time
+
+from django.db import transaction
+from django.db.models import Max, Min
+
+from bookings.models import Booking, RoomNight
+
+
+def rebuild_room_nights(batch_size: int = 5000) -> dict:
+    """
+    Rebuilds RoomNight rows from active bookings, for bookings changed without signals, e.g. with queryset update().
+
+    Bookings are walked in batches of consecutive ids, nights of each batch are deleted and inserted again in its own
+    transaction with the bookings locked, so availability checks keep working while the table is rebuilt.
+    """
+    active_bookings = Booking.objects.filter(status=Booking.BOOKED).order_by('id')
+
+    started = time.perf_counter()
+    _delete_nights_of_closed_bookings(batch_size)
+    bookings = nights = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            stays = list(active_bookings.filter(id__gt=last_id).select_for_update()
+                         .values_list('id', 'room_id', 'checkin_date', 'checkout_date')[:batch_size])
+            # Nights of bookings in the batch and of inactive bookings in between
+            batch_nights = RoomNight.objects.filter(booking_id__gt=last_id)
+            if stays:
+                batch_nights = batch_nights.filter(booking_id__lte=stays[-1][0])
+            batch_nights.delete()
+            if not stays:
+                break
+            created = RoomNight.objects.bulk_create([night for stay in stays for night in RoomNight.for_stay(*stay)],
+                                                    batch_size=10_000)
+        bookings += len(stays)
+        nights += len(created)
+        last_id = stays[-1][0]
+
+    seconds = time.perf_counter() - started
+    return {
+        'bookings': bookings,
+        'nights': nights,
+        'seconds': seconds,
+        'rows_per_second': nights / seconds if seconds else 0.0,
+    }
+
+
+def _delete_nights_of_closed_bookings(batch_size: int) -> None:
+    # Nights left by bookings canceled or expired with update() would clash with the ones of later bookings
+    id_range = RoomNight.objects.aggregate(first=Min('booking_id'), last=Max('booking_id'))
+    if id_range['first'] is None:
+        return
+    closed_bookings = Booking.objects.filter(status__in=(Booking.CANCELED, Booking.EXPIRED))
+    for batch_start in range(id_range['first'], id_range['last'] + 1, batch_size):
+        # Ids are read first, deleting with a join is planned as a nested loop over both tables when statistics
+        # are behind
+        ids = list(closed_bookings.filter(id__gte=batch_start, id__lt=batch_start + batch_size)
+                   .values_list('id', flat=True))
+        if ids:
+            RoomNight.objects.filter(booking_id__in=ids).delete()
@@ -0,0 +1,81 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from bookings.calendar import availability_calendar
+from bookings.inventory import room_type_inventory
+from bookings.models import Booking, RoomNight
+from rooms.models import Room
+from rooms.pricing import rate_tables
+from rooms.search_cache import search_cache
+
+
+def _get_stay(booking: Booking) -> tuple:
+    # Read straight from __dict__, so deferred fields are not loaded just for this
+    fields = booking.__dict__
+    return fields.get('room_id'), fields.get('checkin_date'), fields.get('checkout_date'), fields.get('status')
+
+
+def _is_active(stay) -> bool:
+    return stay is not None and stay[3] == Booking.BOOKED and None not in stay
+
+
+def _invalidate_searches(previous_stay, current_stay) -> None:
+    for stay in (previous_stay, current_stay):
+        if _is_active(stay):
+            search_cache.invalidate_dates(stay[1], stay[2])
+
+
+def _update_calendar(previous_stay, current_stay) -> None:
+    # Room type inventory and occupancy based rates count the same nights, so they follow along
+    for calendar in (availability_calendar, room_type_inventory, rate_tables):
+        if _is_active(previous_stay):
+            calendar.release(*previous_stay[:3])
+        if _is_active(current_stay):
+            calendar.occupy(*current_stay[:3])
+        calendar.bump_version()
+    # Searches computed before commit could still see the old bookings
+    _invalidate_searches(previous_stay, current_stay)
+
+
+def _update_room_nights(booking: Booking, created: bool, previous_stay, current_stay) -> None:
+    # Runs inside the transaction saving the booking, so a night taken twice rolls the booking back
+    if getattr(booking, '_room_nights_saved', False):
+        # Already inserted together with the booking, e.g. by bulk booking
+        booking._room_nights_saved = False
+        return
+    if not created and previous_stay != current_stay:
+        RoomNight.objects.filter(booking_id=booking.pk).delete()
+    if (created or previous_stay != current_stay) and _is_active(current_stay):
+        RoomNight.objects.bulk_create(RoomNight.for_stay(booking.pk, *current_stay[:3]))
+
+
+@receiver(post_init, sender=Booking)
+def remember_stay(sender, instance, **kwargs):
+    instance._saved_stay = _get_stay(instance)
+
+
+@receiver(post_save, sender=Booking)
+def update_availability_on_save(sender, instance, created, **kwargs):
+    previous_stay = None if created else instance._saved_stay
+    current_stay = _get_stay(instance)
+    instance._saved_stay = current_stay
+    _update_room_nights(instance, created, previous_stay, current_stay)
+    _invalidate_searches(previous_stay, current_stay)
+    transaction.on_commit(lambda: _update_calendar(previous_stay, current_stay))
+
+
+@receiver(post_delete, sender=Booking)
+def update_availability_on_delete(sender, instance, **kwargs):
+    # Nights of the booking are deleted with it by the foreign key
+    previous_stay = instance._saved_stay
+    _invalidate_searches(previous_stay, None)
+    transaction.on_commit(lambda: _update_calendar(previous_stay, None))
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def reload_room_type_inventory(sender, **kwargs):
+    # Rooms of a type are counted once when the inventory loads, a new, removed or retyped room needs a reload.
+    # Once the room is committed, right away outside a transaction
+    transaction.on_commit(room_type_inventory.reload_everywhere)
@@ -0,0 +1,520 @@
+import csv
+import gzip
+import json
+import os
+import random
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+
+from bookings.archive import archive_closed_bookings
+from bookings.bulk import book_rooms_in_bulk
+from bookings.calendar import availability_calendar
+from bookings.checks import check_shared_caches
+from bookings.expiry import expire_finished_bookings
+from bookings.inventory import (MinSegmentTree, get_free_rooms_by_type,
+                                room_type_inventory)
+from bookings.management.commands._seeding import seed_hotel
+from bookings.models import Booking, BookingArchive, RoomNight
+from bookings.occupancy import OccupancyMatrix
+from bookings.overlaps import cancel_overlapping_bookings
+from bookings.room_nights import rebuild_room_nights
+from bookings.views import (book_room, cancel_user_booking,
+                            get_user_active_bookings)
+from RoomBooking.testing import QueryBudgetMixin
+from rooms.models import Room, RoomType
+from users.models import TelegramUser, User
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "Row locking needs PostgreSQL")
+class ConcurrentBookingTestCase(TransactionTestCase):
+    ATTEMPTS = 200
+    WORKERS = 32
+
+    def setUp(self):
+        self.user = TelegramUser(User.objects.create(first_name='Test', last_name='User', username='test',
+                                                     email='test@test.com'))
+        room_type = RoomType.objects.create(name='Single')
+        self.rooms = [Room.objects.create(number=100 + i, type=room_type, current_price=Decimal('1000.00'),
+                                          capacity=1) for i in range(self.ATTEMPTS)]
+        self.checkin_date = date.today() + timedelta(days=10)
+
+    def _book(self, room_number: int, checkin_date: date, checkout_date: date) -> bool:
+        try:
+            book_room(self.user, room_number, checkin_date, checkout_date)
+            return True
+        except ValidationError:
+            return False
+        finally:
+            connection.close()
+
+    def _book_concurrently(self, stays: list) -> list:
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as executor:
+            return list(executor.map(lambda stay: self._book(*stay), stays))
+
+    def test_only_one_of_identical_bookings_wins(self):
+        stay = (self.rooms[0].number, self.checkin_date, self.checkin_date + timedelta(days=2))
+        results = self._book_concurrently([stay] * self.ATTEMPTS)
+
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(Booking.objects.filter(room=self.rooms[0], status=Booking.BOOKED).count(), 1)
+
+    def test_every_night_is_booked_at_most_once(self):
+        stays = []
+        for _ in range(self.ATTEMPTS):
+            checkin_date = self.checkin_date + timedelta(days=random.randint(0, 30))
+            stays.append((self.rooms[0].number, checkin_date, checkin_date + timedelta(days=random.randint(1, 5))))
+        self._book_concurrently(stays)
+
+        booked_nights = []
+        for booking in Booking.objects.filter(room=self.rooms[0], status=Booking.BOOKED):
+            nights = (booking.checkout_date - booking.checkin_date).days
+            booked_nights.extend(booking.checkin_date + timedelta(days=i) for i in range(nights))
+        self.assertTrue(booked_nights)
+        self.assertEqual(len(booked_nights), len(set(booked_nights)))
+
+    def test_bookings_of_different_rooms_do_not_block_each_other(self):
+        stays = [(room.number, self.checkin_date, self.checkin_date + timedelta(days=2)) for room in self.rooms]
+        results = self._book_concurrently(stays)
+
+        self.assertTrue(all(results))
+        self.assertEqual(Booking.objects.filter(status=Booking.BOOKED).count(), len(self.rooms))
+
+    def test_bulk_and_single_bookings_never_share_a_room(self):
+        user = User.objects.get(username='test')
+        checkout_date = self.checkin_date + timedelta(days=2)
+        numbers = [room.number for room in self.rooms[:20]]
+
+        def book(i):
+            try:
+                if i % 2:
+                    return self._book(random.choice(numbers), self.checkin_date, checkout_date)
+                book_rooms_in_bulk(user, self.checkin_date, checkout_date, random.sample(numbers, 5), partial=True)
+                return True
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as executor:
+            list(executor.map(book, range(self.ATTEMPTS)))
+
+        booked_rooms = list(Booking.objects.filter(status=Booking.BOOKED).values_list('room_id', flat=True))
+        self.assertEqual(len(booked_rooms), 20)
+        self.assertEqual(len(booked_rooms), len(set(booked_rooms)))
+
+
+class OverlappingBookingsTestCase(TestCase):
+    def test_later_of_overlapping_bookings_is_canceled(self):
+        user = User.objects.create(first_name='Test', last_name='User', username='test', email='test@test.com')
+        room_type = RoomType.objects.create(name='Single')
+        room = Room.objects.create(number=100, type=room_type, current_price=Decimal('1000.00'), capacity=1)
+        other_room = Room.objects.create(number=101, type=room_type, current_price=Decimal('1000.00'), capacity=1)
+        checkin_date = date.today() + timedelta(days=1)
+        # Double bookings as left by the time nothing prevented them, saved without any checks
+        stays = [(room, 2, 4), (room, 1, 3), (room, 0, 2), (other_room, 1, 3)]
+        bookings = Booking.objects.bulk_create(
+            Booking(user=user, room=room, checkin_date=checkin_date + timedelta(days=start),
+                    checkout_date=checkin_date + timedelta(days=end), price=Decimal('1000.00'))
+            for room, start, end in stays)
+        # The last one created was made first
+        for days, booking in enumerate(reversed(bookings)):
+            Booking.objects.filter(pk=booking.pk).update(booking_date=booking.booking_date + timedelta(days=days))
+
+        with self.assertLogs('bookings.overlaps', 'WARNING'):
+            canceled = cancel_overlapping_bookings(Booking)
+
+        self.assertEqual(canceled, [bookings[1].pk])
+        active_bookings = Booking.objects.filter(status=Booking.BOOKED).order_by('id')
+        self.assertEqual(list(active_bookings.values_list('id', flat=True)),
+                         [bookings[0].pk, bookings[2].pk, bookings[3].pk])
+        self.assertEqual(cancel_overlapping_bookings(Booking), [])
+
+
+@override_settings(DEBUG=False)
+class SharedCacheCheckTestCase(SimpleTestCase):
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_process_local_caches_are_reported(self):
+        self.assertEqual([error.id for error in check_shared_caches(None)], ['bookings.W001'])
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+                                           'LOCATION': 'cache_table'}})
+    def test_shared_caches_pass(self):
+        self.assertEqual(check_shared_caches(None), [])
+
+
+class AvailabilityCalendarTestCase(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create(first_name='Test', last_name='User', username='test', email='test@test.com')
+        room_type = RoomType.objects.create(name='Single')
+        self.room = Room.objects.create(number=100, type=room_type, current_price=Decimal('1000.00'), capacity=1)
+        self.other_room = Room.objects.create(number=101, type=room_type, current_price=Decimal('1000.00'),
+                                              capacity=1)
+        self.checkin_date = date.today() + timedelta(days=10)
+        self.checkout_date = self.checkin_date + timedelta(days=3)
+        availability_calendar.load()
+
+    def _book(self, room: Room, checkin_date: date, checkout_date: date) -> Booking:
+        with self.captureOnCommitCallbacks(execute=True):
+            return Booking.objects.create(user=self.user, room=room, checkin_date=checkin_date,
+                                          checkout_date=checkout_date, price=Decimal('1.00'))
+
+    def test_calendar_follows_bookings(self):
+        booking = self._book(self.room, self.checkin_date, self.checkout_date)
+        self._book(self.other_room, self.checkin_date, self.checkout_date)
+
+        self.assertFalse(availability_calendar.is_available(self.room.id, self.checkout_date - timedelta(days=1),
+                                                            self.checkout_date + timedelta(days=1)))
+        self.assertTrue(availability_calendar.is_available(self.room.id, self.checkout_date,
+                                                           self.checkout_date + timedelta(days=1)))
+        self.assertEqual(availability_calendar.occupied_room_ids(self.checkin_date, self.checkout_date),
+                         {self.room.id, self.other_room.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cancel_user_booking(TelegramUser(self.user), booking.id)
+        self.assertTrue(availability_calendar.is_available(self.room.id, self.checkin_date, self.checkout_date))
+        self.assertEqual(availability_calendar.verify(), [])
+
+    def test_calendar_follows_edits_and_deletes(self):
+        booking = self._book(self.room, self.checkin_date, self.checkout_date)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.room = self.other_room
+            booking.checkin_date += timedelta(days=1)
+            booking.save()
+        self.assertTrue(availability_calendar.is_available(self.room.id, self.checkin_date, self.checkout_date))
+        self.assertFalse(availability_calendar.is_available(self.other_room.id, self.checkin_date,
+                                                            self.checkout_date))
+        self.assertEqual(availability_calendar.verify(), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.get(id=booking.id).delete()
+        self.assertEqual(availability_calendar.occupied_room_ids(self.checkin_date, self.checkout_date), set())
+        self.assertEqual(availability_calendar.verify(), [])
+
+    def test_active_bookings_stay_within_query_budget(self):
+        for room in (self.room, self.other_room):
+            self._book(room, self.checkin_date, self.checkout_date)
+
+        with self.assertMaxQueries(1):
+            bookings = get_user_active_bookings(TelegramUser(self.user))
+            self.assertEqual(sorted(str(booking) for booking in bookings), [
+                f"Booking on room №{room.number} on dates: {self.checkin_date} - {self.checkout_date}"
+                for room in (self.room, self.other_room)
+            ])
+            self.assertEqual(bookings[0].room.type, 'Single')
+
+    def test_stays_outside_window_are_left_to_database(self):
+        checkin_date = date.today() + timedelta(days=availability_calendar.window_days)
+        self.assertIsNone(availability_calendar.is_available(self.room.id, checkin_date,
+                                                             checkin_date + timedelta(days=1)))
+
+
+class RoomTypeInventoryTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(first_name='Test', last_name='User', username='test', email='test@test.com')
+        self.room_type = RoomType.objects.create(name='Suite')
+        self.rooms = [Room.objects.create(number=number, type=self.room_type, current_price=Decimal('1000.00'),
+                                          capacity=4) for number in range(100, 103)]
+        self.checkin_date = date.today() + timedelta(days=10)
+        self.checkout_date = self.checkin_date + timedelta(days=3)
+
+    def _book(self, room: Room, checkin_date: date, checkout_date: date) -> Booking:
+        with self.captureOnCommitCallbacks(execute=True):
+            return Booking.objects.create(user=self.user, room=room, checkin_date=checkin_date,
+                                          checkout_date=checkout_date)
+
+    def test_segment_tree_matches_brute_force(self):
+        values = [random.randint(0, 5) for _ in range(37)]
+        tree = MinSegmentTree(values)
+        for _ in range(500):
+            start = random.randrange(len(values))
+            end = random.randint(start + 1, len(values))
+            if random.random() < 0.5:
+                value = random.choice((-1, 1))
+                tree.add(start, end, value)
+                values[start:end] = [count + value for count in values[start:end]]
+            else:
+                self.assertEqual(tree.min(start, end), min(values[start:end]))
+
+    def test_inventory_follows_bookings(self):
+        room_type_inventory.load()
+        self.assertEqual(room_type_inventory.free_rooms(self.checkin_date, self.checkout_date),
+                         {self.room_type.id: 3})
+
+        booking = self._book(self.rooms[0], self.checkin_date, self.checkout_date)
+        self._book(self.rooms[1], self.checkout_date - timedelta(days=1), self.checkout_date + timedelta(days=1))
+        self.assertEqual(room_type_inventory.free_rooms(self.checkin_date, self.checkout_date),
+                         {self.room_type.id: 1})
+        self.assertEqual(room_type_inventory.free_rooms(self.checkin_date, self.checkout_date - timedelta(days=1)),
+                         {self.room_type.id: 2})
+        self.assertEqual(room_type_inventory.verify(), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cancel_user_booking(TelegramUser(self.user), booking.id)
+        self.assertEqual(room_type_inventory.free_rooms(self.checkin_date, self.checkout_date),
+                         {self.room_type.id: 2})
+
+        # Rooms added later are counted too
+        with self.captureOnCommitCallbacks(execute=True):
+            Room.objects.create(number=103, type=self.room_type, current_price=Decimal('1000.00'), capacity=2)
+        self.assertEqual(room_type_inventory.free_rooms(self.checkin_date, self.checkout_date),
+                         {self.room_type.id: 3})
+        self.assertEqual(room_type_inventory.capacities(), {self.room_type.id: 2})
+        self.assertEqual(room_type_inventory.verify(), [])
+
+    def test_parties_are_counted_against_rooms_holding_them(self):
+        Room.objects.create(number=103, type=self.room_type, current_price=Decimal('1000.00'), capacity=2)
+        Room.objects.create(number=104, type=self.room_type, current_price=Decimal('1000.00'), capacity=6)
+        room_type_inventory.load()
+        self._book(self.rooms[0], self.checkin_date, self.checkout_date)
+
+        self.assertEqual(room_type_inventory.free_rooms(self.checkin_date, self.checkout_date), {self.room_type.id: 4})
+        self.assertEqual(room_type_inventory.free_rooms(self.checkin_date, self.checkout_date, capacity=3),
+                         {self.room_type.id: 3})
+        self.assertEqual(room_type_inventory.free_rooms(self.checkin_date, self.checkout_date, capacity=5),
+                         {self.room_type.id: 1})
+        self.assertEqual(room_type_inventory.free_rooms(self.checkin_date, self.checkout_date, capacity=7), {})
+        self.assertEqual(room_type_inventory.verify(), [])
+
+        # Past the window the nights table gives the same answer
+        checkin_date = date.today() + timedelta(days=room_type_inventory.window_days)
+        self._book(self.rooms[1], checkin_date, checkin_date + timedelta(days=1))
+        self.assertEqual(get_free_rooms_by_type(checkin_date, checkin_date + timedelta(days=1), capacity=3),
+                         {self.room_type.id: 3})
+
+    def test_stays_outside_window_are_counted_in_database(self):
+        checkin_date = date.today() + timedelta(days=room_type_inventory.window_days)
+        checkout_date = checkin_date + timedelta(days=2)
+        self._book(self.rooms[0], checkin_date, checkout_date)
+        self.assertIsNone(room_type_inventory.free_rooms(checkin_date, checkout_date))
+        self.assertEqual(get_free_rooms_by_type(checkin_date, checkout_date), {self.room_type.id: 2})
+
+
+class ExportBookingsTestCase(TestCase):
+    def setUp(self):
+        user = User.objects.create(first_name='Test', last_name='User', username='test', email='test@test.com')
+        room_type = RoomType.objects.create(name='Single')
+        room = Room.objects.create(number=100, type=room_type, current_price=Decimal('1000.00'), capacity=1)
+        checkin_date = date.today() - timedelta(days=60)
+        for days in range(0, 1200, 2):
+            Booking.objects.create(user=user, room=room, checkin_date=checkin_date + timedelta(days=days),
+                                   checkout_date=checkin_date + timedelta(days=days + 1))
+        # Some of the history is in the archive already
+        Booking.objects.filter(checkout_date__lte=date.today()).update(status=Booking.EXPIRED)
+        archive_closed_bookings(older_than_days=40, batch_size=10)
+
+    def test_command_exports_bookings_in_chunks(self):
+        self.assertEqual(BookingArchive.objects.count(), 10)
+        ids = sorted(list(Booking.objects.values_list('id', flat=True))
+                     + list(BookingArchive.objects.values_list('id', flat=True)))
+        path = os.path.join(tempfile.mkdtemp(), 'bookings.csv.gz')
+
+        call_command('export_bookings', output=path, gzip=True, chunk_size=100, stderr=StringIO())
+
+        with gzip.open(path, 'rt') as file:
+            rows = list(csv.DictReader(file))
+        self.assertEqual(len(rows), 600)
+        self.assertEqual(sorted(int(row['id']) for row in rows), ids)
+        self.assertEqual({row['status'] for row in rows}, {'Booked', 'Expired'})
+
+        out = StringIO()
+        call_command('export_bookings', format='ndjson', status=['expired'], stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 30)
+
+
+class RoomNightTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(first_name='Test', last_name='User', username='test', email='test@test.com')
+        room_type = RoomType.objects.create(name='Single')
+        self.room = Room.objects.create(number=100, type=room_type, current_price=Decimal('1000.00'), capacity=1)
+        self.other_room = Room.objects.create(number=101, type=room_type, current_price=Decimal('1000.00'),
+                                              capacity=1)
+        self.checkin_date = date.today() + timedelta(days=10)
+        self.checkout_date = self.checkin_date + timedelta(days=3)
+
+    def _nights(self) -> list:
+        return list(RoomNight.objects.order_by('room__number', 'night').values_list('room__number', 'night',
+                                                                                    'booking_id'))
+
+    def _expected_nights(self, *bookings) -> list:
+        return sorted((booking.room.number, booking.checkin_date + timedelta(days=i), booking.id)
+                      for booking in bookings for i in range((booking.checkout_date - booking.checkin_date).days))
+
+    def test_nights_follow_bookings(self):
+        book_room(TelegramUser(self.user), self.room.number, self.checkin_date, self.checkout_date)
+        booking = Booking.objects.get()
+        self.assertEqual(self._nights(), self._expected_nights(booking))
+        self.assertFalse(self.room.is_room_available_for(self.checkout_date - timedelta(days=1),
+                                                         self.checkout_date))
+        self.assertTrue(self.room.is_room_available_for(self.checkout_date, self.checkout_date + timedelta(days=1)))
+
+        booking.room = self.other_room
+        booking.checkin_date += timedelta(days=1)
+        booking.save()
+        self.assertEqual(self._nights(), self._expected_nights(booking))
+        self.assertEqual(list(Room.objects.available_for(self.checkin_date, self.checkout_date)), [self.room])
+
+        cancel_user_booking(TelegramUser(self.user), booking.id)
+        self.assertEqual(self._nights(), [])
+
+        booking = Booking.objects.get(id=booking.id)
+        booking.status = Booking.BOOKED
+        booking.save(update_fields=['status'])
+        self.assertEqual(self._nights(), self._expected_nights(booking))
+        booking.delete()
+        self.assertEqual(self._nights(), [])
+
+    def test_night_cannot_be_booked_twice(self):
+        booking = Booking.objects.create(user=self.user, room=self.room, checkin_date=self.checkin_date,
+                                         checkout_date=self.checkout_date, price=Decimal('1.00'))
+        booking.status = Booking.CANCELED
+        booking.save(update_fields=['status'])
+        Booking.objects.create(user=self.user, room=self.room, checkin_date=self.checkout_date - timedelta(days=1),
+                               checkout_date=self.checkout_date + timedelta(days=1), price=Decimal('1.00'))
+
+        # Taking the booking back skips the availability check, the unique constraint still rejects it
+        booking.status = Booking.BOOKED
+        with self.assertRaisesMessage(ValidationError, "Room unavailable for these dates."):
+            booking.save(update_fields=['status'])
+        self.assertEqual(Booking.objects.get(id=booking.id).status, Booking.CANCELED)
+
+    def test_rebuild_restores_nights_of_active_bookings(self):
+        bookings = [Booking.objects.create(user=self.user, room=room, price=Decimal('1.00'),
+                                           checkin_date=self.checkin_date + timedelta(days=i),
+                                           checkout_date=self.checkout_date + timedelta(days=i))
+                    for i, room in enumerate((self.room, self.other_room))]
+        # Queryset updates send no signals and leave the nights behind
+        Booking.objects.filter(id=bookings[0].id).update(status=Booking.CANCELED)
+        Booking.objects.filter(id=bookings[1].id).update(checkin_date=self.checkin_date)
+        RoomNight.objects.create(room=self.room, night=self.checkin_date - timedelta(days=1), booking=bookings[1])
+
+        result = rebuild_room_nights(batch_size=1)
+
+        bookings[1].refresh_from_db()
+        self.assertEqual(result['bookings'], 1)
+        self.assertEqual(result['nights'], 4)
+        self.assertEqual(self._nights(), self._expected_nights(bookings[1]))
+
+
+class OccupancyMatrixTestCase(TestCase):
+    def setUp(self):
+        user = User.objects.create(first_name='Test', last_name='User', username='test', email='test@test.com')
+        room_type = RoomType.objects.create(name='Single')
+        self.rooms = [Room.objects.create(number=100 + i, type=room_type, current_price=Decimal('1000.00'),
+                                          capacity=1) for i in range(5)]
+        self.start_date = date.today() + timedelta(days=1)
+        for i, room in enumerate(self.rooms[:4]):
+            Booking.objects.create(user=user, room=room, checkin_date=self.start_date + timedelta(days=i * 3),
+                                   checkout_date=self.start_date + timedelta(days=i * 3 + i + 1), price=Decimal('1.00'))
+
+    def test_matrix_matches_room_availability(self):
+        matrix = OccupancyMatrix(start_date=self.start_date, checkin_days=20, max_nights=7)
+        availability = matrix.availability()
+
+        self.assertEqual(availability.shape, (5, 20, 7))
+        for day in range(20):
+            checkin_date = self.start_date + timedelta(days=day)
+            for nights in range(1, 8):
+                checkout_date = checkin_date + timedelta(days=nights)
+                expected = [room.number for room in self.rooms
+                            if room.is_room_available_for(checkin_date, checkout_date)]
+                self.assertEqual(matrix.room_numbers[availability[:, day, nights - 1]].tolist(), expected)
+                self.assertEqual(matrix.available_rooms(checkin_date, nights), expected)
+
+
+class ExpireBookingsTestCase(TestCase):
+    def test_only_finished_active_bookings_expire(self):
+        user = User.objects.create(first_name='Test', last_name='User', username='test', email='test@test.com')
+        room_type = RoomType.objects.create(name='Single')
+        room = Room.objects.create(number=100, type=room_type, current_price=Decimal('1000.00'), capacity=1)
+        today = date.today()
+        bookings = Booking.objects.bulk_create([
+            Booking(user=user, room=room, checkin_date=today - timedelta(days=30 - i * 2),
+                    checkout_date=today - timedelta(days=29 - i * 2), price=Decimal('1.00'),
+                    status=Booking.CANCELED if i % 5 == 0 else Booking.BOOKED)
+            for i in range(15)
+        ] + [
+            Booking(user=user, room=room, checkin_date=today, checkout_date=today + timedelta(days=1),
+                    price=Decimal('1.00')),
+        ])
+
+        RoomNight.objects.bulk_create([night for booking in bookings if booking.status == Booking.BOOKED
+                                       for night in RoomNight.for_stay(booking.id, room.id, booking.checkin_date,
+                                                                       booking.checkout_date)])
+
+        result = expire_finished_bookings(batch_size=4, today=today)
+
+        self.assertEqual(result['expired'], 12)
+        self.assertEqual(list(RoomNight.objects.values_list('booking_id', flat=True)), [bookings[-1].id])
+        self.assertEqual(Booking.objects.filter(status=Booking.EXPIRED).count(), 12)
+        self.assertEqual(Booking.objects.filter(status=Booking.CANCELED).count(), 3)
+        self.assertEqual(list(Booking.objects.filter(status=Booking.BOOKED)), [bookings[-1]])
+        self.assertEqual(expire_finished_bookings(today=today)['expired'], 0)
+
+
+class ArchiveBookingsTestCase(TestCase):
+    def test_only_old_closed_bookings_are_archived(self):
+        user = User.objects.create(first_name='Test', last_name='User', username='test', email='test@test.com')
+        room_type = RoomType.objects.create(name='Single')
+        room = Room.objects.create(number=100, type=room_type, current_price=Decimal('1000.00'), capacity=1)
+        today = date.today()
+        Booking.objects.bulk_create([
+            Booking(user=user, room=room, checkin_date=today - timedelta(days=100 - i * 2),
+                    checkout_date=today - timedelta(days=99 - i * 2), price=Decimal('1.00'),
+                    status=(Booking.BOOKED, Booking.CANCELED, Booking.EXPIRED)[i % 3])
+            for i in range(45)
+        ])
+        closed_ids = set(Booking.objects.filter(status__in=(Booking.CANCELED, Booking.EXPIRED),
+                                                checkout_date__lt=today - timedelta(days=30))
+                         .values_list('id', flat=True))
+
+        result = archive_closed_bookings(older_than_days=30, batch_size=4, today=today)
+
+        self.assertEqual(result['archived'], len(closed_ids))
+        self.assertEqual(set(BookingArchive.objects.values_list('id', flat=True)), closed_ids)
+        self.assertFalse(Booking.objects.filter(id__in=closed_ids).exists())
+        self.assertEqual(Booking.objects.count(), 45 - len(closed_ids))
+        self.assertEqual(Booking.objects.filter(status=Booking.BOOKED).count(), 15)
+        self.assertEqual(archive_closed_bookings(today=today)['archived'], 0)
+
+
+class BenchmarkSuiteTestCase(TestCase):
+    def test_generated_hotel_is_consistent(self):
+        random.seed(1)
+        result = seed_hotel(rooms_count=20, bookings_count=500, users_count=5, today=date.today())
+
+        self.assertEqual(len(result['rooms']), 20)
+        self.assertEqual(Booking.objects.count(), 500)
+        self.assertEqual(set(Booking.objects.filter(status=Booking.EXPIRED).values_list('checkout_date', flat=True)
+                             .distinct()) - {day for day in (date.today() - timedelta(days=i) for i in range(400))},
+                         set())
+        nights = {}
+        for booking in Booking.objects.filter(status=Booking.BOOKED):
+            for i in range((booking.checkout_date - booking.checkin_date).days):
+                self.assertNotIn((booking.room_id, booking.checkin_date + timedelta(days=i)), nights)
+                nights[booking.room_id, booking.checkin_date + timedelta(days=i)] = booking.id
+        self.assertEqual(RoomNight.objects.count(), len(nights))
+
+    def test_suite_reports_every_benchmark(self):
+        seed_hotel(rooms_count=10, bookings_count=100, users_count=2, today=date.today())
+        out = StringIO()
+
+        call_command('benchmark_suite', repeat=5, skip_http=True, stdout=out)
+
+        results = json.loads(out.getvalue())
+        self.assertEqual(results['data']['bookings'], 100)
+        self.assertEqual(set(results['benchmarks']), {
+            'get_available_rooms', 'get_available_rooms_cached', 'is_room_available_for', 'free_rooms_by_type',
+            'booking_save', 'room_serializer_100', 'booking_serializer_100',
+        })
+        self.assertEqual(results['benchmarks']['is_room_available_for']['queries_per_call'], 1)
+        # Bookings made by the benchmark are rolled back
+        self.assertEqual(Booking.objects.count(), 100)
@@ -3,14 +3,15 @@ from datetime import date
 from django.core.exceptions import ValidationError
 
 from bookings.models import Booking, TelegramBooking
+from RoomBooking.sync_pool import run_in_sync_pool
 from rooms.models import Room
 from users.models import TelegramUser, User
 
 
 def get_user_active_bookings(user: TelegramUser) -> list:
-    user = User.objects.get(username=user.username)
-    return [TelegramBooking(booking) for booking in Booking.objects.filter(user=user) if
-            booking.status == Booking.BOOKED]
+    bookings = Booking.objects.filter(user__username=user.username, status=Booking.BOOKED) \
+        .select_related('user', 'room__type').only(*TelegramBooking.FIELDS)
+    return [TelegramBooking(booking) for booking in bookings]
 
 
 def cancel_user_booking(user: TelegramUser, booking_id: int) -> None:
@@ -27,7 +28,7 @@ def cancel_user_booking(user: TelegramUser, booking_id: int) -> None:
 
     # Cancel booking
     booking.status = Booking.CANCELED
-    booking.save()
+    booking.save(update_fields=['status'])
 
 
 def book_room(user: TelegramUser, room_number: int, checkin_date: date, checkout_date: date) -> None:
@@ -43,13 +44,50 @@ def book_room(user: TelegramUser, room_number: int, checkin_date: date, checkout
     if checkin_date < date.today() or checkout_date < date.today():
         raise ValidationError("Can't book rooms for the past")
 
-    # Check if room is available for these dates or booking for this room is canceled
-    if not room.is_room_available_for(checkin_date, checkout_date):
-        raise ValidationError("Room unavailable for these dates")
-
-    # creates booking
+    # creates booking, availability is checked and price calculated by Booking.save while holding a lock on the room
     user = User.objects.get(username=user.username)
-    Booking.objects.create(user=user, room=room, checkin_date=checkin_date, checkout_date=checkout_date,
-                           price=room.current_price * difference.days)
+    Booking.objects.create(user=user, room=room, checkin_date=checkin_date, checkout_date=checkout_date)
+
+
+# Async counterparts for the telegram bot. Saving a booking locks the room inside a transaction,
+# which the async ORM can't do, so it goes to the sync pool
+async def aget_user_active_bookings(user: TelegramUser) -> list:
+    bookings = Booking.objects.filter(user__username=user.username, status=Booking.BOOKED) \
+        .select_related('user', 'room__type').only(*TelegramBooking.FIELDS)
+    return [TelegramBooking(booking) async for booking in bookings]
+
+
+async def acancel_user_booking(user: TelegramUser, booking_id: int) -> None:
+    # Validate booking id
+    try:
+        booking = await Booking.objects.select_related('user').aget(id=booking_id)
+    except Booking.DoesNotExist:
+        raise ValidationError("Booking doesn't exist.")
+
+    # Validate if it's user's booking
+    if booking.user.username != user.username:
+        raise ValidationError("User can only cancel his bookings.")
+
+    # Cancel booking
+    booking.status = Booking.CANCELED
+    await run_in_sync_pool(booking.save, update_fields=['status'])
+
+
+async def abook_room(user: TelegramUser, room_number: int, checkin_date: date, checkout_date: date) -> None:
+    # Validate room number
+    try:
+        room = await Room.objects.aget(number=room_number)
+    except Room.DoesNotExist:
+        raise ValidationError("Room with given room number doesn't exist.")
 
+    # Validate given dates
+    difference = checkout_date - checkin_date
+    if difference.days < 1:
+        raise ValidationError("Checkout date can't be earlier than 1 day after an check in.")
+    if checkin_date < date.today() or checkout_date < date.today():
+        raise ValidationError("Can't book rooms for the past")
 
+    # creates booking, availability is checked and price calculated by Booking.save while holding a lock on the room
+    user = await User.objects.aget(username=user.username)
+    await run_in_sync_pool(Booking.objects.create, user=user, room=room, checkin_date=checkin_date,
+                           checkout_date=checkout_date)
@@ -1,21 +1,60 @@
+import asyncio
 import logging
 
+from django.conf import settings
+from telegram import Update
 from telegram.ext import ApplicationBuilder
 
 from bot.handlers.bot_handlers import get_handlers
+from bot.metrics import instrument_handler
+from bot.outbox import OutboundScheduler
+from bot.persistence import DatabasePersistence, SharedStateApplication
 
 
 class Bot:
-    def __init__(self, token):
+    def __init__(self, token, request=None, persistence=None, rate_limiter=None):
         self.TOKEN = token
-        self.application = ApplicationBuilder().token(token).build()
+        # Updates of different chats are handled at the same time, up to this many at once.
+        # Conversation state is kept in the database, so it survives restarts and is shared by workers.
+        # Everything sent to Telegram is spread out to stay within its flood limits
+        builder = ApplicationBuilder().token(token) \
+            .concurrent_updates(getattr(settings, 'BOT_CONCURRENT_UPDATES', 32)) \
+            .application_class(SharedStateApplication) \
+            .persistence(persistence or DatabasePersistence()) \
+            .rate_limiter(rate_limiter or OutboundScheduler())
+        if request is not None:
+            # Lets the bot talk to something other than Telegram, e.g. a fake API in load tests
+            builder = builder.request(request).get_updates_request(request)
+        self.application = builder.build()
         handlers = get_handlers()
         self._initialize_handlers(handlers)
 
     def _initialize_handlers(self, handlers):
         for handler in handlers:
-            self.application.add_handler(handler)
+            self.application.add_handler(instrument_handler(handler))
 
     def run_polling(self):
         logging.warning("Starting bot in polling mode")
         self.application.run_polling()
+
+    def set_webhook(self, url: str, secret_token: str = None) -> None:
+        """Tells Telegram to deliver updates to `url` instead of waiting for them to be polled"""
+        async def set_webhook():
+            async with self.application.bot:
+                await self.application.bot.set_webhook(url, secret_token=secret_token or None,
+                                                       allowed_updates=Update.ALL_TYPES)
+
+        logging.warning("Setting bot webhook to %s", url)
+        asyncio.run(set_webhook())
+
+    # Webhook mode, updates are received by the ASGI application (see bot.webhook) and handled in its event loop
+    async def start_webhook(self) -> None:
+        await self.application.initialize()
+        await self.application.start()
+
+    async def stop_webhook(self) -> None:
+        await self.application.stop()
+        await self.application.shutdown()
+
+    async def process_webhook_update(self, data: dict) -> None:
+        await self.application.update_queue.put(Update.de_json(data, self.application.bot))
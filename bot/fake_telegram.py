@@ -0,0 +1,186 @@
+import asyncio
+import itertools
+import json
+import math
+import time
+from collections import defaultdict
+from urllib.parse import parse_qsl
+
+from telegram import Update
+from telegram.request import BaseRequest, HTTPXRequest
+
+from bot.outbox import TokenBucket
+
+FAKE_BOT_TOKEN = '123456:fake-token'
+FAKE_BOT = {'id': 123456, 'is_bot': True, 'first_name': 'Hotel', 'username': 'hotel_booking_bot'}
+
+
+class FakeTelegramRequest(BaseRequest):
+    """
+    Stands in for the Bot API, so the bot can run without network access: answers every method
+    the way Telegram would and keeps texts of sent messages per chat. `latency` adds a delay to every call.
+
+    With `rate` and `chat_rate` it also enforces flood limits like Telegram does, requests over them are
+    answered with 429 and counted in `rejected`. Buckets of the limits read time from `clock`.
+    """
+
+    def __init__(self, latency: float = 0.0, rate: float = 0, chat_rate: float = 0, chat_burst: int = 1,
+                 clock=time.monotonic):
+        self.latency = latency
+        self.sent_messages = defaultdict(list)
+        self.calls = defaultdict(int)
+        self.rejected = 0
+        self._message_ids = itertools.count(1)
+        self._bucket = TokenBucket(rate, burst=max(rate, 1), clock=clock)
+        self._chat_buckets = defaultdict(lambda: TokenBucket(chat_rate, burst=chat_burst, clock=clock))
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None) -> tuple:
+        parameters = request_data.parameters if request_data is not None else {}
+        return await self.answer(url.rsplit('/', 1)[-1], parameters)
+
+    async def answer(self, endpoint: str, parameters: dict) -> tuple:
+        """Status code and body of the answer to a call of a Bot API method"""
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if 'chat_id' in parameters:
+            retry_after = max(self._chat_buckets[int(parameters['chat_id'])].take(), self._bucket.take())
+            if retry_after:
+                self.rejected += 1
+                retry_after = math.ceil(retry_after)
+                return 429, json.dumps({'ok': False, 'error_code': 429,
+                                        'description': f"Too Many Requests: retry after {retry_after}",
+                                        'parameters': {'retry_after': retry_after}}).encode()
+        self.calls[endpoint] += 1
+        return 200, json.dumps({'ok': True, 'result': self._result(endpoint, parameters)}).encode()
+
+    def _result(self, endpoint: str, parameters: dict):
+        if endpoint == 'getMe':
+            return FAKE_BOT
+        if endpoint == 'getUpdates':
+            return []
+        if endpoint in ('sendMessage', 'editMessageText'):
+            chat_id = int(parameters['chat_id'])
+            self.sent_messages[chat_id].append(parameters.get('text'))
+            return {'message_id': next(self._message_ids), 'date': int(time.time()), 'text': parameters.get('text'),
+                    'chat': {'id': chat_id, 'type': 'private'}, 'from': FAKE_BOT}
+        return True
+
+
+class FakeClock:
+    """
+    Monotonic time that passes only when something sleeps on it, as much as it sleeps. Shared by an
+    OutboundScheduler and a FakeTelegramRequest, limits are checked without waiting and regardless of machine load
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, delay: float) -> None:
+        wake_at = self.now + max(delay, 0)
+        if delay > 0:
+            # Real time always moves on, a delay too short to change the time would otherwise be waited forever
+            wake_at = max(wake_at, math.nextafter(self.now, math.inf))
+        # Let other tasks run, as a real sleep would
+        await asyncio.sleep(0)
+        self.now = max(self.now, wake_at)
+
+
+class FakeTelegramServer:
+    """
+    Serves a FakeTelegramRequest over HTTP on localhost, so requests of the bot go through
+    the same HTTP client and error handling as with Telegram
+    """
+
+    def __init__(self, api: FakeTelegramRequest = None):
+        self.api = api or FakeTelegramRequest()
+        self.url = None
+        self._server = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._serve, '127.0.0.1', 0)
+        self.url = 'http://127.0.0.1:{}'.format(self._server.sockets[0].getsockname()[1])
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    def request(self, **kwargs) -> HTTPXRequest:
+        """Request object for the bot, sending everything meant for Telegram to this server"""
+        return _LocalRequest(self.url, **kwargs)
+
+    async def _serve(self, reader, writer) -> None:
+        try:
+            # Keep-alive connection, one request after another
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                path = request_line.decode().split()[1]
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode().strip()
+                    if not line:
+                        break
+                    name, value = line.split(':', 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                if headers.get('content-type', '').startswith('application/json'):
+                    parameters = json.loads(body or b'{}')
+                else:
+                    parameters = dict(parse_qsl(body.decode()))
+
+                status, answer = await self.api.answer(path.rsplit('/', 1)[-1], parameters)
+                writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                             f"Content-Type: application/json\r\nContent-Length: {len(answer)}\r\n\r\n".encode())
+                writer.write(answer)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+class _LocalRequest(HTTPXRequest):
+    def __init__(self, url: str, **kwargs):
+        super().__init__(**kwargs)
+        self._url = url
+
+    async def do_request(self, url, *args, **kwargs) -> tuple:
+        return await super().do_request(self._url + url[url.index('/bot'):], *args, **kwargs)
+
+
+def make_message_update(bot, update_id: int, chat_id: int, text: str) -> Update:
+    """Update with a text message sent to the bot in a private chat, as Telegram delivers it"""
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private', 'first_name': 'Guest'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Guest'},
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return Update.de_json({'update_id': update_id, 'message': message}, bot)
+
+
+def make_callback_update(bot, update_id: int, chat_id: int, data: str, message_id: int = 1) -> Update:
+    """Update with a press of an inline keyboard button under a message of the bot in a private chat"""
+    callback_query = {
+        'id': str(update_id),
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Guest'},
+        'chat_instance': str(chat_id),
+        'data': data,
+        'message': {'message_id': message_id, 'date': int(time.time()), 'from': FAKE_BOT,
+                    'chat': {'id': chat_id, 'type': 'private', 'first_name': 'Guest'}, 'text': 'Rooms'},
+    }
+    return Update.de_json({'update_id': update_id, 'callback_query': callback_query}, bot)
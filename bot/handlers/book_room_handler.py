@@ -1,15 +1,14 @@
 from datetime import datetime
 
-from asgiref.sync import sync_to_async
 from django.core.exceptions import ValidationError
 from django.http import Http404
 from telegram import ReplyKeyboardMarkup, ReplyKeyboardRemove, Update
 from telegram.ext import (CallbackContext, CommandHandler, ConversationHandler,
                           MessageHandler, filters)
 
-from bookings.views import book_room
-from rooms.views import get_room_by_number
-from users.views import get_user_by_telegram_id, is_authorized
+from bookings.views import abook_room
+from rooms.views import aget_room_by_number
+from users.views import aget_user_by_telegram_id, ais_authorized
 
 END = ConversationHandler.END
 IS_AUTHORIZED, ROOM_NUMBER, CHECKIN_DATE, CHECKOUT_DATE, SHOW_BOOKING_RESULT = range(5)
@@ -17,7 +16,7 @@ IS_AUTHORIZED, ROOM_NUMBER, CHECKIN_DATE, CHECKOUT_DATE, SHOW_BOOKING_RESULT = r
 
 async def is_authorized_handle(update: Update, context: CallbackContext) -> int:
     user_id = update.effective_user.id
-    if not await sync_to_async(is_authorized)(user_id):
+    if not await ais_authorized(user_id):
         await update.message.reply_text("You have to be authorized to use this command",
                                         reply_markup=ReplyKeyboardRemove())
         return END
@@ -31,7 +30,7 @@ async def is_authorized_handle(update: Update, context: CallbackContext) -> int:
 
 async def room_number_handler(update: Update, context: CallbackContext) -> int:
     try:
-        room = await sync_to_async(get_room_by_number)(int(update.message.text))
+        room = await aget_room_by_number(int(update.message.text))
         context.user_data['room'] = room
 
         await update.message.reply_text("Please, enter *check-in* date (YYYY-MM-DD):", parse_mode='Markdown')
@@ -100,12 +99,12 @@ async def show_booking_result(update: Update, context: CallbackContext) -> int:
     try:
         assert answer.lower() == 'yes'
 
-        user = await sync_to_async(get_user_by_telegram_id)(update.effective_user.id)
+        user = await aget_user_by_telegram_id(update.effective_user.id)
         room = context.user_data['room']
         checkin = context.user_data['checkin_date']
         checkout = context.user_data['checkout_date']
 
-        await sync_to_async(book_room)(user=user, room_number=room.number, checkin_date=checkin, checkout_date=checkout)
+        await abook_room(user=user, room_number=room.number, checkin_date=checkin, checkout_date=checkout)
         await update.message.reply_text(f"Room *№{room.number}* successfully booked on {checkin} - {checkout}",
                                         reply_markup=ReplyKeyboardRemove(), parse_mode='Markdown')
         context.user_data.clear()
@@ -133,6 +132,7 @@ def book_room_conversation() -> ConversationHandler:
         return END
 
     conv_handler_main = ConversationHandler(
+        name='book_room', persistent=True,
         entry_points=[CommandHandler('book_room', book_room_start)],
         states={
             IS_AUTHORIZED: [MessageHandler(filters.TEXT & ~filters.COMMAND, is_authorized_handle)],
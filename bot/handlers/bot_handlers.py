@@ -15,7 +15,7 @@ def get_handlers() -> list:
     return [
         CommandHandler('start', start),
         CommandHandler('help', help),
-        CallbackQueryHandler(button_click),
+        CallbackQueryHandler(button_click, pattern='^support$'),
         show_rooms_conversation(),
         book_room_conversation(),
         cancel_booking_conversation(),
@@ -1,10 +1,9 @@
-from asgiref.sync import sync_to_async
 from telegram import ReplyKeyboardMarkup, ReplyKeyboardRemove, Update
 from telegram.ext import (CallbackContext, CommandHandler, ConversationHandler,
                           MessageHandler, filters)
 
-from bookings.views import cancel_user_booking, get_user_active_bookings
-from users.views import get_user_by_telegram_id, is_authorized
+from bookings.views import acancel_user_booking, aget_user_active_bookings
+from users.views import aget_user_by_telegram_id, ais_authorized
 
 END = ConversationHandler.END
 IS_AUTHORIZED, HANDLE_BOOKING = range(2)
@@ -12,7 +11,7 @@ IS_AUTHORIZED, HANDLE_BOOKING = range(2)
 
 async def is_authorized_handle(update: Update, context: CallbackContext) -> int:
     user_id = update.effective_user.id
-    if not await sync_to_async(is_authorized)(user_id):
+    if not await ais_authorized(user_id):
         await update.message.reply_text("You have to be authorized to use this command",
                                         reply_markup=ReplyKeyboardRemove())
         return END
@@ -21,8 +20,8 @@ async def is_authorized_handle(update: Update, context: CallbackContext) -> int:
         "What booking do you want to cancel?", parse_mode='Markdown',
         reply_markup=ReplyKeyboardRemove()
     )
-    user = await sync_to_async(get_user_by_telegram_id)(update.effective_user.id)
-    user_bookings = await sync_to_async(get_user_active_bookings)(user)
+    user = await aget_user_by_telegram_id(update.effective_user.id)
+    user_bookings = await aget_user_active_bookings(user)
     if not user_bookings:
         await update.message.reply_text(
             "User doesn't have any bookings?", parse_mode='Markdown',
@@ -52,9 +51,9 @@ async def booking_cancel_handle(update: Update, context: CallbackContext) -> int
         return IS_AUTHORIZED
 
     booking_id = button_ids[answer]
-    user = await sync_to_async(get_user_by_telegram_id)(update.effective_user.id)
+    user = await aget_user_by_telegram_id(update.effective_user.id)
 
-    await sync_to_async(cancel_user_booking)(user, booking_id)
+    await acancel_user_booking(user, booking_id)
     await update.message.reply_text("Booking was successfully canceled", reply_markup=ReplyKeyboardRemove())
 
     context.user_data.clear()
@@ -74,6 +73,7 @@ def cancel_booking_conversation() -> ConversationHandler:
         return END
 
     conv_handler_main = ConversationHandler(
+        name='cancel_booking', persistent=True,
         entry_points=[CommandHandler('cancel_booking', cancel_booking_start)],
         states={
             IS_AUTHORIZED: [MessageHandler(filters.TEXT & ~filters.COMMAND, is_authorized_handle)],
@@ -1,10 +1,9 @@
-from asgiref.sync import sync_to_async
 from django.core.exceptions import ValidationError
 from telegram import ReplyKeyboardMarkup, ReplyKeyboardRemove, Update
 from telegram.ext import (CallbackContext, CommandHandler, ConversationHandler,
                           MessageHandler, filters)
 
-from users.views import is_authorized, login_with_telegram
+from users.views import ais_authorized, alogin_with_telegram
 
 END = ConversationHandler.END
 IS_AUTHORIZED, USERNAME, PASSWORD = range(3)
@@ -12,7 +11,7 @@ IS_AUTHORIZED, USERNAME, PASSWORD = range(3)
 
 async def is_authorized_handle(update: Update, context: CallbackContext) -> int:
     user_id = update.effective_user.id
-    if await sync_to_async(is_authorized)(user_id):
+    if await ais_authorized(user_id):
         await update.message.reply_text("You already authorized",
                                         reply_markup=ReplyKeyboardRemove())
         return END
@@ -37,7 +36,7 @@ async def password_handler(update: Update, context: CallbackContext) -> int:
         password = update.message.text
         user_id = update.effective_user.id
         username = context.user_data['username']
-        await sync_to_async(login_with_telegram)(user_id, username, password)
+        await alogin_with_telegram(user_id, username, password)
         await update.message.reply_text(
             f"You successfully logged in into {username}", parse_mode='Markdown', reply_markup=ReplyKeyboardRemove()
         )
@@ -64,6 +63,7 @@ def login_conversation() -> ConversationHandler:
         return END
 
     conv_handler_main = ConversationHandler(
+        name='login', persistent=True,
         entry_points=[CommandHandler('login', login_start)],
         states={
             IS_AUTHORIZED: [MessageHandler(filters.TEXT & ~filters.COMMAND, is_authorized_handle)],
@@ -1,9 +1,8 @@
-from asgiref.sync import sync_to_async
 from telegram import ReplyKeyboardMarkup, ReplyKeyboardRemove, Update
 from telegram.ext import (CallbackContext, CommandHandler, ConversationHandler,
                           MessageHandler, filters)
 
-from users.views import is_authorized, logout_with_telegram
+from users.views import ais_authorized, alogout_with_telegram
 
 END = ConversationHandler.END
 IS_AUTHORIZED, LOGOUT_CONFIRMATION, PASSWORD = range(3)
@@ -16,7 +15,7 @@ async def is_authorized_handle(update: Update, context: CallbackContext) -> int:
         context.user_data.clear()
         return END
 
-    if not await sync_to_async(is_authorized)(user_id):
+    if not await ais_authorized(user_id):
         await update.message.reply_text("You are not authorized",
                                         reply_markup=ReplyKeyboardRemove())
         context.user_data.clear()
@@ -33,7 +32,7 @@ async def logout_confirmation(update: Update, context: CallbackContext) -> int:
     answer = update.message.text
     if answer.lower() == 'yes':
         user_id = update.effective_user.id
-        await sync_to_async(logout_with_telegram)(user_id)
+        await alogout_with_telegram(user_id)
         await update.message.reply_text(
             "You were logged out", parse_mode='Markdown', reply_markup=ReplyKeyboardRemove()
         )
@@ -58,6 +57,7 @@ def logout_conversation() -> ConversationHandler:
         return END
 
     conv_handler_main = ConversationHandler(
+        name='logout', persistent=True,
         entry_points=[CommandHandler('logout', logout_start)],
         states={
             IS_AUTHORIZED: [MessageHandler(filters.TEXT & ~filters.COMMAND, is_authorized_handle)],
@@ -1,4 +1,3 @@
-from asgiref.sync import sync_to_async
 from django.contrib.auth.hashers import check_password, make_password
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
@@ -8,8 +7,9 @@ from telegram.error import NetworkError
 from telegram.ext import (CallbackContext, CommandHandler, ConversationHandler,
                           MessageHandler, filters)
 
-from users.views import (is_authorized, is_email_unique, is_username_unique,
-                         register)
+from RoomBooking.sync_pool import run_in_sync_pool
+from users.views import (ais_authorized, ais_email_unique, ais_username_unique,
+                         aregister)
 from validators import validate_username
 
 END = ConversationHandler.END
@@ -23,7 +23,7 @@ async def is_authorized_handle(update: Update, context: CallbackContext) -> int:
         context.user_data.clear()
         return END
 
-    if await sync_to_async(is_authorized)(user_id):
+    if await ais_authorized(user_id):
         await update.message.reply_text("You already authorized",
                                         reply_markup=ReplyKeyboardRemove())
         return END
@@ -73,7 +73,7 @@ async def registration_username_handle(update: Update, context: CallbackContext)
 
         validate_username(username)
 
-        if not await sync_to_async(is_username_unique)(username):
+        if not await ais_username_unique(username):
             raise ValidationError("This username is already registered in system")
 
         context.user_data['username'] = username
@@ -95,7 +95,7 @@ async def email_handle(update: Update, context: CallbackContext) -> int:
         email = update.message.text
 
         validate_email(email)
-        if not await sync_to_async(is_email_unique)(email):
+        if not await ais_email_unique(email):
             raise ValidationError("This email is already registered in system")
 
         context.user_data['email'] = email
@@ -125,7 +125,8 @@ async def password1_handle(update: Update, context: CallbackContext) -> int:
 
         validate_password(password)
 
-        context.user_data['password1'] = make_password(password)
+        # Hashing takes a while on purpose, keep it off the event loop
+        context.user_data['password1'] = await run_in_sync_pool(make_password, password)
 
         await update.message.reply_text(
             "Please, enter your *password* again", parse_mode='Markdown', reply_markup=ReplyKeyboardRemove()
@@ -144,7 +145,7 @@ async def password2_handle(update: Update, context: CallbackContext) -> int:
         password = update.message.text
 
         hashed_password = context.user_data['password1']
-        if not check_password(password, hashed_password):
+        if not await run_in_sync_pool(check_password, password, hashed_password):
             await update.message.reply_text(
                 "Password doesn't match. Please, enter your *password*", parse_mode='Markdown',
             )
@@ -155,7 +156,7 @@ async def password2_handle(update: Update, context: CallbackContext) -> int:
         username = context.user_data['username']
         email = context.user_data['email']
 
-        await sync_to_async(register)(first_name, last_name, username, email, password)
+        await aregister(first_name, last_name, username, email, password)
 
         await update.message.reply_text(
             f"User *{username}* was successfully registered. You can log in!", parse_mode='Markdown',
@@ -186,6 +187,7 @@ def register_conversation() -> ConversationHandler:
         return END
 
     conv_handler_main = ConversationHandler(
+        name='register', persistent=True,
         entry_points=[CommandHandler('register', registration_start)],
         states={
             IS_AUTHORIZED: [MessageHandler(filters.TEXT & ~filters.COMMAND, is_authorized_handle)],
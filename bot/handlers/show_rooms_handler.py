@@ -1,11 +1,16 @@
+import warnings
 from datetime import datetime
 
-from asgiref.sync import sync_to_async
-from telegram import ReplyKeyboardMarkup, ReplyKeyboardRemove, Update
-from telegram.ext import (CallbackContext, CommandHandler, ConversationHandler,
-                          MessageHandler, filters)
+from django.core.exceptions import ValidationError
+from telegram import (InlineKeyboardButton, InlineKeyboardMarkup,
+                      ReplyKeyboardMarkup, ReplyKeyboardRemove, Update)
+from telegram.ext import (CallbackContext, CallbackQueryHandler,
+                          CommandHandler, ConversationHandler, MessageHandler,
+                          filters)
+from telegram.warnings import PTBUserWarning
 
-from rooms.views import SortType, get_available_rooms
+from bot.outbox import MAX_MESSAGE_LENGTH, send_later
+from rooms.views import SortType, aget_available_rooms_page, room_sort_key
 
 END = ConversationHandler.END
 CONV_DATE, CONV_COST, CONV_CAPACITY, CONV_SORT = range(4)
@@ -14,6 +19,8 @@ COST_START, MIN_COST, MAX_COST = range(7, 10)
 CAPACITY_START, MIN_CAPACITY = range(10, 12)
 SORT_START, SORT_TYPE_CHOOSING = range(12, 14)
 SHOW_CHOSEN_ROOMS = 14
+BROWSE_ROOMS = 15
+PREVIOUS_PAGE, NEXT_PAGE = 'rooms:previous', 'rooms:next'
 
 
 # Show available rooms conversation
@@ -82,7 +89,7 @@ def get_date_conversation() -> ConversationHandler:
             context.user_data['checkout_date'] = checkout_date
 
             await update.message.reply_text(
-                "Will there be filter by min and max cost for one night?",
+                "Will there be filter by min and max cost for the whole stay?",
                 reply_markup=ReplyKeyboardMarkup([['Yes', 'No']], one_time_keyboard=True)
             )
             return END
@@ -104,6 +111,7 @@ def get_date_conversation() -> ConversationHandler:
         return END
 
     conv_handler = ConversationHandler(
+        name='show_rooms_dates', persistent=True,
         entry_points=[MessageHandler(filters.TEXT & ~filters.COMMAND, start_date_filter)],
         states={
             DATE_START: [MessageHandler(filters.Regex('^(Yes|No)$'), yes_or_no_handler)],
@@ -119,11 +127,16 @@ def get_date_conversation() -> ConversationHandler:
     return conv_handler
 
 
+def get_cost_period(context: CallbackContext) -> str:
+    # Costs are compared with the price of the whole stay when dates are given
+    return "for the whole stay" if context.user_data.get('checkout_date') else "for one night"
+
+
 def get_cost_conversation() -> ConversationHandler:
     async def start_cost_filter(update: Update, context: CallbackContext) -> int:
         user_choice = update.message.text
         if user_choice.lower() == 'yes':
-            await update.message.reply_text("Please, enter *min* cost for one night:",
+            await update.message.reply_text(f"Please, enter *min* cost {get_cost_period(context)}:",
                                             parse_mode='Markdown',
                                             reply_markup=ReplyKeyboardRemove())
             return MIN_COST
@@ -150,7 +163,7 @@ def get_cost_conversation() -> ConversationHandler:
                 return MIN_COST
 
             context.user_data['min_cost'] = min_cost
-            await update.message.reply_text("Please, enter *max* cost for one night:",
+            await update.message.reply_text(f"Please, enter *max* cost {get_cost_period(context)}:",
                                             parse_mode='Markdown', reply_markup=ReplyKeyboardRemove())
             return MAX_COST
         except ValueError:
@@ -195,6 +208,7 @@ def get_cost_conversation() -> ConversationHandler:
         return END
 
     conv_handler = ConversationHandler(
+        name='show_rooms_cost', persistent=True,
         entry_points=[MessageHandler(filters.Regex('^(Yes|No)$'), start_cost_filter)],
         states={
             COST_START: [MessageHandler(filters.Regex('^(Yes|No)$'), start_cost_filter)],
@@ -262,6 +276,7 @@ def get_capacity_conversation():
         return END
 
     conv_handler = ConversationHandler(
+        name='show_rooms_capacity', persistent=True,
         entry_points=[MessageHandler(filters.Regex('^(Yes|No)$'), start_capacity_filter)],
         states={
             CAPACITY_START: [MessageHandler(filters.Regex('^(Yes|No)$'), start_capacity_filter)],
@@ -336,6 +351,7 @@ def get_sort_conversation() -> ConversationHandler:
         return END
 
     conv_handler = ConversationHandler(
+        name='show_rooms_sort', persistent=True,
         entry_points=[MessageHandler(filters.Regex('^(Yes|No)$'), start_sort)],
         states={
             SORT_START: [MessageHandler(filters.Regex('^(Yes|No)$'), start_sort)],
@@ -349,36 +365,77 @@ def get_sort_conversation() -> ConversationHandler:
     return conv_handler
 
 
+# Filters of the search kept in user data, which other conversations may clear while its pages are shown
+SEARCH_KEYS = ('sort_type', 'checkin_date', 'checkout_date', 'min_cost', 'max_cost', 'min_capacity')
+
+
+async def _get_room_page(context: CallbackContext, after: tuple = None, before: tuple = None) -> tuple:
+    # Text and inline keyboard of a page of found rooms, keys of its first and last room are kept as the cursor
+    sort_type = context.user_data['sort_type'].value
+    rooms, start, total = await aget_available_rooms_page(checkin_date=context.user_data['checkin_date'],
+                                                          checkout_date=context.user_data['checkout_date'],
+                                                          min_cost=context.user_data['min_cost'],
+                                                          max_cost=context.user_data['max_cost'],
+                                                          min_capacity=context.user_data['min_capacity'],
+                                                          sort_type=sort_type,
+                                                          after=after, before=before,
+                                                          )
+    if rooms:
+        context.user_data['rooms_page'] = [room_sort_key(rooms[0], sort_type), room_sort_key(rooms[-1], sort_type)]
+        text = f"Rooms {start + 1}-{start + len(rooms)} of {total}:\n\n" + "\n\n".join(str(room) for room in rooms)
+    else:
+        text = "No more available rooms"
+
+    buttons = []
+    if start > 0:
+        buttons.append(InlineKeyboardButton("« Previous", callback_data=PREVIOUS_PAGE))
+    if start + len(rooms) < total:
+        buttons.append(InlineKeyboardButton("Next »", callback_data=NEXT_PAGE))
+    return text[:MAX_MESSAGE_LENGTH], InlineKeyboardMarkup([buttons]) if buttons else None, total
+
+
 def get_chosen_rooms():
     async def get_room_list(update: Update, context: CallbackContext) -> int:
-        room_list = await sync_to_async(get_available_rooms)(checkin_date=context.user_data['checkin_date'],
-                                                             checkout_date=context.user_data['checkout_date'],
-                                                             min_cost=context.user_data['min_cost'],
-                                                             max_cost=context.user_data['max_cost'],
-                                                             min_capacity=context.user_data['min_capacity'],
-                                                             sort_type=context.user_data['sort_type'].value,
-                                                             )
-
-        if not room_list:
+        context.user_data.pop('rooms_page', None)
+        text, keyboard, total = await _get_room_page(context)
+
+        if not total:
             await update.message.reply_text("No available rooms =(")
-        else:
-            output_stroke = ""
-            i = 0
-            while i != len(room_list):
-                room = room_list[i]
-                temp_stroke = output_stroke + room.__str__() + '\n\n'
-                if len(temp_stroke) > 4096:
-                    await update.message.reply_text(output_stroke)
-                    output_stroke = ""
-                else:
-                    output_stroke = temp_stroke
-                    i += 1
-            await update.message.reply_text(output_stroke, reply_markup=ReplyKeyboardRemove())
-        return END
+            return END
+        if keyboard is None:
+            send_later(context, update.effective_chat.id, text, reply_markup=ReplyKeyboardRemove())
+            return END
+        # Only one page at a time, the rest is shown by editing it with the buttons under it
+        send_later(context, update.effective_chat.id, f"Found {total} available rooms",
+                   reply_markup=ReplyKeyboardRemove())
+        send_later(context, update.effective_chat.id, text, reply_markup=keyboard)
+        return BROWSE_ROOMS
 
     return MessageHandler(filters.TEXT & ~filters.COMMAND, get_room_list)
 
 
+def get_room_pages():
+    async def turn_page(update: Update, context: CallbackContext) -> int:
+        query = update.callback_query
+        await query.answer()
+        first, last = context.user_data.get('rooms_page', (None, None))
+        if any(key not in context.user_data for key in SEARCH_KEYS):
+            await query.edit_message_text("This search is outdated, start a new one with /show_available_rooms")
+            return END
+        try:
+            if query.data == NEXT_PAGE:
+                text, keyboard, _ = await _get_room_page(context, after=last)
+            else:
+                text, keyboard, _ = await _get_room_page(context, before=first)
+        except ValidationError:
+            await query.edit_message_text("This search is outdated, start a new one with /show_available_rooms")
+            return END
+        await query.edit_message_text(text, reply_markup=keyboard)
+        return BROWSE_ROOMS
+
+    return CallbackQueryHandler(turn_page, pattern=f'^({PREVIOUS_PAGE}|{NEXT_PAGE})$')
+
+
 def show_rooms_conversation() -> ConversationHandler:
     async def show_available_rooms(update: Update, context: CallbackContext) -> int:
         await update.message.reply_text(
@@ -397,18 +454,26 @@ def show_rooms_conversation() -> ConversationHandler:
     conv_handler_sort = get_sort_conversation()
 
     show_chosen_rooms = get_chosen_rooms()
-
-    conv_handler_main = ConversationHandler(
-        entry_points=[CommandHandler('show_available_rooms', show_available_rooms)],
-        states={
-            CONV_DATE: [conv_handler_date],
-            CONV_COST: [conv_handler_cost],
-            CONV_CAPACITY: [conv_handler_capacity],
-            CONV_SORT: [conv_handler_sort],
-            SHOW_CHOSEN_ROOMS: [show_chosen_rooms],
-            END: [cancel]
-        },
-        fallbacks=[CommandHandler('cancel', cancel)]
-    )
+    room_pages = get_room_pages()
+
+    # Page buttons are tracked per chat rather than per message, a chat browses the results of its latest search
+    with warnings.catch_warnings():
+        warnings.filterwarnings('ignore', message="If 'per_message=False'", category=PTBUserWarning)
+        conv_handler_main = ConversationHandler(
+            name='show_rooms', persistent=True,
+            entry_points=[CommandHandler('show_available_rooms', show_available_rooms)],
+            states={
+                CONV_DATE: [conv_handler_date],
+                CONV_COST: [conv_handler_cost],
+                CONV_CAPACITY: [conv_handler_capacity],
+                CONV_SORT: [conv_handler_sort],
+                SHOW_CHOSEN_ROOMS: [show_chosen_rooms],
+                BROWSE_ROOMS: [room_pages],
+                END: [cancel]
+            },
+            fallbacks=[CommandHandler('cancel', cancel)],
+            # Browsing lasts until the next search or /cancel, a new search starts over
+            allow_reentry=True,
+        )
 
     return conv_handler_main
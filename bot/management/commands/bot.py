@@ -1,7 +1,7 @@
 import logging
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from telegram.error import InvalidToken
 
 from bot.bot import Bot
@@ -15,11 +15,24 @@ logging.basicConfig(
 
 
 class Command(BaseCommand):
+    help = "Runs the bot in polling mode, or with --webhook registers BOT_WEBHOOK_URL with Telegram, " \
+           "after which updates are served by the ASGI application"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--webhook', action='store_true',
+                            help="Register BOT_WEBHOOK_URL as the webhook of the bot and exit")
+
     def handle(self, *args, **kwargs):
         try:
             _BOT_TOKEN = settings.BOT_TOKEN
             logging.info("Obtained token successfully")
             bot = Bot(_BOT_TOKEN)
-            bot.run_polling()
+            if kwargs['webhook']:
+                if not settings.BOT_WEBHOOK_URL:
+                    raise CommandError("Set BOT_WEBHOOK_URL first")
+                bot.set_webhook(settings.BOT_WEBHOOK_URL, settings.BOT_WEBHOOK_SECRET)
+            else:
+                # Polling removes the webhook, if there is one
+                bot.run_polling()
         except InvalidToken:
             logging.critical("Error occurred while obtaining Bot token from environment")
@@ -0,0 +1,124 @@
+import asyncio
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Max
+
+from bookings.models import Booking
+from bot.bot import Bot
+from bot.fake_telegram import (FAKE_BOT_TOKEN, FakeTelegramRequest,
+                               FakeTelegramServer, make_message_update)
+from bot.outbox import OutboundScheduler
+from rooms.models import Room, RoomType
+from users.models import TelegramAuthorization, User
+from users.telegram_cache import telegram_user_cache
+
+FIRST_TELEGRAM_ID = 900_000_000
+
+
+class Command(BaseCommand):
+    help = "Runs many chats at once through the bot handlers against a fake Telegram API and reports latencies. " \
+           "Every chat searches rooms, books a room and cancels the booking. Created rows are deleted afterwards."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chats', type=int, default=300)
+        parser.add_argument('--latency', type=float, default=0.02, help="Seconds every fake API call takes")
+        parser.add_argument('--sync-threads', type=int, help="Overrides SYNC_POOL_THREADS")
+        parser.add_argument('--fake-server', action='store_true',
+                            help="Talk to a fake Bot API over HTTP which enforces the flood limits from settings, "
+                                 "instead of calling it in process without any limits")
+
+    def handle(self, *args, **options):
+        if options['sync_threads']:
+            settings.SYNC_POOL_THREADS = options['sync_threads']
+        chats = options['chats']
+        room_type, rooms, users = self._seed(chats)
+        try:
+            latencies, seconds, request = asyncio.run(self._run(rooms, options['latency'], options['fake_server']))
+        finally:
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+            Room.objects.filter(type=room_type).delete()
+            room_type.delete()
+
+        booked = sum(any('successfully booked' in text for text in texts)
+                     for texts in request.sent_messages.values())
+        canceled = sum(any('successfully canceled' in text for text in texts)
+                       for texts in request.sent_messages.values())
+        latencies.sort()
+        self.stdout.write(f"{chats} chats, {len(latencies)} updates in {seconds:.2f}s "
+                          f"({len(latencies) / seconds:.0f} updates/s), {request.calls['sendMessage']} messages sent")
+        for percentile in (50, 95, 99):
+            self.stdout.write(f"p{percentile}: {latencies[len(latencies) * percentile // 100] * 1000:.1f} ms")
+        self.stdout.write(f"max: {latencies[-1] * 1000:.1f} ms")
+        self.stdout.write(f"{booked} chats booked a room, {canceled} canceled it")
+        if options['fake_server']:
+            self.stdout.write(f"{request.rejected} requests over the flood limits")
+        if booked != chats or canceled != chats:
+            self.stderr.write("Some chats didn't get through")
+
+    def _seed(self, chats: int) -> tuple:
+        room_type = RoomType.objects.create(name='Load test')
+        first_number = (Room.objects.aggregate(number=Max('number'))['number'] or 0) + 1
+        rooms = Room.objects.bulk_create([
+            Room(number=first_number + i, type=room_type, current_price=Decimal('1000.00'), capacity=2)
+            for i in range(chats)
+        ])
+        users = User.objects.bulk_create([
+            User(username=f'load-test-{i}', first_name='Load', last_name='Test', email=f'load-test-{i}@example.com')
+            for i in range(chats)
+        ])
+        TelegramAuthorization.objects.bulk_create([
+            TelegramAuthorization(user=user, telegram_id=FIRST_TELEGRAM_ID + i) for i, user in enumerate(users)
+        ])
+        # bulk_create doesn't send post_save, so nothing else drops "not logged in" cached for these accounts
+        telegram_user_cache.invalidate([FIRST_TELEGRAM_ID + i for i in range(chats)])
+        return room_type, rooms, users
+
+    async def _run(self, rooms: list, latency: float, fake_server: bool) -> tuple:
+        server = None
+        if fake_server:
+            request = FakeTelegramRequest(latency=latency, rate=settings.BOT_SEND_RATE,
+                                          chat_rate=settings.BOT_CHAT_SEND_RATE,
+                                          chat_burst=settings.BOT_CHAT_SEND_BURST + 1)
+            server = FakeTelegramServer(request)
+            await server.start()
+            bot = Bot(FAKE_BOT_TOKEN, request=server.request(connection_pool_size=64))
+        else:
+            # Measures the handlers alone, nothing is held back for flood limits
+            request = FakeTelegramRequest(latency=latency)
+            bot = Bot(FAKE_BOT_TOKEN, request=request, rate_limiter=OutboundScheduler(rate=0, chat_rate=0))
+        application = bot.application
+        await application.initialize()
+        update_ids = iter(range(1, 10 ** 9))
+        latencies = []
+
+        async def chat(i: int, room: Room):
+            chat_id = FIRST_TELEGRAM_ID + i
+            checkin_date = date.today() + timedelta(days=1 + i % 30)
+            checkout_date = checkin_date + timedelta(days=2)
+            booking = Booking(room=room, checkin_date=checkin_date, checkout_date=checkout_date)
+            messages = [
+                '/show_available_rooms', 'Okay', 'Yes', str(checkin_date), str(checkout_date), 'No', 'No', 'No', 'Yes',
+                '/book_room', 'Okay', str(room.number), str(checkin_date), str(checkout_date), 'Yes',
+                '/cancel_booking', 'Okay', str(booking),
+            ]
+            for text in messages:
+                update = make_message_update(application.bot, next(update_ids), chat_id, text)
+                started = time.perf_counter()
+                await application.process_update(update)
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(chat(i, room) for i, room in enumerate(rooms)))
+        seconds = time.perf_counter() - started
+        await application.shutdown()
+        if server is not None:
+            await server.stop()
+        # The async ORM has a thread of its own with a connection, which would outlive the command otherwise
+        await sync_to_async(connections.close_all)()
+        return latencies, seconds, request
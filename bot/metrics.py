@@ -0,0 +1,34 @@
+import functools
+from itertools import chain
+
+from telegram.ext import BaseHandler, ConversationHandler
+
+from RoomBooking.metrics import metrics
+
+
+def instrument_handler(handler: BaseHandler, conversation: str = None) -> BaseHandler:
+    """
+    Records every callback of a handler in the metrics, labeled with the conversation and the callback handling
+    its state, e.g. `book_room.room_number_handler`. Nested conversations are labeled with their own name.
+    """
+    if isinstance(handler, ConversationHandler):
+        for child in chain(handler.entry_points, *handler.states.values(), handler.fallbacks):
+            instrument_handler(child, handler.name)
+        return handler
+
+    # States may list things other than handlers, which are never called. A handler shared by several states
+    # is only wrapped once
+    if isinstance(handler, BaseHandler) and not hasattr(handler.callback, 'metrics_path'):
+        path = f'{conversation}.{handler.callback.__name__}' if conversation else handler.callback.__name__
+        handler.callback = _timed(handler.callback, path)
+    return handler
+
+
+def _timed(callback, path: str):
+    @functools.wraps(callback)
+    async def timed_callback(update, context):
+        with metrics.record('bot', path):
+            return await callback(update, context)
+
+    timed_callback.metrics_path = path
+    return timed_callback
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.11 on 2026-10-18 19:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BotState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=64)),
+                ('key', models.CharField(max_length=64)),
+                ('data', models.TextField()),
+                ('revision', models.BigIntegerField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='botstate',
+            constraint=models.UniqueConstraint(fields=('kind', 'key'), name='bot_state_kind_key_unique'),
+        ),
+    ]
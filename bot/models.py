@@ -0,0 +1,20 @@
+from django.db import models
+
+
+class BotState(models.Model):
+    """Piece of bot conversation state (user data of a telegram user, state of a conversation) shared by workers"""
+    # 'user' or 'conversation:<conversation name>'
+    kind = models.CharField(max_length=64)
+    key = models.CharField(max_length=64)
+    data = models.TextField()
+    # Changes with every write, so a worker can tell if somebody else wrote since it last looked
+    revision = models.BigIntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('kind', 'key'), name='bot_state_kind_key_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.key}"
@@ -0,0 +1,164 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+
+from django.conf import settings
+from telegram.error import RetryAfter, TelegramError
+from telegram.ext import BaseRateLimiter
+
+MAX_MESSAGE_LENGTH = 4096
+# Joins consecutive queued messages of a chat
+SEPARATOR = '\n\n'
+# Buckets of chats that got nothing for a while are dropped once there are this many
+MAX_CHAT_BUCKETS = 10000
+
+
+class TokenBucket:
+    """`rate` requests a second on average and up to `burst` of them at once. Zero rate means no limit"""
+
+    def __init__(self, rate: float, burst: float = 1, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> float:
+        """Takes a token if there is one and returns 0, otherwise returns seconds until there will be"""
+        if not self.rate:
+            return 0.0
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def give_back(self) -> None:
+        if self.rate:
+            self.tokens += 1
+
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.burst
+
+
+class OutboundScheduler(BaseRateLimiter):
+    """
+    Spreads requests of the bot over time to stay within Telegram flood limits: BOT_SEND_RATE requests a second
+    in total and BOT_CHAT_SEND_RATE a second to a single chat, after a burst of BOT_CHAT_SEND_BURST. A 429 response
+    pauses every request for as long as Telegram asks, then the request is made again, up to BOT_SEND_MAX_RETRIES
+    times.
+
+    Messages passed to send_later are sent in the background, in order per chat, so handlers don't wait for them.
+    Consecutive queued messages of a chat are joined into one as long as it fits into a single Telegram message.
+
+    `clock` and `sleep` stand in for time.monotonic and asyncio.sleep, so tests can let time pass without waiting.
+    """
+
+    def __init__(self, rate: float = None, chat_rate: float = None, chat_burst: int = None, max_retries: int = None,
+                 clock=time.monotonic, sleep=asyncio.sleep):
+        self.rate = rate if rate is not None else getattr(settings, 'BOT_SEND_RATE', 30)
+        self.chat_rate = chat_rate if chat_rate is not None else getattr(settings, 'BOT_CHAT_SEND_RATE', 1)
+        self.chat_burst = chat_burst if chat_burst is not None else getattr(settings, 'BOT_CHAT_SEND_BURST', 3)
+        self.max_retries = max_retries if max_retries is not None else getattr(settings, 'BOT_SEND_MAX_RETRIES', 3)
+        self._clock = clock
+        self._sleep = sleep
+        self._bucket = TokenBucket(self.rate, burst=max(self.rate, 1), clock=clock)
+        self._chat_buckets = {}
+        self._paused_until = 0.0
+        self._queues = {}
+        self._senders = {}
+        self.stats = {'requests': 0, 'retries': 0, 'joined': 0}
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        # Runs before the bot closes its connections, so whatever is queued still goes out
+        await self.flush()
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        for attempt in itertools.count():
+            await self._wait_for_turn(chat_id)
+            self.stats['requests'] += 1
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as exc:
+                if attempt >= self.max_retries:
+                    raise
+                self.stats['retries'] += 1
+                self._paused_until = max(self._paused_until, self._clock() + exc.retry_after)
+                logging.warning("Telegram asked to wait %s seconds, %s to chat %s is retried", exc.retry_after,
+                                endpoint, chat_id)
+
+    async def _wait_for_turn(self, chat_id) -> None:
+        while True:
+            delay = self._paused_until - self._clock()
+            if delay <= 0:
+                chat_bucket = self._chat_bucket(chat_id) if chat_id is not None else None
+                delay = chat_bucket.take() if chat_bucket is not None else 0.0
+                if not delay:
+                    delay = self._bucket.take()
+                    if not delay:
+                        return
+                    if chat_bucket is not None:
+                        chat_bucket.give_back()
+            await self._sleep(delay)
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= MAX_CHAT_BUCKETS:
+                self._chat_buckets = {key: bucket for key, bucket in self._chat_buckets.items()
+                                      if not bucket.is_full()}
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, burst=self.chat_burst, clock=self._clock)
+        return bucket
+
+    # Messages sent in the background
+    def send_later(self, bot, chat_id: int, text: str, **kwargs) -> None:
+        queue = self._queues.setdefault(chat_id, deque())
+        if queue and self._can_join(queue[-1], text, kwargs):
+            queue[-1][0] += SEPARATOR + text
+            queue[-1][1] = kwargs
+            self.stats['joined'] += 1
+        else:
+            queue.append([text, kwargs])
+        if chat_id not in self._senders:
+            self._senders[chat_id] = asyncio.create_task(self._send_queued(bot, chat_id))
+
+    @staticmethod
+    def _can_join(queued: list, text: str, kwargs: dict) -> bool:
+        # Only plain texts, the keyboard of the last one is kept for the joined message
+        return (not queued[1] and set(kwargs) <= {'reply_markup'}
+                and len(queued[0]) + len(SEPARATOR) + len(text) <= MAX_MESSAGE_LENGTH)
+
+    async def _send_queued(self, bot, chat_id: int) -> None:
+        queue = self._queues[chat_id]
+        try:
+            while queue:
+                text, kwargs = queue.popleft()
+                try:
+                    await bot.send_message(chat_id, text, **kwargs)
+                except TelegramError:
+                    logging.exception("Couldn't send a queued message to chat %s", chat_id)
+        finally:
+            del self._senders[chat_id]
+            del self._queues[chat_id]
+
+    async def flush(self) -> None:
+        """Waits until every queued message is sent"""
+        while self._senders:
+            await asyncio.gather(*self._senders.values())
+
+
+def send_later(context, chat_id: int, text: str, **kwargs) -> None:
+    """Queues a message for a chat and returns right away, see OutboundScheduler"""
+    context.bot.rate_limiter.send_later(context.bot, chat_id, text, **kwargs)
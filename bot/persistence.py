@@ -0,0 +1,305 @@
+import asyncio
+import json
+import logging
+import secrets
+from datetime import date
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils.module_loading import import_string
+from telegram import Update
+from telegram.ext import (Application, BasePersistence, ConversationHandler,
+                          PersistenceInput)
+
+from bot.models import BotState
+from RoomBooking.sync_pool import run_in_sync_pool
+from rooms.models import TelegramRoom
+from rooms.views import SortType
+
+USER_KIND = 'user'
+CONVERSATION_KIND = 'conversation:{}'
+
+# TelegramRoom is stored as a list of its attributes in this order
+ROOM_FIELDS = ('id', 'number', 'type', 'price', 'capacity', 'description', 'type_id')
+
+
+def _encode(value):
+    if isinstance(value, TelegramRoom):
+        return {'$room': [str(value.price) if field == 'price' else getattr(value, field) for field in ROOM_FIELDS]}
+    if isinstance(value, date):
+        return {'$date': value.toordinal()}
+    if isinstance(value, SortType):
+        return {'$sort': value.value}
+    if isinstance(value, Decimal):
+        return {'$decimal': str(value)}
+    raise TypeError(f"Can't store {type(value).__name__} in bot state")
+
+
+def _decode(value: dict):
+    if len(value) != 1:
+        return value
+    if '$room' in value:
+        room = TelegramRoom.__new__(TelegramRoom)
+        room.__dict__.update(zip(ROOM_FIELDS, value['$room']))
+        room.price = Decimal(room.price)
+        return room
+    if '$date' in value:
+        return date.fromordinal(value['$date'])
+    if '$sort' in value:
+        return SortType(value['$sort'])
+    if '$decimal' in value:
+        return Decimal(value['$decimal'])
+    return value
+
+
+def dumps(value) -> str:
+    """Compact JSON of conversation data, with rooms, dates and sort types tagged so they can be restored"""
+    return json.dumps(value, default=_encode, separators=(',', ':'), ensure_ascii=False)
+
+
+def loads(data: str):
+    return json.loads(data, object_hook=_decode)
+
+
+class DatabaseStore:
+    """
+    Keeps bot state in the BotState table. Any class with the same three methods can replace it
+    through the BOT_PERSISTENCE_STORE setting. Keys are (kind, key) pairs of strings.
+    """
+
+    def load_kind(self, kind: str) -> dict:
+        """{key: (revision, data)} of every entry of a kind"""
+        return {key: (revision, data) for key, revision, data in
+                BotState.objects.filter(kind=kind).values_list('key', 'revision', 'data')}
+
+    def load(self, keys: list) -> dict:
+        """{(kind, key): (revision, data)} of the given entries that exist"""
+        keys = set(keys)
+        if not keys:
+            return {}
+        states = BotState.objects.filter(kind__in={kind for kind, _ in keys}, key__in={key for _, key in keys})
+        return {(kind, key): (revision, data) for kind, key, revision, data in
+                states.values_list('kind', 'key', 'revision', 'data') if (kind, key) in keys}
+
+    def save(self, changes: dict) -> dict:
+        """
+        Writes {(kind, key): data} in one go, None data deletes the entry.
+        Returns {(kind, key): revision} of the written entries, None for deleted ones
+        """
+        revisions = {}
+        states = []
+        for (kind, key), data in changes.items():
+            revisions[(kind, key)] = None if data is None else secrets.randbits(63)
+            if data is not None:
+                states.append(BotState(kind=kind, key=key, data=data, revision=revisions[(kind, key)]))
+        deleted = [key for key, data in changes.items() if data is None]
+
+        with transaction.atomic():
+            if states:
+                BotState.objects.bulk_create(states, update_conflicts=True, unique_fields=('kind', 'key'),
+                                             update_fields=('data', 'revision', 'updated_at'))
+            if deleted:
+                BotState.objects.filter(reduce(or_, (Q(kind=kind, key=key) for kind, key in deleted))).delete()
+        return revisions
+
+
+class DatabasePersistence(BasePersistence):
+    """
+    Persistence of user data and conversation states of the bot, shared by every bot worker.
+
+    Changes are collected in memory and written every BOT_PERSISTENCE_INTERVAL seconds, all of them with a single
+    store call. Before an update is handled, state of its user is read back if another worker changed it since,
+    so updates of a chat can be handled by any worker; reads of concurrent updates share a single store call.
+    A chat moving to another worker sees its state as of the last write, so the interval has to stay shorter
+    than users take to answer. Changes stay pending until they are written, a failed write is retried by the next.
+
+    ConversationHandler has no public way to read or set the state of a single conversation, so refreshing one
+    goes through its internals. They are checked by the tests against the python-telegram-bot version pinned
+    in requirements.txt, update both together.
+    """
+
+    def __init__(self, store=None, update_interval: float = None):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval if update_interval is not None else
+            getattr(settings, 'BOT_PERSISTENCE_INTERVAL', 1),
+        )
+        self.store = store or import_string(getattr(settings, 'BOT_PERSISTENCE_STORE',
+                                                    'bot.persistence.DatabaseStore'))()
+        # Revisions of entries as this worker last read or wrote them
+        self._revisions = {}
+        self._pending = {}
+        self._write_task = None
+        self._prefetched_users = {}
+        self._reads = []
+        self._read_task = None
+        self._conversation_handlers = None
+
+    # Writes
+    def _queue(self, kind: str, key: str, value) -> None:
+        self._pending[(kind, key)] = None if value is None else dumps(value)
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.create_task(self._write_in_background())
+
+    async def _write_pending(self) -> None:
+        # Lets the rest of the changes of this persistence run queue up first
+        await asyncio.sleep(0)
+        # Changes queued while a write runs are written by the next round
+        while self._pending:
+            changes = dict(self._pending)
+            self._revisions.update(await run_in_sync_pool(self.store.save, changes))
+            # Written changes are dropped unless they were changed again in the meantime
+            for store_key, data in changes.items():
+                if store_key in self._pending and self._pending[store_key] == data:
+                    del self._pending[store_key]
+
+    async def _write_in_background(self) -> None:
+        try:
+            await self._write_pending()
+        except Exception:
+            logging.exception("Bot state couldn't be written, it's written again with the next change")
+
+    async def flush(self) -> None:
+        if self._write_task is not None and not self._write_task.done():
+            await asyncio.wait([self._write_task])
+        # Changes queued meanwhile wait for this write instead of starting one of their own
+        self._write_task = asyncio.create_task(self._write_pending())
+        await self._write_task
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._queue(USER_KIND, str(user_id), data)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._queue(USER_KIND, str(user_id), None)
+
+    async def update_conversation(self, name: str, key: tuple, new_state) -> None:
+        self._queue(CONVERSATION_KIND.format(name), json.dumps(key), new_state)
+
+    # Reads
+    async def _load(self, store_keys: list) -> dict:
+        future = asyncio.get_running_loop().create_future()
+        self._reads.append((store_keys, future))
+        if self._read_task is None or self._read_task.done():
+            self._read_task = asyncio.create_task(self._read_pending())
+        return await future
+
+    async def _read_pending(self) -> None:
+        # Reads of updates arriving while a read is running are made together by the next one
+        await asyncio.sleep(0)
+        while self._reads:
+            reads, self._reads = self._reads, []
+            try:
+                # A single indexed read, cheaper on the connection the async ORM keeps open than on a fresh one
+                stored = await sync_to_async(self.store.load)([key for store_keys, _ in reads for key in store_keys])
+            except Exception as exc:
+                for _, future in reads:
+                    future.set_exception(exc)
+                continue
+            for store_keys, future in reads:
+                future.set_result({key: stored[key] for key in store_keys if key in stored})
+
+    async def get_user_data(self) -> dict:
+        stored = await run_in_sync_pool(self.store.load_kind, USER_KIND)
+        self._revisions.update({(USER_KIND, key): revision for key, (revision, _) in stored.items()})
+        return {int(key): loads(data) for key, (_, data) in stored.items()}
+
+    async def get_conversations(self, name: str) -> dict:
+        kind = CONVERSATION_KIND.format(name)
+        stored = await run_in_sync_pool(self.store.load_kind, kind)
+        self._revisions.update({(kind, key): revision for key, (revision, _) in stored.items()})
+        return {tuple(json.loads(key)): loads(data) for key, (_, data) in stored.items()}
+
+    def _changed_elsewhere(self, store_key: tuple, stored) -> bool:
+        revision = stored[0] if stored else None
+        return revision != self._revisions.get(store_key) and store_key not in self._pending
+
+    async def refresh_for_update(self, update: Update, application: Application) -> None:
+        """Reads state of the user of an update and of their conversations, together with other updates in flight"""
+        if self._conversation_handlers is None:
+            self._conversation_handlers = list(_persistent_conversations(application))
+
+        keys = {}
+        for handler in self._conversation_handlers:
+            try:
+                key = handler._get_key(update)
+            except RuntimeError:
+                continue
+            keys[(CONVERSATION_KIND.format(handler.name), json.dumps(key))] = (handler, key)
+        user_id = update.effective_user.id if update.effective_user else None
+        store_keys = list(keys) + ([(USER_KIND, str(user_id))] if user_id is not None else [])
+
+        stored = await self._load(store_keys)
+        for store_key, (handler, key) in keys.items():
+            if self._changed_elsewhere(store_key, stored.get(store_key)):
+                if store_key in stored:
+                    handler._conversations.update_no_track({key: loads(stored[store_key][1])})
+                else:
+                    handler._conversations.pop(key, None)
+                self._revisions[store_key] = stored[store_key][0] if store_key in stored else None
+        if user_id is not None:
+            self._prefetched_users[user_id] = stored.get((USER_KIND, str(user_id)))
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        if user_id not in self._prefetched_users:
+            return
+        stored = self._prefetched_users.pop(user_id)
+        store_key = (USER_KIND, str(user_id))
+        if self._changed_elsewhere(store_key, stored):
+            user_data.clear()
+            if stored:
+                user_data.update(loads(stored[1]))
+            self._revisions[store_key] = stored[0] if stored else None
+
+    # Chat data, bot data and callback data are not used by the bot
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+
+def _persistent_conversations(application: Application):
+    # Conversations nested in others are found among the handlers of their parents
+    handlers = [handler for group in application.handlers.values() for handler in group]
+    while handlers:
+        handler = handlers.pop()
+        if isinstance(handler, ConversationHandler):
+            if handler.persistent:
+                yield handler
+            handlers.extend(handler.entry_points + handler.fallbacks)
+            handlers.extend(child for state_handlers in handler.states.values() for child in state_handlers)
+
+
+class SharedStateApplication(Application):
+    """Application reading state other workers may have changed before handling each update"""
+
+    async def process_update(self, update: object) -> None:
+        if isinstance(update, Update) and isinstance(self.persistence, DatabasePersistence):
+            await self.persistence.refresh_for_update(update, self)
+        await super().process_update(update)
@@ -0,0 +1,317 @@
+import asyncio
+import json
+import pickle
+import unittest
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.core.asgi import get_asgi_application
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from telegram.ext import (Application, CommandHandler, ConversationHandler,
+                          ExtBot, MessageHandler, filters)
+
+from bookings.models import Booking
+from bot.bot import Bot
+from bot.fake_telegram import (FAKE_BOT_TOKEN, FakeClock, FakeTelegramRequest,
+                               FakeTelegramServer, make_callback_update,
+                               make_message_update)
+from bot.handlers.show_rooms_handler import NEXT_PAGE, PREVIOUS_PAGE
+from bot.outbox import MAX_MESSAGE_LENGTH, SEPARATOR, OutboundScheduler
+from bot.persistence import (DatabasePersistence, _persistent_conversations,
+                             dumps, loads)
+from bot.webhook import TelegramWebhookApplication
+from RoomBooking.metrics import metrics
+from rooms.models import Room, RoomType, TelegramRoom
+from rooms.views import SortType
+from users.models import TelegramAuthorization, User
+from users.telegram_cache import telegram_user_cache
+
+django_application = get_asgi_application()
+
+
+@override_settings(BOT_WEBHOOK_SECRET='webhook-secret')
+class TelegramWebhookTestCase(TransactionTestCase):
+    # Update as Telegram posts it to the webhook
+    UPDATE = {
+        'update_id': 915038474,
+        'message': {
+            'message_id': 1204,
+            'from': {'id': 123456789, 'is_bot': False, 'first_name': 'Guest', 'language_code': 'en'},
+            'chat': {'id': 123456789, 'first_name': 'Guest', 'type': 'private'},
+            'date': 1711900000,
+            'text': '/start',
+            'entities': [{'offset': 0, 'length': 6, 'type': 'bot_command'}],
+        },
+    }
+
+    async def _post(self, app, body: bytes, secret: str = 'webhook-secret', path: str = '/telegram/webhook/'):
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': 'POST', 'path': path, 'query_string': b'',
+                 'headers': [(b'x-telegram-bot-api-secret-token', secret.encode())]}
+        await app(scope, receive, send)
+        return sent[0]['status']
+
+    async def test_posted_updates_are_handled(self):
+        request = FakeTelegramRequest()
+        app = TelegramWebhookApplication(django_application, bot=Bot(FAKE_BOT_TOKEN, request=request))
+        try:
+            self.assertEqual(await self._post(app, json.dumps(self.UPDATE).encode()), 200)
+            for _ in range(100):
+                if request.sent_messages:
+                    break
+                await asyncio.sleep(0.01)
+            self.assertEqual(list(request.sent_messages), [123456789])
+
+            self.assertEqual(await self._post(app, json.dumps(self.UPDATE).encode(), secret='wrong'), 403)
+            self.assertEqual(await self._post(app, b'not json'), 400)
+            self.assertEqual(await self._post(app, json.dumps({'update_id': 1, 'message': 'hi'}).encode()), 400)
+            self.assertEqual(await self._post(app, json.dumps({'update_id': 2, 'message': {'text': 'hi'}}).encode()),
+                             400)
+        finally:
+            await app.stop()
+
+
+class FlakyStore:
+    """Bot state store in memory whose first `failures` writes fail"""
+
+    def __init__(self, failures: int = 1):
+        self.failures = failures
+        self.saved = {}
+
+    def load_kind(self, kind: str) -> dict:
+        return {}
+
+    def load(self, keys: list) -> dict:
+        return {}
+
+    def save(self, changes: dict) -> dict:
+        if self.failures:
+            self.failures -= 1
+            raise OSError("Database went away")
+        self.saved.update(changes)
+        return {key: 1 for key in changes}
+
+
+class BotPersistenceTestCase(TransactionTestCase):
+    TELEGRAM_ID = 123456789
+
+    async def test_conversation_internals_are_still_there(self):
+        # States of single conversations are read and set through internals of python-telegram-bot, this fails
+        # when a new version changes them
+        async def callback(update, context):
+            pass
+
+        handler = ConversationHandler(entry_points=[CommandHandler('start', callback)],
+                                      states={1: [MessageHandler(filters.TEXT, callback)]}, fallbacks=[],
+                                      name='test', persistent=True)
+        application = (Application.builder().token(FAKE_BOT_TOKEN).request(FakeTelegramRequest())
+                       .persistence(DatabasePersistence(store=FlakyStore(failures=0))).build())
+        application.add_handler(handler)
+        await application.initialize()
+        try:
+            update = make_message_update(application.bot, 1, self.TELEGRAM_ID, 'Hello')
+            key = handler._get_key(update)
+            self.assertIsNone(handler.check_update(update))
+            handler._conversations.update_no_track({key: 1})
+            self.assertIsNotNone(handler.check_update(update))
+            handler._conversations.pop(key, None)
+            self.assertIsNone(handler.check_update(update))
+        finally:
+            await application.shutdown()
+
+        # Nested conversations are found as well
+        names = {handler.name for handler in _persistent_conversations(Bot(FAKE_BOT_TOKEN).application)}
+        self.assertTrue({'book_room', 'show_rooms', 'show_rooms_dates'} <= names)
+
+    async def test_failed_writes_are_written_again(self):
+        store = FlakyStore()
+        persistence = DatabasePersistence(store=store)
+        with self.assertLogs(level='ERROR'):
+            await persistence.update_user_data(self.TELEGRAM_ID, {'checkin_date': date(2030, 1, 1)})
+            await persistence.flush()
+        self.assertEqual(loads(store.saved['user', str(self.TELEGRAM_ID)]), {'checkin_date': date(2030, 1, 1)})
+
+        # Neither the background write nor the flush get through, the next flush does
+        store.failures = 2
+        with self.assertLogs(level='ERROR'), self.assertRaises(OSError):
+            await persistence.update_conversation('book_room', (self.TELEGRAM_ID, self.TELEGRAM_ID), 2)
+            await persistence.flush()
+        await persistence.flush()
+        self.assertEqual(store.saved['conversation:book_room', json.dumps([self.TELEGRAM_ID, self.TELEGRAM_ID])],
+                         '2')
+
+    def test_state_survives_serialization_compactly(self):
+        room_type = RoomType.objects.create(name='Single')
+        room = Room.objects.create(number=100, type=room_type, current_price=Decimal('1000.00'), capacity=1)
+        user_data = {'room': TelegramRoom(room), 'checkin_date': date(2030, 1, 1), 'sort_type': SortType.NONE,
+                     'min_cost': 10.5, 'buttons': {'Booking': 1}}
+
+        restored = loads(dumps(user_data))
+
+        self.assertEqual(vars(restored.pop('room')), vars(user_data.pop('room')))
+        self.assertEqual(restored, user_data)
+        self.assertLess(len(dumps({'room': TelegramRoom(room)})), len(pickle.dumps({'room': TelegramRoom(room)})))
+
+    async def test_workers_continue_each_others_conversations(self):
+        user = await User.objects.acreate(first_name='Test', last_name='User', username='test', email='test@test.com')
+        await TelegramAuthorization.objects.acreate(user=user, telegram_id=self.TELEGRAM_ID)
+        room_type = await RoomType.objects.acreate(name='Single')
+        await Room.objects.acreate(number=100, type=room_type, current_price=Decimal('1000.00'), capacity=1)
+        checkin_date = date.today() + timedelta(days=1)
+
+        requests = [FakeTelegramRequest(), FakeTelegramRequest()]
+        workers = [Bot(FAKE_BOT_TOKEN, request=request).application for request in requests]
+        for worker in workers:
+            await worker.initialize()
+        try:
+            messages = ['/book_room', 'Okay', '100', str(checkin_date), str(checkin_date + timedelta(days=2)), 'Yes']
+            for update_id, text in enumerate(messages, start=1):
+                # Every message lands on the other worker, which only knows what the first one has written
+                worker = workers[update_id % 2]
+                await worker.process_update(make_message_update(worker.bot, update_id, self.TELEGRAM_ID, text))
+                await worker.update_persistence()
+                await worker.persistence.flush()
+        finally:
+            for worker in workers:
+                await worker.shutdown()
+
+        self.assertIn("Room *№100* successfully booked", requests[0].sent_messages[self.TELEGRAM_ID][-1])
+        self.assertTrue(await Booking.objects.filter(room__number=100, user=user).aexists())
+
+
+class RoomPagesTestCase(TransactionTestCase):
+    TELEGRAM_ID = 123456789
+
+    async def test_found_rooms_are_browsed_page_by_page(self):
+        room_type = await RoomType.objects.acreate(name='Single')
+        for number in range(101, 113):
+            await Room.objects.acreate(number=number, type=room_type, current_price=Decimal('1000.00'), capacity=1)
+
+        request = FakeTelegramRequest()
+        application = Bot(FAKE_BOT_TOKEN, request=request,
+                          rate_limiter=OutboundScheduler(rate=0, chat_rate=0)).application
+        await application.initialize()
+        sent = request.sent_messages[self.TELEGRAM_ID]
+        update_ids = iter(range(1, 100))
+        try:
+            for text in ['/show_available_rooms', 'Okay', 'No', 'No', 'No', 'No', 'Show']:
+                await application.process_update(
+                    make_message_update(application.bot, next(update_ids), self.TELEGRAM_ID, text))
+            await application.bot.rate_limiter.flush()
+            self.assertEqual(sent[-2], "Found 12 available rooms")
+            self.assertTrue(sent[-1].startswith("Rooms 1-5 of 12:"))
+
+            async def press(button: str) -> str:
+                await application.process_update(
+                    make_callback_update(application.bot, next(update_ids), self.TELEGRAM_ID, button))
+                return sent[-1]
+
+            self.assertIn("Room №106", await press(NEXT_PAGE))
+            # Rooms gone from pages already seen don't shift the next ones
+            await Room.objects.filter(number=101).adelete()
+            page = await press(NEXT_PAGE)
+            self.assertTrue(page.startswith("Rooms 10-11 of 11:"))
+            self.assertIn("Room №111", page)
+            self.assertTrue((await press(PREVIOUS_PAGE)).startswith("Rooms 5-9 of 11:"))
+
+            # Other conversations, e.g. logging out, clear the search while its page is still shown
+            application.user_data[self.TELEGRAM_ID].clear()
+            self.assertTrue((await press(NEXT_PAGE)).startswith("This search is outdated"))
+        finally:
+            await application.shutdown()
+
+
+@override_settings(METRICS_SAMPLE_RATE=1)
+class BotMetricsTestCase(TransactionTestCase):
+    TELEGRAM_ID = 123456789
+
+    async def test_updates_are_measured_by_conversation_state(self):
+        telegram_user_cache.invalidate([self.TELEGRAM_ID])
+        metrics.clear()
+        request = FakeTelegramRequest()
+        application = Bot(FAKE_BOT_TOKEN, request=request,
+                          rate_limiter=OutboundScheduler(rate=0, chat_rate=0)).application
+        await application.initialize()
+        try:
+            for update_id, text in enumerate(['/start', '/book_room', 'Okay'], start=1):
+                await application.process_update(
+                    make_message_update(application.bot, update_id, self.TELEGRAM_ID, text))
+        finally:
+            await application.shutdown()
+
+        paths = {(path['kind'], path['path']): path for path in metrics.summary()}
+        self.assertEqual(set(paths), {('bot', 'start'), ('bot', 'book_room.book_room_start'),
+                                      ('bot', 'book_room.is_authorized_handle')})
+        # Looking up the telegram login goes to the database from a thread of the sync pool
+        self.assertGreaterEqual(paths['bot', 'book_room.is_authorized_handle']['db_queries_mean'], 1)
+
+
+class OutboundSchedulerTestCase(SimpleTestCase):
+    async def test_requests_stay_within_flood_limits(self):
+        # Time passes only when the scheduler waits, so the fake Bot API sees requests at the moment they are let
+        # through, one request more at once than the scheduler allows itself absorbs rounding of token counts
+        clock = FakeClock()
+        request = FakeTelegramRequest(rate=41, chat_rate=10, chat_burst=4, clock=clock)
+        bot = ExtBot(FAKE_BOT_TOKEN, request=request,
+                     rate_limiter=OutboundScheduler(rate=40, chat_rate=10, chat_burst=3, clock=clock,
+                                                    sleep=clock.sleep))
+        async with bot:
+            await asyncio.gather(*(bot.send_message(chat_id, 'Hello') for chat_id in range(1, 31)),
+                                 *(bot.send_message(1, f'Message {i}') for i in range(15)))
+
+        self.assertEqual(request.rejected, 0)
+        self.assertEqual(request.calls['sendMessage'], 45)
+        self.assertEqual(len(request.sent_messages[1]), 16)
+        # 16 messages to a chat at 10 a second after a burst of 3
+        self.assertGreaterEqual(clock.now, 1.3 - 1e-9)
+
+    async def test_flood_waits_are_retried(self):
+        server = FakeTelegramServer(FakeTelegramRequest(chat_rate=1))
+        await server.start()
+        scheduler = OutboundScheduler(rate=0, chat_rate=0)
+        bot = ExtBot(FAKE_BOT_TOKEN, request=server.request(connection_pool_size=4), rate_limiter=scheduler)
+        try:
+            async with bot:
+                await asyncio.gather(bot.send_message(1, 'First'), bot.send_message(1, 'Second'))
+        finally:
+            await server.stop()
+
+        self.assertEqual(server.api.rejected, 1)
+        self.assertEqual(scheduler.stats['retries'], 1)
+        self.assertEqual(sorted(server.api.sent_messages[1]), ['First', 'Second'])
+
+    async def test_queued_messages_are_joined(self):
+        request = FakeTelegramRequest()
+        scheduler = OutboundScheduler(rate=0, chat_rate=0)
+        bot = ExtBot(FAKE_BOT_TOKEN, request=request, rate_limiter=scheduler)
+        texts = [f"Room {i}: Double, 1000.00 per night, for 2 guests" for i in range(500)]
+        async with bot:
+            for text in texts:
+                scheduler.send_later(bot, 1, text)
+            await scheduler.flush()
+
+        sent = request.sent_messages[1]
+        self.assertLess(len(sent), 10)
+        self.assertTrue(all(len(text) <= MAX_MESSAGE_LENGTH for text in sent))
+        self.assertEqual(SEPARATOR.join(sent), SEPARATOR.join(texts))
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "Concurrent writes from many threads need PostgreSQL")
+class BotLoadTestCase(TransactionTestCase):
+    def test_concurrent_chats_get_through(self):
+        out, err = StringIO(), StringIO()
+        call_command('bot_load_test', chats=20, latency=0, stdout=out, stderr=err)
+
+        self.assertIn("20 chats booked a room, 20 canceled it", out.getvalue())
+        self.assertEqual(err.getvalue(), '')
+        self.assertFalse(Booking.objects.exists())
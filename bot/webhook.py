@@ -0,0 +1,110 @@
+import asyncio
+import json
+import logging
+import secrets
+
+from django.conf import settings
+
+from bot.bot import Bot
+
+# Telegram updates are a few kilobytes at most
+MAX_BODY_SIZE = 1024 * 1024
+SECRET_HEADER = b'x-telegram-bot-api-secret-token'
+
+
+class TelegramWebhookApplication:
+    """
+    ASGI application receiving Telegram updates on BOT_WEBHOOK_PATH and passing every other request to `app`.
+
+    Updates go to the update queue of the bot application running in the same event loop, which handles
+    up to BOT_CONCURRENT_UPDATES of them at once. Any number of workers can run behind a load balancer,
+    each of them with its own bot application.
+    """
+
+    def __init__(self, app, bot: Bot = None):
+        self.app = app
+        self.path = '/' + settings.BOT_WEBHOOK_PATH.strip('/') + '/'
+        self.secret_token = getattr(settings, 'BOT_WEBHOOK_SECRET', '')
+        self.bot = bot
+        self._started = False
+        self._start_lock = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http' and scope['path'] == self.path:
+            await self._webhook(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+    async def start(self) -> None:
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if not self._started:
+                if self.bot is None:
+                    self.bot = Bot(settings.BOT_TOKEN)
+                await self.bot.start_webhook()
+                self._started = True
+                logging.warning("Bot is receiving updates on %s", self.path)
+
+    async def stop(self) -> None:
+        if self._started:
+            await self.bot.stop_webhook()
+            self._started = False
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.start()
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _webhook(self, scope, receive, send):
+        if scope['method'] != 'POST':
+            return await self._respond(send, 405)
+
+        headers = dict(scope['headers'])
+        if self.secret_token and not secrets.compare_digest(headers.get(SECRET_HEADER, b''),
+                                                            self.secret_token.encode()):
+            return await self._respond(send, 403)
+
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if len(body) > MAX_BODY_SIZE:
+                return await self._respond(send, 413)
+            if not message.get('more_body'):
+                break
+
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return await self._respond(send, 400)
+        if not isinstance(data, dict) or 'update_id' not in data:
+            return await self._respond(send, 400)
+
+        # Servers without lifespan support never call start() themselves
+        await self.start()
+        # Answered right away, the update is handled in the background so Telegram doesn't have to wait
+        try:
+            await self.bot.process_webhook_update(data)
+        except Exception as e:
+            # Valid JSON that isn't an update makes de_json fail with whatever the malformed field leads to
+            logging.warning("Rejected malformed update: %r", e)
+            return await self._respond(send, 400)
+        await self._respond(send, 200)
+
+    @staticmethod
+    async def _respond(send, status: int):
+        await send({'type': 'http.response.start', 'status': status, 'headers': [(b'content-length', b'0')]})
+        await send({'type': 'http.response.body', 'body': b''})
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from rooms.models import Room, RoomType
+from rooms.models import RatePlan, Room, RoomType
 
 
 @admin.register(Room)
@@ -10,4 +10,10 @@ class RoomAdmin(admin.ModelAdmin):
     readonly_fields = ('id',)
 
 
+@admin.register(RatePlan)
+class RatePlanAdmin(admin.ModelAdmin):
+    list_display = ('name', 'room_type', 'start_date', 'end_date', 'weekdays', 'min_occupancy', 'multiplier')
+    list_filter = ('room_type',)
+
+
 admin.site.register(RoomType)
@@ -0,0 +1,78 @@
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+from rooms.models import Room, TelegramRoom
+
+# Changed when TelegramRoom gets new attributes, so rooms pickled by an older release aren't read
+CATALOG_CACHE_KEY = 'rooms:catalog:2'
+VERSION_CACHE_KEY = 'rooms:catalog:version'
+
+
+class RoomCatalog:
+    """
+    Read-through cache of every room with its type, price, capacity and description.
+
+    Served from process memory while the catalog version in the cache backend stays the same, then from the cache
+    backend and only then from the database. With a shared backend all processes share a single copy.
+    """
+
+    def __init__(self):
+        self._rooms = None
+        self._rooms_by_number = None
+        self._version = None
+        self._lock = threading.Lock()
+        self._stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'invalidations': 0}
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'ROOM_CATALOG_CACHE', 'default')]
+
+    def rooms(self) -> list:
+        """All rooms ordered by number"""
+        return self._load()[0]
+
+    def get_room(self, number: int):
+        """Room with given number or None"""
+        return self._load()[1].get(number)
+
+    def _load(self) -> tuple:
+        version = self.cache.get(VERSION_CACHE_KEY, 0)
+        with self._lock:
+            if self._rooms is not None and self._version == version:
+                self._stats['local_hits'] += 1
+                return self._rooms, self._rooms_by_number
+
+            rooms = self.cache.get(CATALOG_CACHE_KEY)
+            if rooms is not None and rooms[0] == version:
+                self._stats['shared_hits'] += 1
+                rooms = rooms[1]
+            else:
+                self._stats['misses'] += 1
+                rooms = [TelegramRoom(room) for room in
+                         Room.objects.select_related('type').only(*TelegramRoom.FIELDS).order_by('number')]
+                self.cache.set(CATALOG_CACHE_KEY, (version, rooms), timeout=None)
+
+            self._rooms = rooms
+            self._rooms_by_number = {room.number: room for room in rooms}
+            self._version = version
+            return self._rooms, self._rooms_by_number
+
+    def invalidate(self) -> None:
+        try:
+            self.cache.incr(VERSION_CACHE_KEY)
+        except ValueError:
+            self.cache.add(VERSION_CACHE_KEY, 0, timeout=None)
+            self.cache.incr(VERSION_CACHE_KEY)
+        self.cache.delete(CATALOG_CACHE_KEY)
+        with self._lock:
+            self._rooms = None
+            self._stats['invalidations'] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+
+room_catalog = RoomCatalog()
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.11 on 2026-10-18 20:40
+
+from decimal import Decimal
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0002_alter_room_description'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatePlan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=128)),
+                ('start_date', models.DateField(blank=True, null=True)),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('weekdays', models.CharField(blank=True, default='', help_text='Days of week it applies to, 0 for Monday to 6 for Sunday, e.g. 45 for Friday and Saturday. Empty for every day', max_length=7)),
+                ('min_occupancy', models.PositiveSmallIntegerField(default=0, help_text='Percent of rooms of the type taken', validators=[django.core.validators.MaxValueValidator(100)])),
+                ('multiplier', models.DecimalField(decimal_places=3, max_digits=6, validators=[django.core.validators.MinValueValidator(Decimal('0.001'))])),
+                ('room_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rate_plans', to='rooms.roomtype')),
+            ],
+        ),
+    ]
@@ -1,8 +1,9 @@
 from datetime import date
 from decimal import Decimal
 
-from django.core.validators import MinValueValidator
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import Exists, OuterRef
 
 
 class RoomType(models.Model):
@@ -12,6 +13,15 @@ class RoomType(models.Model):
         return self.name
 
 
+class RoomQuerySet(models.QuerySet):
+    def available_for(self, checkin_date: date, checkout_date: date) -> 'RoomQuerySet':
+        # Anti-join against nights taken within the stay, so the whole check is a single query
+        from bookings.models import RoomNight
+
+        taken_nights = RoomNight.objects.filter(room=OuterRef('pk'), night__gte=checkin_date, night__lt=checkout_date)
+        return self.filter(~Exists(taken_nights))
+
+
 class Room(models.Model):
     number = models.PositiveSmallIntegerField(null=False, blank=False, unique=True)
     type = models.ForeignKey(to=RoomType, on_delete=models.CASCADE)
@@ -19,34 +29,52 @@ class Room(models.Model):
     capacity = models.PositiveSmallIntegerField(null=False, blank=False, validators=[MinValueValidator(1)])
     description = models.TextField(null=True, blank=True)
 
+    objects = RoomQuerySet.as_manager()
+
     def __str__(self):
         return f"Room №{self.number} | Type: {self.type.name}"
 
     def is_room_available_for(self, checkin_date: date, checkout_date: date) -> bool:
-        from bookings.models import Booking
+        from bookings.models import RoomNight
 
-        def _find_intersection(c_in1: date, c_out1: date, c_in2: date, c_out2: date):
-            latest_start = max(c_in1, c_in2)
-            earliest_end = min(c_out1, c_out2)
+        return not RoomNight.objects.filter(room=self, night__gte=checkin_date, night__lt=checkout_date).exists()
 
-            if latest_start <= earliest_end:
-                intersection = (earliest_end - latest_start).days + 1
-                return intersection
-            else:
-                return 0
 
-        room_bookings = Booking.objects.filter(room=self)
-        if room_bookings.exists():
-            for booking in room_bookings:
-                if booking.status == Booking.BOOKED:
-                    if _find_intersection(checkin_date, checkout_date, booking.checkin_date, booking.checkout_date) > 1:
-                        return False
-        return True
+class RatePlan(models.Model):
+    """
+    Multiplies nightly prices of rooms of a type on the nights it applies to: between `start_date` and `end_date`
+    (both included) if given, on `weekdays` if given, and when at least `min_occupancy` percent of rooms of the type
+    are taken that night. Multipliers of every plan applying to a night are multiplied together.
+    """
+    room_type = models.ForeignKey(to=RoomType, on_delete=models.CASCADE, related_name='rate_plans')
+    name = models.CharField(max_length=128, null=False, blank=False)
+    start_date = models.DateField(null=True, blank=True)
+    end_date = models.DateField(null=True, blank=True)
+    weekdays = models.CharField(max_length=7, blank=True, default='',
+                                help_text="Days of week it applies to, 0 for Monday to 6 for Sunday, e.g. 45 for "
+                                          "Friday and Saturday. Empty for every day")
+    min_occupancy = models.PositiveSmallIntegerField(default=0, validators=[MaxValueValidator(100)],
+                                                     help_text="Percent of rooms of the type taken")
+    multiplier = models.DecimalField(decimal_places=3, max_digits=6, validators=[MinValueValidator(Decimal('0.001'))])
+
+    def __str__(self):
+        return f"{self.name} | Type: {self.room_type.name} | x{self.multiplier}"
+
+    def applies_to(self, night: date, occupancy: float) -> bool:
+        return ((self.start_date is None or self.start_date <= night)
+                and (self.end_date is None or night <= self.end_date)
+                and (not self.weekdays or str(night.weekday()) in self.weekdays)
+                and occupancy * 100 >= self.min_occupancy)
 
 
 class TelegramRoom:
+    # Fields read from a room, for only() projections of querysets that build TelegramRoom objects
+    FIELDS = ('number', 'type__name', 'current_price', 'capacity', 'description')
+
     def __init__(self, room):
+        self.id = room.id
         self.number = room.number
+        self.type_id = room.type_id
         self.type = room.type.name
         self.price = room.current_price
         self.capacity = room.capacity
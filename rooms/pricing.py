@@ -0,0 +1,205 @@
+import threading
+import time
+from datetime import date, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count
+
+from rooms.models import RatePlan, Room
+
+VERSION_CACHE_KEY = 'rooms:rates:version'
+OCCUPANCY_VERSION_CACHE_KEY = 'rooms:rates:occupancy-version'
+CENT = Decimal('0.01')
+
+
+def round_price(price: Decimal) -> Decimal:
+    """Rounds half a cent up like ROUND() of the database, so prices filtered by the database and stored agree"""
+    return price.quantize(CENT, ROUND_HALF_UP)
+
+
+class RateTable:
+    """
+    Price factors of the nights of a room type from `start` on, as prefix sums. The factor of a stay is the sum of
+    factors of its nights, so it takes a single subtraction whatever the length of the stay.
+
+    Tables of room types with occupancy based plans also keep the number of rooms of the type taken every night.
+    Bookings change those counts and factors of their nights in place, see RateTables.occupy.
+    """
+
+    def __init__(self, start: date, factors: list, plans: list = None, room_ids: frozenset = None,
+                 taken: list = None, occupancy_version: int = 0):
+        self.start = start
+        self.factors = list(factors)
+        self.plans = plans or []
+        self.room_ids = room_ids or frozenset()
+        self.taken = taken
+        self.occupancy_version = occupancy_version
+        self.built_at = time.monotonic()
+        self.prefix_sums = [Decimal(0)]
+        self._sum_from(0)
+
+    @property
+    def uses_occupancy(self) -> bool:
+        return self.taken is not None
+
+    @property
+    def end(self) -> date:
+        return self.start + timedelta(days=len(self.prefix_sums) - 1)
+
+    def covers(self, checkin_date: date, checkout_date: date) -> bool:
+        return self.start <= checkin_date and checkout_date <= self.end
+
+    def stay_factor(self, checkin_date: date, checkout_date: date) -> Decimal:
+        prefix_sums = self.prefix_sums
+        return prefix_sums[(checkout_date - self.start).days] - prefix_sums[(checkin_date - self.start).days]
+
+    def _sum_from(self, first: int) -> None:
+        # Swapped in whole, so stay factors read meanwhile come from either the old sums or the new ones
+        prefix_sums = self.prefix_sums[:first + 1]
+        for factor in self.factors[first:]:
+            prefix_sums.append(prefix_sums[-1] + factor)
+        self.prefix_sums = prefix_sums
+
+    def change_taken(self, checkin_date: date, checkout_date: date, rooms: int) -> None:
+        """Adds `rooms` to rooms taken on the nights of a stay and prices those nights again"""
+        first = max((checkin_date - self.start).days, 0)
+        last = min((checkout_date - self.start).days, len(self.factors))
+        if first >= last:
+            return
+        for i in range(first, last):
+            self.taken[i] += rooms
+            self.factors[i] = get_night_factor(self.plans, self.start + timedelta(days=i),
+                                               self.taken[i] / len(self.room_ids))
+        self._sum_from(first)
+
+
+def get_night_factor(plans: list, night: date, occupancy: float) -> Decimal:
+    factor = Decimal(1)
+    for plan in plans:
+        if plan.applies_to(night, occupancy):
+            factor *= plan.multiplier
+    return factor
+
+
+def build_rate_table(room_type_id: int, start: date, end: date, occupancy_version: int = 0) -> RateTable:
+    """Rate table of nights from `start` to `end` (not included) out of rate plans of the room type"""
+    from bookings.models import RoomNight
+
+    plans = [plan for plan in RatePlan.objects.filter(room_type_id=room_type_id)
+             if (plan.start_date is None or plan.start_date < end)
+             and (plan.end_date is None or plan.end_date >= start)]
+    nights = [start + timedelta(days=i) for i in range((end - start).days)]
+
+    if not any(plan.min_occupancy for plan in plans):
+        return RateTable(start, [get_night_factor(plans, night, 0.0) for night in nights], plans)
+
+    room_ids = frozenset(Room.objects.filter(type_id=room_type_id).values_list('id', flat=True))
+    taken_nights = dict(RoomNight.objects.filter(room__type_id=room_type_id, night__gte=start, night__lt=end)
+                        .values('night').annotate(taken=Count('id')).values_list('night', 'taken'))
+    taken = [taken_nights.get(night, 0) for night in nights]
+    factors = [get_night_factor(plans, night, count / len(room_ids) if count else 0.0)
+               for night, count in zip(nights, taken)]
+    return RateTable(start, factors, plans, room_ids, taken, occupancy_version)
+
+
+class RateTables:
+    """
+    Rate tables of room types for PRICING_HORIZON_DAYS from today, built on first use.
+
+    Served from process memory while versions in the cache backend stay the same. Rate plan and room edits change
+    one version and drop every table. Bookings update rooms taken in tables of room types with occupancy based
+    plans of this process as they are committed, and change the other version, so other processes build those
+    tables again. They are built again every AVAILABILITY_CALENDAR_TTL seconds as well, in case a change got lost.
+    Stays outside of the horizon get a table of their own, which isn't kept.
+    """
+
+    def __init__(self):
+        self._tables = {}
+        self._version = None
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'ROOM_CATALOG_CACHE', 'default')]
+
+    def _is_current(self, table: RateTable, today: date, occupancy_version: int) -> bool:
+        if table.start != today:
+            return False
+        if not table.uses_occupancy:
+            return True
+        return (table.occupancy_version == occupancy_version
+                and time.monotonic() - table.built_at <= getattr(settings, 'AVAILABILITY_CALENDAR_TTL', 60))
+
+    def stay_factor(self, room_type_id: int, checkin_date: date, checkout_date: date) -> Decimal:
+        """Sum of price factors of the nights of a stay, the number of nights when no rate plan applies"""
+        versions = self.cache.get_many([VERSION_CACHE_KEY, OCCUPANCY_VERSION_CACHE_KEY])
+        version = versions.get(VERSION_CACHE_KEY, 0)
+        occupancy_version = versions.get(OCCUPANCY_VERSION_CACHE_KEY, 0)
+        today = date.today()
+        with self._lock:
+            if self._version != version:
+                self._tables.clear()
+                self._version = version
+            table = self._tables.get(room_type_id)
+        if (table is not None and table.covers(checkin_date, checkout_date)
+                and self._is_current(table, today, occupancy_version)):
+            return table.stay_factor(checkin_date, checkout_date)
+
+        end = today + timedelta(days=getattr(settings, 'PRICING_HORIZON_DAYS', 730))
+        if checkin_date < today or checkout_date > end:
+            return build_rate_table(room_type_id, checkin_date, checkout_date).stay_factor(checkin_date, checkout_date)
+        table = build_rate_table(room_type_id, today, end, occupancy_version)
+        with self._lock:
+            # Not kept if rates changed while it was built
+            if self._version == version:
+                self._tables[room_type_id] = table
+        return table.stay_factor(checkin_date, checkout_date)
+
+    def stay_price(self, room_type_id: int, nightly_price: Decimal, checkin_date: date,
+                   checkout_date: date) -> Decimal:
+        """Price of a stay in a room of the type whose undiscounted price of a night is `nightly_price`"""
+        return round_price(nightly_price * self.stay_factor(room_type_id, checkin_date, checkout_date))
+
+    def stay_factors(self, room_type_ids, checkin_date: date, checkout_date: date) -> dict:
+        """Stay factors of several room types by room type id"""
+        return {room_type_id: self.stay_factor(room_type_id, checkin_date, checkout_date)
+                for room_type_id in room_type_ids}
+
+    def _change_taken(self, room_id: int, checkin_date: date, checkout_date: date, rooms: int) -> None:
+        with self._lock:
+            for table in self._tables.values():
+                if room_id in table.room_ids:
+                    table.change_taken(checkin_date, checkout_date, rooms)
+
+    def occupy(self, room_id: int, checkin_date: date, checkout_date: date) -> None:
+        self._change_taken(room_id, checkin_date, checkout_date, 1)
+
+    def release(self, room_id: int, checkin_date: date, checkout_date: date) -> None:
+        self._change_taken(room_id, checkin_date, checkout_date, -1)
+
+    def bump_version(self) -> None:
+        # Tables of other processes with occupancy based plans are built again, as long as they share a cache
+        # backend with this one
+        occupancy_version = self._incr(OCCUPANCY_VERSION_CACHE_KEY)
+        with self._lock:
+            # Changes of this process are applied already, only changes of others in between need a new table
+            for table in self._tables.values():
+                if table.uses_occupancy and table.occupancy_version == occupancy_version - 1:
+                    table.occupancy_version = occupancy_version
+
+    def invalidate(self) -> None:
+        self._incr(VERSION_CACHE_KEY)
+        with self._lock:
+            self._tables.clear()
+
+    def _incr(self, key: str) -> int:
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            self.cache.add(key, 0, timeout=None)
+            return self.cache.incr(key)
+
+
+rate_tables = RateTables()
@@ -0,0 +1,90 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+
+
+def normalize_number(value):
+    # 1000, 1000.0 and '1000.00' are the same filter
+    if value is None or value == '':
+        return None
+    try:
+        return Decimal(str(value)).normalize()
+    except InvalidOperation:
+        return value
+
+
+class SearchCache:
+    """
+    Short lived cache of room search results keyed by normalized filters.
+
+    Results of searches with dates are dropped as soon as a booking on overlapping dates is created, canceled or
+    changed, all results are dropped when rooms change. Identical searches arriving while one of them is being
+    computed wait for its result instead of computing it again.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(source: str, checkin_date, checkout_date, min_cost, max_cost, min_capacity, sort) -> tuple:
+        return (source, checkin_date, checkout_date, normalize_number(min_cost), normalize_number(max_cost),
+                normalize_number(min_capacity), sort)
+
+    def get_or_compute(self, key: tuple, compute):
+        ttl = getattr(settings, 'SEARCH_CACHE_TTL', 30)
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > time.monotonic():
+                    return entry[1]
+                event = self._in_flight.get(key)
+                if event is None:
+                    event = self._in_flight[key] = threading.Event()
+                    break
+            # Somebody is computing the same search, take their result. If they failed, try computing it here
+            event.wait(timeout=ttl)
+
+        try:
+            result = compute()
+            with self._lock:
+                # Not stored if an overlapping booking came in while computing
+                if self._in_flight.get(key) is event:
+                    self._store(key, result, ttl)
+            return result
+        finally:
+            with self._lock:
+                if self._in_flight.get(key) is event:
+                    del self._in_flight[key]
+            event.set()
+
+    def _store(self, key: tuple, result, ttl: int) -> None:
+        self._entries[key] = (time.monotonic() + ttl, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > getattr(settings, 'SEARCH_CACHE_MAX_ENTRIES', 1000):
+            self._entries.popitem(last=False)
+
+    def invalidate_dates(self, checkin_date: date, checkout_date: date) -> None:
+        """Drops results of searches for stays sharing a night with the given one"""
+        def overlaps(key):
+            return key[1] is not None and key[2] is not None and key[1] < checkout_date and key[2] > checkin_date
+
+        with self._lock:
+            for key in [key for key in self._entries if overlaps(key)]:
+                del self._entries[key]
+            # Searches being computed right now may have read the old bookings
+            for key in [key for key in self._in_flight if overlaps(key)]:
+                del self._in_flight[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._in_flight.clear()
+
+
+search_cache = SearchCache()
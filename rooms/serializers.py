@@ -1,18 +1,27 @@
 from rest_framework import serializers
 
 from bookings.models import Booking
+from RoomBooking.metrics import TimedSerializerMixin
 from rooms.models import Room, RoomType
 
+# Rooms a single bulk booking may lock and book in one transaction, counted across room numbers and room types
+MAX_BULK_ROOMS = 200
 
-class RoomSerializer(serializers.ModelSerializer):
+
+class RoomSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     type = serializers.SlugRelatedField(slug_field='name', queryset=RoomType.objects.all())
 
     class Meta:
         model = Room
         fields = ('id', 'number', 'type', 'current_price', 'capacity', 'description')
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        # Type name is read for every room, load it with the room instead of one query per room
+        return queryset.select_related('type')
+
 
-class BookingSerializer(serializers.ModelSerializer):
+class BookingSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     room = RoomSerializer()
     status = serializers.ChoiceField(choices=Booking.STATUSES, source='get_status_display', read_only=True)
 
@@ -20,3 +29,36 @@ class BookingSerializer(serializers.ModelSerializer):
         model = Booking
         fields = ('id', 'room', 'checkin_date', 'checkout_date', 'booking_date', 'status',)
         read_only_fields = ('booking_date',)
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        # Joins room and its type in, leaving out booking fields that are never serialized
+        return queryset.select_related('room__type').only(
+            'checkin_date', 'checkout_date', 'booking_date', 'status',
+            *(f'room__{field}' for field in RoomSerializer.Meta.fields), 'room__type__name',
+        )
+
+
+class RoomTypeQuantitySerializer(serializers.Serializer):
+    type = serializers.CharField()
+    quantity = serializers.IntegerField(min_value=1, max_value=MAX_BULK_ROOMS)
+
+
+class BulkBookingSerializer(serializers.Serializer):
+    checkin_date = serializers.DateField(input_formats=['%d-%m-%Y'])
+    checkout_date = serializers.DateField(input_formats=['%d-%m-%Y'])
+    rooms = serializers.ListField(child=serializers.IntegerField(), max_length=MAX_BULK_ROOMS, required=False,
+                                  default=list)
+    room_types = RoomTypeQuantitySerializer(many=True, required=False, default=list)
+    partial = serializers.BooleanField(default=False)
+
+    def validate(self, attrs):
+        if not attrs['rooms'] and not attrs['room_types']:
+            raise serializers.ValidationError("Give room numbers, room type quantities or both.")
+        quantities = {}
+        for room_type in attrs['room_types']:
+            quantities[room_type['type']] = quantities.get(room_type['type'], 0) + room_type['quantity']
+        if len(set(attrs['rooms'])) + sum(quantities.values()) > MAX_BULK_ROOMS:
+            raise serializers.ValidationError(f"Can't book more than {MAX_BULK_ROOMS} rooms at once.")
+        attrs['room_types'] = quantities
+        return attrs
@@ -0,0 +1,28 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from rooms.catalog import room_catalog
+from rooms.models import RatePlan, Room, RoomType
+from rooms.pricing import rate_tables
+from rooms.search_cache import search_cache
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+@receiver(post_save, sender=RoomType)
+@receiver(post_delete, sender=RoomType)
+def invalidate_room_catalog(sender, **kwargs):
+    # Right away for this transaction, and once more after commit so nobody keeps a copy read before it
+    for invalidate in (room_catalog.invalidate, rate_tables.invalidate, search_cache.clear):
+        invalidate()
+        transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=RatePlan)
+@receiver(post_delete, sender=RatePlan)
+def invalidate_rates(sender, **kwargs):
+    # Searches filtered by price of the stay are dropped as well
+    for invalidate in (rate_tables.invalidate, search_cache.clear):
+        invalidate()
+        transaction.on_commit(invalidate)
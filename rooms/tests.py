@@ -0,0 +1,269 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.http import Http404
+from django.test import TestCase
+
+from bookings.calendar import availability_calendar
+from bookings.models import Booking
+from bookings.views import cancel_user_booking
+from RoomBooking.testing import QueryBudgetMixin
+from rooms.catalog import room_catalog
+from rooms.models import RatePlan, Room, RoomType
+from rooms.pricing import OCCUPANCY_VERSION_CACHE_KEY, rate_tables
+from rooms.search_cache import SearchCache
+from rooms.views import (SortType, get_available_rooms,
+                         get_available_rooms_page, get_room_by_number,
+                         room_sort_key)
+from users.models import TelegramUser, User
+
+
+class RoomAvailabilityTestCase(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        user = User.objects.create(first_name='Test', last_name='User', username='test', email='test@test.com')
+        room_type = RoomType.objects.create(name='Double')
+        self.free_room = Room.objects.create(number=100, type=room_type, current_price=Decimal('1000.00'), capacity=2)
+        self.booked_room = Room.objects.create(number=101, type=room_type, current_price=Decimal('2000.00'),
+                                               capacity=3)
+        self.checkin_date = date.today() + timedelta(days=5)
+        self.checkout_date = self.checkin_date + timedelta(days=2)
+        availability_calendar.load()
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(user=user, room=self.booked_room, checkin_date=self.checkin_date,
+                                   checkout_date=self.checkout_date, price=Decimal('1.00'))
+
+    def test_is_room_available_for_runs_single_query(self):
+        with self.assertNumQueries(1):
+            self.assertFalse(self.booked_room.is_room_available_for(self.checkin_date, self.checkout_date))
+        self.assertTrue(self.free_room.is_room_available_for(self.checkin_date, self.checkout_date))
+        self.assertTrue(self.booked_room.is_room_available_for(self.checkout_date,
+                                                               self.checkout_date + timedelta(days=1)))
+
+    def test_get_available_rooms_filters_by_dates(self):
+        rooms = get_available_rooms(self.checkin_date, self.checkout_date, None, None, None, SortType.NONE.value)
+        self.assertEqual([room.number for room in rooms], [100])
+
+        rooms = get_available_rooms(None, None, None, None, None, SortType.COST_DESCENDING.value)
+        self.assertEqual([room.number for room in rooms], [101, 100])
+
+    def test_bot_searches_stay_within_query_budget(self):
+        get_available_rooms(None, None, None, None, None, SortType.NONE.value)
+        with self.assertMaxQueries(0):
+            rooms = get_available_rooms(self.checkin_date, self.checkout_date, None, None, None, SortType.NONE.value)
+            [str(room) for room in rooms]
+        with self.assertMaxQueries(0):
+            self.assertEqual(get_room_by_number(101).type, 'Double')
+
+
+class RoomPagesTestCase(TestCase):
+    def setUp(self):
+        room_type = RoomType.objects.create(name='Single')
+        for number, price in zip(range(100, 107), ('500', '700', '500', '900', '700', '500', '300')):
+            Room.objects.create(number=number, type=room_type, current_price=Decimal(price), capacity=1)
+
+    def test_pages_follow_sort_order(self):
+        sort_type = SortType.COST_DESCENDING.value
+        expected = [room.number for room in get_available_rooms(None, None, None, None, None, sort_type)]
+        self.assertEqual(expected, [103, 101, 104, 100, 102, 105, 106])
+
+        numbers, after = [], None
+        while True:
+            rooms, start, total = get_available_rooms_page(None, None, None, None, None, sort_type, after=after,
+                                                           page_size=3)
+            if not rooms:
+                break
+            self.assertEqual((start, total), (len(numbers), 7))
+            numbers += [room.number for room in rooms]
+            after = room_sort_key(rooms[-1], sort_type)
+        self.assertEqual(numbers, expected)
+
+        rooms, start, _ = get_available_rooms_page(None, None, None, None, None, sort_type, page_size=3,
+                                                   before=room_sort_key(get_room_by_number(102), sort_type))
+        self.assertEqual(([room.number for room in rooms], start), ([101, 104, 100], 1))
+
+
+class RoomCatalogTestCase(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.room_type = RoomType.objects.create(name='Single')
+        self.room = Room.objects.create(number=100, type=self.room_type, current_price=Decimal('1000.00'), capacity=1)
+
+    def test_catalog_is_read_through_and_invalidated_on_edits(self):
+        self.assertEqual(get_room_by_number(100).price, Decimal('1000.00'))
+        hits = room_catalog.stats()['local_hits']
+        with self.assertMaxQueries(0):
+            self.assertEqual(get_room_by_number(100).type, 'Single')
+        self.assertEqual(room_catalog.stats()['local_hits'], hits + 1)
+
+        self.room.current_price = Decimal('1500.00')
+        self.room.save()
+        self.assertEqual(get_room_by_number(100).price, Decimal('1500.00'))
+
+        self.room_type.name = 'Suite'
+        self.room_type.save()
+        self.assertEqual(get_room_by_number(100).type, 'Suite')
+
+        self.room.delete()
+        with self.assertRaises(Http404):
+            get_room_by_number(100)
+
+
+class SearchCacheTestCase(TestCase):
+    def setUp(self):
+        self.cache = SearchCache()
+        self.checkin_date = date.today() + timedelta(days=5)
+        self.checkout_date = self.checkin_date + timedelta(days=2)
+
+    def test_keys_are_normalized(self):
+        self.assertEqual(SearchCache.make_key('bot', self.checkin_date, self.checkout_date, 1000, '1000.00', None, 0),
+                         SearchCache.make_key('bot', self.checkin_date, self.checkout_date, 1000.0, 1000, '', 0))
+
+    def test_concurrent_identical_searches_are_computed_once(self):
+        key = SearchCache.make_key('bot', self.checkin_date, self.checkout_date, None, None, None, 0)
+        calls = []
+        computing = threading.Event()
+
+        def compute():
+            calls.append(1)
+            computing.set()
+            time.sleep(0.2)
+            return ['result']
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            first = executor.submit(self.cache.get_or_compute, key, compute)
+            computing.wait()
+            others = [executor.submit(self.cache.get_or_compute, key, compute) for _ in range(7)]
+            results = [first.result()] + [future.result() for future in others]
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [['result']] * 8)
+
+    def test_overlapping_dates_are_invalidated(self):
+        key = SearchCache.make_key('bot', self.checkin_date, self.checkout_date, None, None, None, 0)
+        undated_key = SearchCache.make_key('bot', None, None, None, None, None, 0)
+        self.cache.get_or_compute(key, lambda: 1)
+        self.cache.get_or_compute(undated_key, lambda: 1)
+
+        self.cache.invalidate_dates(self.checkout_date, self.checkout_date + timedelta(days=1))
+        self.assertEqual(self.cache.get_or_compute(key, lambda: 2), 1)
+
+        self.cache.invalidate_dates(self.checkout_date - timedelta(days=1), self.checkout_date)
+        self.assertEqual(self.cache.get_or_compute(key, lambda: 2), 2)
+        self.assertEqual(self.cache.get_or_compute(undated_key, lambda: 2), 1)
+
+
+class RatePlanTestCase(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create(first_name='Test', last_name='User', username='test', email='test@test.com')
+        self.room_type = RoomType.objects.create(name='Double')
+        self.room = Room.objects.create(number=100, type=self.room_type, current_price=Decimal('1000.00'), capacity=2)
+        self.other_room = Room.objects.create(number=101, type=self.room_type, current_price=Decimal('1000.00'),
+                                              capacity=2)
+        # Monday to Monday, a week from now at the earliest
+        self.checkin_date = date.today() + timedelta(days=7 - date.today().weekday() + 7)
+        self.checkout_date = self.checkin_date + timedelta(days=7)
+        RatePlan.objects.create(room_type=self.room_type, name='Weekend', weekdays='45', multiplier=Decimal('1.5'))
+        availability_calendar.load()
+
+    def test_stay_price_sums_rates_of_its_nights(self):
+        # Friday and Saturday nights cost 1.5 times more
+        self.assertEqual(rate_tables.stay_price(self.room_type.id, Decimal('1000.00'), self.checkin_date,
+                                                self.checkout_date), Decimal('8000.00'))
+        with self.assertMaxQueries(0):
+            self.assertEqual(rate_tables.stay_factor(self.room_type.id, self.checkin_date,
+                                                     self.checkin_date + timedelta(days=4)), Decimal('4'))
+
+        RatePlan.objects.create(room_type=self.room_type, name='Season', start_date=self.checkin_date,
+                                end_date=self.checkin_date, multiplier=Decimal('2'))
+        self.assertEqual(rate_tables.stay_price(self.room_type.id, Decimal('1000.00'), self.checkin_date,
+                                                self.checkout_date), Decimal('9000.00'))
+
+        # Stays past the cached table are priced as well
+        far_checkin_date = self.checkin_date + timedelta(weeks=200)
+        self.assertEqual(rate_tables.stay_price(self.room_type.id, Decimal('1000.00'), far_checkin_date,
+                                                far_checkin_date + timedelta(days=7)), Decimal('8000.00'))
+
+    def test_bookings_are_priced_with_rates(self):
+        booking = Booking.objects.create(user=self.user, room=self.room, checkin_date=self.checkin_date,
+                                         checkout_date=self.checkout_date)
+        self.assertEqual(booking.price, Decimal('8000.00'))
+
+    def test_canceling_and_editing_keep_the_agreed_price(self):
+        booking = Booking.objects.create(user=self.user, room=self.room, checkin_date=self.checkin_date,
+                                         checkout_date=self.checkout_date)
+        RatePlan.objects.create(room_type=self.room_type, name='Season', multiplier=Decimal('2'))
+
+        booking.save()
+        self.assertEqual(booking.price, Decimal('8000.00'))
+        cancel_user_booking(TelegramUser(self.user), booking.id)
+        booking.refresh_from_db()
+        self.assertEqual((booking.status, booking.price), (Booking.CANCELED, Decimal('8000.00')))
+
+        # A stay moved to other dates is a new deal
+        booking.status = Booking.BOOKED
+        booking.checkout_date -= timedelta(days=1)
+        booking.save()
+        self.assertEqual(booking.price, Decimal('14000.00'))
+
+    def test_half_cents_are_rounded_up_everywhere(self):
+        RatePlan.objects.create(room_type=self.room_type, name='Half', start_date=self.checkin_date,
+                                end_date=self.checkin_date, multiplier=Decimal('0.5'))
+        self.room.current_price = Decimal('1000.05')
+        self.room.save()
+        checkout_date = self.checkin_date + timedelta(days=1)
+
+        booking = Booking.objects.create(user=self.user, room=self.room, checkin_date=self.checkin_date,
+                                         checkout_date=checkout_date)
+        self.assertEqual(booking.price, Decimal('500.03'))
+        booking.delete()
+        params = {'checkin': self.checkin_date.isoformat(), 'checkout': checkout_date.isoformat()}
+        response = self.client.get('/api/rooms/', {**params, 'min_price': '500.03', 'max_price': '500.03'})
+        self.assertEqual([room['number'] for room in response.json()['results']], [100])
+        rooms = get_available_rooms(self.checkin_date, checkout_date, 500.025, 500.035, None, SortType.NONE.value)
+        self.assertEqual([room.number for room in rooms], [100])
+
+    def test_occupancy_rates_follow_bookings(self):
+        RatePlan.objects.create(room_type=self.room_type, name='Busy', min_occupancy=50, multiplier=Decimal('1.2'))
+        self.assertEqual(rate_tables.stay_price(self.room_type.id, Decimal('1000.00'), self.checkin_date,
+                                                self.checkin_date + timedelta(days=1)), Decimal('1000.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = Booking.objects.create(user=self.user, room=self.room, checkin_date=self.checkin_date,
+                                             checkout_date=self.checkin_date + timedelta(days=1))
+        # Rooms taken are counted in the table as bookings are made, it isn't built again
+        with self.assertMaxQueries(0):
+            self.assertEqual(rate_tables.stay_price(self.room_type.id, Decimal('1000.00'), self.checkin_date,
+                                                    self.checkin_date + timedelta(days=2)), Decimal('2200.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cancel_user_booking(TelegramUser(self.user), booking.id)
+        with self.assertMaxQueries(0):
+            self.assertEqual(rate_tables.stay_price(self.room_type.id, Decimal('1000.00'), self.checkin_date,
+                                                    self.checkin_date + timedelta(days=2)), Decimal('2000.00'))
+
+        # Bookings of other processes only change the version, tables are built again
+        Booking.objects.create(user=self.user, room=self.other_room, checkin_date=self.checkin_date,
+                               checkout_date=self.checkin_date + timedelta(days=1))
+        rate_tables._incr(OCCUPANCY_VERSION_CACHE_KEY)
+        self.assertEqual(rate_tables.stay_price(self.room_type.id, Decimal('1000.00'), self.checkin_date,
+                                                self.checkin_date + timedelta(days=1)), Decimal('1200.00'))
+
+    def test_price_filters_use_stay_price(self):
+        params = {'checkin': self.checkin_date.isoformat(), 'checkout': self.checkout_date.isoformat()}
+        self.room.current_price = Decimal('1100.00')
+        self.room.save()
+
+        response = self.client.get('/api/rooms/', {**params, 'max_price': '8000'})
+        self.assertEqual([room['number'] for room in response.json()['results']], [101])
+        response = self.client.get('/api/rooms/', {**params, 'min_price': '8000.01'})
+        self.assertEqual([room['number'] for room in response.json()['results']], [100])
+        # Without dates prices of a night are compared
+        response = self.client.get('/api/rooms/', {'max_price': '1000'})
+        self.assertEqual([room['number'] for room in response.json()['results']], [101])
+
+        rooms = get_available_rooms(self.checkin_date, self.checkout_date, None, 8000, None, SortType.NONE.value)
+        self.assertEqual([room.number for room in rooms], [101])
+        rooms = get_available_rooms(None, None, None, 1000, None, SortType.NONE.value)
+        self.assertEqual([room.number for room in rooms], [101])
@@ -1,12 +1,16 @@
 from datetime import date
 from enum import Enum
 
+from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db.models import Q
-from django.shortcuts import get_object_or_404
+from django.http import Http404
 
-from bookings.views import is_room_available_for
-from rooms.models import Room, TelegramRoom
+from bookings.calendar import get_occupied_room_ids
+from RoomBooking.sync_pool import run_in_sync_pool
+from rooms.catalog import room_catalog
+from rooms.models import TelegramRoom
+from rooms.pricing import rate_tables, round_price
+from rooms.search_cache import search_cache
 
 
 class SortType(Enum):
@@ -21,26 +25,92 @@ def get_available_rooms(checkin_date: date, checkout_date: date, min_cost: float
                         sort_type: int) -> list:
     # Validate args
     _validate_args(checkin_date, checkout_date, min_cost, max_cost, min_capacity, sort_type)
-    rooms_list = Room.objects.all()
 
-    # Filter queryset by cost
-    if min_cost is not None:
-        rooms_list = rooms_list.filter(Q(current_price__gte=min_cost))
-    if max_cost is not None:
-        rooms_list = rooms_list.filter(Q(current_price__lte=max_cost))
+    return list(_get_cached_search(checkin_date, checkout_date, min_cost, max_cost, min_capacity, sort_type))
+
+
+def get_available_rooms_page(checkin_date: date, checkout_date: date, min_cost: float, max_cost: float,
+                             min_capacity: int, sort_type: int, after: tuple = None, before: tuple = None,
+                             page_size: int = None) -> tuple:
+    """
+    A page of available rooms as (rooms, index of the first one, number of all found rooms).
+
+    Pages are keyset paginated: `after` is the sort key (see room_sort_key) of the last room of the page before,
+    `before` the one of the first room of the page after, so rooms booked in between don't shift pages.
+    """
+    _validate_args(checkin_date, checkout_date, min_cost, max_cost, min_capacity, sort_type)
+    page_size = page_size or getattr(settings, 'BOT_ROOMS_PAGE_SIZE', 5)
+    rooms = _get_cached_search(checkin_date, checkout_date, min_cost, max_cost, min_capacity, sort_type)
+
+    if before is not None:
+        end = _bisect(rooms, sort_type, tuple(before), inclusive=False)
+        start = max(end - page_size, 0)
+    else:
+        start = _bisect(rooms, sort_type, tuple(after), inclusive=True) if after is not None else 0
+        end = start + page_size
+    return rooms[start:end], start, len(rooms)
+
+
+def room_sort_key(room: TelegramRoom, sort_type: int) -> tuple:
+    """Position of a room in search results sorted by given sort type"""
+    sort_type = SortType(sort_type)
+    if sort_type == SortType.COST_ASCENDING:
+        return room.price, room.number
+    if sort_type == SortType.COST_DESCENDING:
+        return -room.price, room.number
+    if sort_type == SortType.CAPACITY_ASCENDING:
+        return room.capacity, room.number
+    if sort_type == SortType.CAPACITY_DESCENDING:
+        return -room.capacity, room.number
+    return (room.number,)
+
+
+def _bisect(rooms: list, sort_type: int, key: tuple, inclusive: bool) -> int:
+    # Index of the first room past the key, or of the first room at or past it when not inclusive
+    low, high = 0, len(rooms)
+    while low < high:
+        middle = (low + high) // 2
+        room_key = room_sort_key(rooms[middle], sort_type)
+        if room_key < key or inclusive and room_key == key:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def _get_cached_search(checkin_date: date, checkout_date: date, min_cost: float, max_cost: float,
+                       min_capacity: int, sort_type: int) -> list:
+    # Shared with other searches, must not be changed
+    key = search_cache.make_key('bot', checkin_date, checkout_date, min_cost, max_cost, min_capacity, sort_type)
+    return search_cache.get_or_compute(
+        key, lambda: _search_rooms(checkin_date, checkout_date, min_cost, max_cost, min_capacity, sort_type)
+    )
+
+
+def _search_rooms(checkin_date: date, checkout_date: date, min_cost: float, max_cost: float, min_capacity: int,
+                  sort_type: int) -> list:
+    lst = room_catalog.rooms()
+
+    # Filter list by cost of a night, or of the whole stay with rates of its nights when dates are given
+    if min_cost is not None or max_cost is not None:
+        if checkin_date is not None and checkout_date is not None:
+            factors = rate_tables.stay_factors({room.type_id for room in lst}, checkin_date, checkout_date)
+            costs = {room.id: round_price(room.price * factors[room.type_id]) for room in lst}
+        else:
+            costs = {room.id: room.price for room in lst}
+        if min_cost is not None:
+            lst = [room for room in lst if costs[room.id] >= min_cost]
+        if max_cost is not None:
+            lst = [room for room in lst if costs[room.id] <= max_cost]
 
     # Filter by capacity
     if min_capacity is not None:
-        rooms_list = rooms_list.filter(Q(capacity__gte=min_capacity))
+        lst = [room for room in lst if room.capacity >= min_capacity]
 
-    # Filter by dates and create return list
-    lst = []
-    for room in rooms_list:
-        if checkin_date is not None and checkout_date is not None:
-            if not is_room_available_for(room, checkin_date, checkout_date):
-                continue
-        tg_room = TelegramRoom(room)
-        lst.append(tg_room)
+    # Filter by dates
+    if checkin_date is not None and checkout_date is not None:
+        occupied_room_ids = get_occupied_room_ids(checkin_date, checkout_date)
+        lst = [room for room in lst if room.id not in occupied_room_ids]
 
     # Sort return list by given sort type
     sorted_lst = _sort_rooms(lst, SortType(sort_type))
@@ -70,20 +140,32 @@ def _validate_args(checkin_date: date, checkout_date: date, min_cost: float, max
 
 
 def _sort_rooms(lst: list, sort_type: SortType) -> list:
-    # Sort return list by given sort type
-    if sort_type == SortType.COST_ASCENDING:
-        lst = sorted(lst, key=lambda x: x.price)
-    elif sort_type == SortType.COST_DESCENDING:
-        lst = sorted(lst, key=lambda x: x.price, reverse=True)
-    elif sort_type == SortType.CAPACITY_ASCENDING:
-        lst = sorted(lst, key=lambda x: x.capacity)
-    elif sort_type == SortType.CAPACITY_DESCENDING:
-        lst = sorted(lst, key=lambda x: x.capacity, reverse=True)
-    return lst
+    # Sort return list by given sort type, rooms of the same cost or capacity by number
+    return sorted(lst, key=lambda room: room_sort_key(room, sort_type.value))
 
 
 def get_room_by_number(room_number: int) -> TelegramRoom:
     # Retrieves a room by its number.
-    room = get_object_or_404(Room, number=room_number)
-    tg_room = TelegramRoom(room)
+    tg_room = room_catalog.get_room(room_number)
+    if tg_room is None:
+        raise Http404("No Room matches the given query.")
     return tg_room
+
+
+# Async counterparts for the telegram bot. Searches are served from in-process caches guarded by locks,
+# so they run in the sync pool instead of blocking the event loop
+async def aget_available_rooms(checkin_date: date, checkout_date: date, min_cost: float, max_cost: float,
+                               min_capacity: int, sort_type: int) -> list:
+    return await run_in_sync_pool(get_available_rooms, checkin_date, checkout_date, min_cost, max_cost,
+                                  min_capacity, sort_type)
+
+
+async def aget_available_rooms_page(checkin_date: date, checkout_date: date, min_cost: float, max_cost: float,
+                                    min_capacity: int, sort_type: int, after: tuple = None,
+                                    before: tuple = None) -> tuple:
+    return await run_in_sync_pool(get_available_rooms_page, checkin_date, checkout_date, min_cost, max_cost,
+                                  min_capacity, sort_type, after, before)
+
+
+async def aget_room_by_number(room_number: int) -> TelegramRoom:
+    return await run_in_sync_pool(get_room_by_number, room_number)
@@ -25,6 +25,9 @@ class TelegramAuthorization(models.Model):
 
 
 class TelegramUser:
+    # Fields read from a user, for only() projections of querysets that build TelegramUser objects
+    FIELDS = ('username', 'first_name', 'last_name', 'email', 'is_superuser', 'last_login')
+
     def __init__(self, user: User):
         self.username = user.username
         self.first_name = user.first_name
@@ -0,0 +1,45 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from users.models import TelegramAuthorization, TelegramUser, User
+from users.telegram_cache import telegram_user_cache
+
+# Fields of cached telegram users whose changes drop them. last_login changes with every login to the site,
+# nothing in the bot reads it, cached users keep the one they were read with
+CACHED_FIELDS = tuple(field for field in TelegramUser.FIELDS if field != 'last_login')
+
+
+def _get_cached_fields(user: User) -> tuple:
+    # Read straight from __dict__, so deferred fields are not loaded just for this
+    return tuple(user.__dict__.get(field) for field in CACHED_FIELDS)
+
+
+def _invalidate(telegram_ids) -> None:
+    # Right away for this transaction, and once more after commit so nobody keeps a copy read before it
+    telegram_user_cache.invalidate(telegram_ids)
+    transaction.on_commit(lambda: telegram_user_cache.invalidate(telegram_ids))
+
+
+@receiver(post_save, sender=TelegramAuthorization)
+@receiver(post_delete, sender=TelegramAuthorization)
+def invalidate_telegram_authorization(sender, instance, **kwargs):
+    # Covers logging in, logging out and deleting a user, authorizations are deleted together with their user
+    _invalidate([instance.telegram_id])
+
+
+@receiver(post_init, sender=User)
+def remember_cached_fields(sender, instance, **kwargs):
+    instance._cached_fields = _get_cached_fields(instance)
+
+
+@receiver(post_save, sender=User)
+def invalidate_telegram_user(sender, instance, created, update_fields=None, **kwargs):
+    cached_fields = _get_cached_fields(instance)
+    changed = cached_fields != instance._cached_fields
+    instance._cached_fields = cached_fields
+    if created or not changed or (update_fields is not None and not set(update_fields) & set(CACHED_FIELDS)):
+        return
+    telegram_ids = list(TelegramAuthorization.objects.filter(user=instance).values_list('telegram_id', flat=True))
+    if telegram_ids:
+        _invalidate(telegram_ids)
@@ -0,0 +1,89 @@
+import threading
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+from users.models import TelegramAuthorization, TelegramUser
+from validators import validate_telegram_id
+
+ENTRY_CACHE_KEY = 'users:telegram:{}'
+VERSION_CACHE_KEY = 'users:telegram:{}:version'
+
+# Returned by a lookup that has to go to the database, None is a cached "not logged in"
+_MISS = object()
+
+
+class TelegramUserCache:
+    """
+    Cache of telegram id -> logged in user, None for telegram accounts that are not logged in, kept in the
+    TELEGRAM_USER_CACHE backend for TELEGRAM_USER_CACHE_TTL seconds.
+
+    Every telegram id has a version of its own. Logging in, logging out and changes of a logged in user bump versions
+    of the telegram ids concerned, so their entries are read from the database again by every process sharing that
+    backend, while entries of everybody else stay. A lookup reads the entry and its version in a single round trip.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'TELEGRAM_USER_CACHE', 'default')]
+
+    def get(self, telegram_id: int) -> Optional[TelegramUser]:
+        validate_telegram_id(telegram_id)
+        keys = self._get_keys(telegram_id)
+        version, user = self._lookup(self.cache.get_many(keys), keys)
+        if user is _MISS:
+            authorization = TelegramAuthorization.objects.select_related('user').filter(telegram_id=telegram_id)
+            user = self._to_user(authorization.first())
+            self.cache.set(keys[0], (version, user), timeout=getattr(settings, 'TELEGRAM_USER_CACHE_TTL', 300))
+        return user
+
+    async def aget(self, telegram_id: int) -> Optional[TelegramUser]:
+        validate_telegram_id(telegram_id)
+        keys = self._get_keys(telegram_id)
+        version, user = self._lookup(await self.cache.aget_many(keys), keys)
+        if user is _MISS:
+            authorization = TelegramAuthorization.objects.select_related('user').filter(telegram_id=telegram_id)
+            user = self._to_user(await authorization.afirst())
+            await self.cache.aset(keys[0], (version, user), timeout=getattr(settings, 'TELEGRAM_USER_CACHE_TTL', 300))
+        return user
+
+    @staticmethod
+    def _get_keys(telegram_id: int) -> list:
+        return [ENTRY_CACHE_KEY.format(telegram_id), VERSION_CACHE_KEY.format(telegram_id)]
+
+    @staticmethod
+    def _to_user(authorization) -> Optional[TelegramUser]:
+        return TelegramUser(authorization.user) if authorization is not None else None
+
+    def _lookup(self, values: dict, keys: list) -> tuple:
+        # An entry stored by a lookup that read the database before the last invalidation has an older version
+        version = values.get(keys[1], 0)
+        entry = values.get(keys[0])
+        hit = entry is not None and entry[0] == version
+        with self._lock:
+            self._stats['hits' if hit else 'misses'] += 1
+        return version, entry[1] if hit else _MISS
+
+    def invalidate(self, telegram_ids) -> None:
+        for telegram_id in telegram_ids:
+            key = VERSION_CACHE_KEY.format(telegram_id)
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                self.cache.add(key, 0, timeout=None)
+                self.cache.incr(key)
+        self.cache.delete_many([ENTRY_CACHE_KEY.format(telegram_id) for telegram_id in telegram_ids])
+        with self._lock:
+            self._stats['invalidations'] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+
+telegram_user_cache = TelegramUserCache()
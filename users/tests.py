@@ -0,0 +1,107 @@
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+
+from users.models import TelegramAuthorization, User
+from users.telegram_cache import TelegramUserCache, telegram_user_cache
+from users.views import (aget_user_by_telegram_id, ais_authorized,
+                         ais_username_unique, alogin_with_telegram,
+                         alogout_with_telegram, get_user_by_telegram_id,
+                         is_authorized, logout_with_telegram)
+
+
+class AsyncTelegramServicesTestCase(TransactionTestCase):
+    TELEGRAM_ID = 123456789
+
+    def setUp(self):
+        # Tables are flushed between tests without any signals, so nothing else drops cached logins
+        telegram_user_cache.invalidate([self.TELEGRAM_ID])
+        User.objects.create(first_name='Test', last_name='User', username='test', email='test@test.com',
+                            password=make_password('secret-password'))
+
+    async def test_login_and_logout(self):
+        self.assertFalse(await ais_authorized(self.TELEGRAM_ID))
+        with self.assertRaisesMessage(ValidationError, "Passwords do not match."):
+            await alogin_with_telegram(self.TELEGRAM_ID, 'test', 'wrong-password')
+        with self.assertRaisesMessage(ValidationError, "username does not exist"):
+            await alogin_with_telegram(self.TELEGRAM_ID, 'nobody', 'secret-password')
+
+        await alogin_with_telegram(self.TELEGRAM_ID, 'test', 'secret-password')
+        self.assertTrue(await ais_authorized(self.TELEGRAM_ID))
+        self.assertEqual((await aget_user_by_telegram_id(self.TELEGRAM_ID)).username, 'test')
+        self.assertFalse(await ais_username_unique('test'))
+        with self.assertRaisesMessage(ValidationError, "already logged in"):
+            await alogin_with_telegram(self.TELEGRAM_ID, 'test', 'secret-password')
+
+        await alogout_with_telegram(self.TELEGRAM_ID)
+        self.assertFalse(await TelegramAuthorization.objects.filter(telegram_id=self.TELEGRAM_ID).aexists())
+        with self.assertRaisesMessage(ValidationError, "not logged in"):
+            await aget_user_by_telegram_id(self.TELEGRAM_ID)
+
+
+class TelegramUserCacheTestCase(TransactionTestCase):
+    TELEGRAM_ID = 123456789
+
+    def setUp(self):
+        telegram_user_cache.invalidate([self.TELEGRAM_ID, self.TELEGRAM_ID + 1])
+        self.user = User.objects.create(first_name='Test', last_name='User', username='test', email='test@test.com')
+
+    def test_lookups_are_cached_until_logins_change(self):
+        self.assertFalse(is_authorized(self.TELEGRAM_ID))
+        with self.assertNumQueries(0):
+            self.assertFalse(is_authorized(self.TELEGRAM_ID))
+
+        TelegramAuthorization.objects.create(user=self.user, telegram_id=self.TELEGRAM_ID)
+        self.assertEqual(get_user_by_telegram_id(self.TELEGRAM_ID).username, 'test')
+        with self.assertNumQueries(0):
+            self.assertTrue(is_authorized(self.TELEGRAM_ID))
+            self.assertEqual(get_user_by_telegram_id(self.TELEGRAM_ID).username, 'test')
+
+        self.user.username = 'renamed'
+        self.user.save()
+        self.assertEqual(get_user_by_telegram_id(self.TELEGRAM_ID).username, 'renamed')
+
+        self.user.delete()
+        self.assertFalse(is_authorized(self.TELEGRAM_ID))
+
+    def test_logins_only_drop_their_own_lookups(self):
+        other_user = User.objects.create(first_name='Other', last_name='User', username='other',
+                                         email='other@test.com')
+        TelegramAuthorization.objects.create(user=other_user, telegram_id=self.TELEGRAM_ID + 1)
+        self.assertTrue(is_authorized(self.TELEGRAM_ID + 1))
+
+        TelegramAuthorization.objects.create(user=self.user, telegram_id=self.TELEGRAM_ID)
+        with self.assertNumQueries(0):
+            self.assertTrue(is_authorized(self.TELEGRAM_ID + 1))
+
+        # Saving a user without changing what the bot reads keeps lookups, only the updates themselves are run
+        self.user = User.objects.get(pk=self.user.pk)
+        self.assertTrue(is_authorized(self.TELEGRAM_ID))
+        with self.assertNumQueries(2):
+            self.user.last_login = timezone.now()
+            self.user.save(update_fields=['last_login'])
+            self.user.save()
+            self.assertTrue(is_authorized(self.TELEGRAM_ID))
+
+    def test_other_workers_see_logouts(self):
+        worker = TelegramUserCache()
+        TelegramAuthorization.objects.create(user=self.user, telegram_id=self.TELEGRAM_ID)
+        self.assertEqual(worker.get(self.TELEGRAM_ID).username, 'test')
+        with self.assertNumQueries(0):
+            worker.get(self.TELEGRAM_ID)
+
+        logout_with_telegram(self.TELEGRAM_ID)
+        self.assertIsNone(worker.get(self.TELEGRAM_ID))
+
+    async def test_async_lookups_share_entries(self):
+        await TelegramAuthorization.objects.acreate(user=self.user, telegram_id=self.TELEGRAM_ID)
+        self.assertEqual((await telegram_user_cache.aget(self.TELEGRAM_ID)).username, 'test')
+        hits = telegram_user_cache.stats()['hits']
+        self.assertEqual((await telegram_user_cache.aget(self.TELEGRAM_ID)).username, 'test')
+        self.assertEqual(telegram_user_cache.stats()['hits'], hits + 1)
+
+        with override_settings(TELEGRAM_USER_CACHE_TTL=0):
+            telegram_user_cache.invalidate([self.TELEGRAM_ID])
+            await telegram_user_cache.aget(self.TELEGRAM_ID)
+            self.assertEqual(telegram_user_cache.stats()['hits'], hits + 1)
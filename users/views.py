@@ -3,7 +3,9 @@ from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
 from django.core.validators import validate_email
 
+from RoomBooking.sync_pool import run_in_sync_pool
 from users.models import TelegramAuthorization, TelegramUser, User
+from users.telegram_cache import telegram_user_cache
 from validators import validate_telegram_id, validate_username
 
 
@@ -81,20 +83,74 @@ def logout_with_telegram(telegram_id: int) -> None:
 
 
 def get_user_by_telegram_id(telegram_id: int) -> TelegramUser:
-    # Validate telegram id
-    validate_telegram_id(telegram_id)
-
     # Checks if user with given telegram id logged in
-    if not TelegramAuthorization.objects.filter(telegram_id=telegram_id).exists():
+    tg_user = telegram_user_cache.get(telegram_id)
+    if tg_user is None:
         raise ValidationError("User with given telegram id is not logged in.")
-
-    user = TelegramAuthorization.objects.get(telegram_id=telegram_id).user
-    tg_user = TelegramUser(user)
     return tg_user
 
 
 def is_authorized(telegram_id: int) -> bool:
+    return telegram_user_cache.get(telegram_id) is not None
+
+
+# Async counterparts for the telegram bot. Single queries go through the async ORM,
+# password hashing and whatever else blocks goes to the sync pool
+async def aregister(first_name: str, last_name: str, username: str, email: str, password: str) -> None:
+    await run_in_sync_pool(register, first_name, last_name, username, email, password)
+
+
+async def ais_username_unique(username: str) -> bool:
+    return not await User.objects.filter(username=username).aexists()
+
+
+async def ais_email_unique(email: str) -> bool:
+    return not await User.objects.filter(email=email).aexists()
+
+
+async def alogin_with_telegram(telegram_id: int, username: str, password: str) -> None:
+    # User already logged in with this telegram acc
+    if await TelegramAuthorization.objects.filter(telegram_id=telegram_id).aexists():
+        raise ValidationError("Telegram user already logged in.")
+
+    # Checks if user with given username exists
+    try:
+        user = await User.objects.aget(username=username)
+    except User.DoesNotExist:
+        raise ValidationError(f"User with '{username}' username does not exist.")
+
     # Validate telegram id
     validate_telegram_id(telegram_id)
 
-    return TelegramAuthorization.objects.filter(telegram_id=telegram_id).exists()
+    # Checks if given password matches hash in DB
+    if not await run_in_sync_pool(check_password, password, user.password):
+        raise ValidationError("Passwords do not match.")
+
+    # Creates link with telegram account and user
+    await TelegramAuthorization.objects.acreate(user=user, telegram_id=telegram_id)
+
+
+async def alogout_with_telegram(telegram_id: int) -> None:
+    # Validate telegram id
+    validate_telegram_id(telegram_id)
+
+    # Checks if user with given telegram id logged in
+    try:
+        authorization = await TelegramAuthorization.objects.aget(telegram_id=telegram_id)
+    except TelegramAuthorization.DoesNotExist:
+        raise ValidationError("User with given telegram id is not logged in.")
+
+    # Deletes telegram-user link
+    await authorization.adelete()
+
+
+async def aget_user_by_telegram_id(telegram_id: int) -> TelegramUser:
+    # Checks if user with given telegram id logged in
+    tg_user = await telegram_user_cache.aget(telegram_id)
+    if tg_user is None:
+        raise ValidationError("User with given telegram id is not logged in.")
+    return tg_user
+
+
+async def ais_authorized(telegram_id: int) -> bool:
+    return await telegram_user_cache.aget(telegram_id) is not None